@@ -1,13 +1,20 @@
 import os
+from logging import Logger
+from typing import Optional
 
 from dotenv import load_dotenv
+from telebot import TeleBot, apihelper
 
 from .bot import setup_bot, launch_bot
+from .bot.supervisor import setup_supervisor, poll_updates, install_signal_handlers, set_webhook
+from .bot.local_api import api_urls
 from .bot.api import setup_google_sheet_api, setup_google_maps_api
+from .bot.pricing import setup_quote_engine
 from .config import load_config
-from .db import setup_session_maker
+from .config.models import Config
+from .db import setup_session_maker, setup_order_writer
 from .logger import setup_logger
-from .webhook import setup_app, Application
+from .webhook import setup_app, Application, UpdateQueue
 
 load_dotenv()
 
@@ -17,38 +24,103 @@ def webhook_app() -> Application:
     use_env_vars = os.environ.get('CONFIG_USE_ENV_VARS', 'false').lower() in ('1', 'true', 'True', 'TRUE')
     config_env_mapping_path = os.environ.get('CONFIG_ENV_MAPPING_PATH', 'config_env_mapping.toml')
     cfg = load_config(config_path, use_env_vars, config_env_mapping_path)
-
     bot_logger = setup_logger(cfg.bot.logger)
-    bot_ = setup_bot(cfg.bot, cfg.messages, cfg.buttons, bot_logger)
 
-    app = setup_app(cfg.bot.webhook.path)
-    app.ctx.bot = bot_
+    db_logger = setup_logger(cfg.db.logger)
+    db_session_maker = setup_session_maker()
+
+    google_sheet_api = setup_google_sheet_api(cfg.google_sheet_api, db_session_maker, db_logger)
+    google_maps_api = setup_google_maps_api(os.environ.get("GOOGLE_MAPS_API_KEY"))
+    quote_engine = setup_quote_engine(google_sheet_api, google_maps_api)
+
+    # the quoting API is only served with a token, as every quote spends the Google Maps quota
+    app = setup_app(cfg.bot.webhook.path, cfg.bot.webhook.quote_path if cfg.bot.webhook.quote_token else None)
     app.ctx.secret_token = cfg.bot.webhook.secret_token
     app.ctx.logger = setup_logger(cfg.logger)
+    app.ctx.quote_engine = quote_engine
+    app.ctx.quote_token = cfg.bot.webhook.quote_token
+    if cfg.bot.processes:
+        # the bot runs on the worker processes only, this one routes the updates to them
+        supervisor = setup_supervisor(cfg.bot, setup_worker_bot,
+                                      (config_path, use_env_vars, config_env_mapping_path, cfg.bot.token),
+                                      bot_logger)
+        install_signal_handlers(supervisor)
+        if cfg.bot.telegram_api_url:
+            # the webhook is set on the Bot API server the workers send through
+            apihelper.API_URL, apihelper.FILE_URL = api_urls(cfg.bot.telegram_api_url)
+        app.ctx.bot = None
+        app.ctx.update_queue = supervisor
+        set_webhook(cfg.bot.token, cfg.bot.drop_pending, cfg.bot.allowed_updates, cfg.bot.webhook)
+        return app
+
+    order_writer = setup_order_writer(cfg.db, db_session_maker, db_logger)
+    # the handlers run on the workers of the update queue
+    bot_ = setup_bot(cfg.bot, db_session_maker, db_logger, order_writer, google_sheet_api, google_maps_api,
+                     quote_engine, cfg.messages, cfg.buttons, bot_logger, threaded=False)
+    app.ctx.bot = bot_
+    app.ctx.update_queue = UpdateQueue(bot_, cfg.bot.webhook.queue_size, cfg.bot.webhook.workers, bot_logger)
 
     launch_bot(bot_, cfg.bot.drop_pending, True, cfg.bot.allowed_updates, cfg.bot.webhook)
     return app
 
 
-def main():
-    config_path = os.environ.get('CONFIG_PATH', 'config.toml')
-    use_env_vars = os.environ.get('CONFIG_USE_ENV_VARS', 'false').lower() in ('1', 'true', 'True', 'TRUE')
-    config_env_mapping_path = os.environ.get('CONFIG_ENV_MAPPING_PATH', 'config_env_mapping.toml')
-
-    bot_token = os.environ.get('TOKEN')
+def setup_worker_bot(config_path: str, use_env_vars: bool, config_env_mapping_path: str,
+                     bot_token: Optional[str]) -> tuple[TeleBot, Logger]:
+    """
+    Sets up the bot of a worker process, which loads the config on its own.
+    """
     cfg = load_config(config_path, use_env_vars, config_env_mapping_path)
     cfg.bot.token = bot_token
+    # the worker runs the handlers of an update before taking the next one, so the updates of a chat keep their order
+    # and an update is counted as processed once handled, which the supervisor waits for before moving the chats
+    cfg.bot.async_runtime = None
+    cfg.bot.dispatcher = None
+    return _setup_bot(cfg, threaded=False)
+
+
+def _setup_bot(cfg: Config, threaded: bool = True) -> tuple[TeleBot, Logger]:
     bot_logger = setup_logger(cfg.bot.logger)
 
     db_logger = setup_logger(cfg.db.logger)
     db_session_maker = setup_session_maker()
+    order_writer = setup_order_writer(cfg.db, db_session_maker, db_logger)
 
     google_sheet_api = setup_google_sheet_api(cfg.google_sheet_api, db_session_maker, db_logger)
     google_maps_api = setup_google_maps_api(os.environ.get("GOOGLE_MAPS_API_KEY"))
+    quote_engine = setup_quote_engine(google_sheet_api, google_maps_api)
+
+    bot_ = setup_bot(cfg.bot, db_session_maker, db_logger, order_writer, google_sheet_api, google_maps_api,
+                     quote_engine, cfg.messages, cfg.buttons, bot_logger, threaded=threaded)
+    return bot_, bot_logger
 
-    bot_ = setup_bot(cfg.bot, db_session_maker, db_logger, google_sheet_api, google_maps_api, cfg.messages, cfg.buttons,
-                     bot_logger)
 
+def main():
+    config_path = os.environ.get('CONFIG_PATH', 'config.toml')
+    use_env_vars = os.environ.get('CONFIG_USE_ENV_VARS', 'false').lower() in ('1', 'true', 'True', 'TRUE')
+    config_env_mapping_path = os.environ.get('CONFIG_ENV_MAPPING_PATH', 'config_env_mapping.toml')
+
+    bot_token = os.environ.get('TOKEN')
+    cfg = load_config(config_path, use_env_vars, config_env_mapping_path)
+    cfg.bot.token = bot_token
+
+    if cfg.bot.processes:
+        # this process only polls and routes the updates, the workers set up the bot on their own
+        supervisor = setup_supervisor(cfg.bot, setup_worker_bot,
+                                      (config_path, use_env_vars, config_env_mapping_path, bot_token),
+                                      setup_logger(cfg.logger))
+        if cfg.bot.telegram_api_url:
+            # the updates are polled from the Bot API server the workers send through
+            apihelper.API_URL, apihelper.FILE_URL = api_urls(cfg.bot.telegram_api_url)
+        supervisor.start()
+        try:
+            poll_updates(supervisor, bot_token, cfg.bot.drop_pending, cfg.bot.allowed_updates, supervisor.logger)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            supervisor.stop()
+        return
+
+    bot_, _ = _setup_bot(cfg)
     launch_bot(bot_, cfg.bot.drop_pending, False, cfg.bot.allowed_updates, cfg.bot.webhook)
 
 
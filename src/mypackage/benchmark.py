@@ -0,0 +1,336 @@
+import json
+import pickle
+import random
+import statistics
+import sys
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from telebot import TeleBot, apihelper
+from telebot.types import Update
+
+from . import money
+from .bot import templates, texts
+from .bot.cache import TimestampStore
+from .bot.callback_router import CallbackRouter
+from .bot.filters import CallbackDataPrefixFilter
+from .bot.local_api import api_urls
+from .bot.sessions import SessionCodec
+from .bot.transport import BotApiTransport
+from .cli import define_benchmark_arg_parser, define_callback_benchmark_arg_parser, \
+    define_template_benchmark_arg_parser, define_codec_benchmark_arg_parser, define_antiflood_benchmark_arg_parser
+from .db.dto import (
+    OrderDTO, UserDTO, UserDiscountDTO, ProducerDTO, DispatchPointDTO, UserLocationDTO, DistanceDTO, ConcreteDTO
+)
+
+BENCHMARK_TOKEN = '1:benchmark'
+
+
+class FakeBotApiHandler(BaseHTTPRequestHandler):
+    """
+    Answers every Bot API method with a successful result after the round trip latency of the server.
+    """
+    protocol_version = 'HTTP/1.1'  # keeps the connections alive as the Bot API does
+    disable_nagle_algorithm = True  # the headers and the body are written apart
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        method_name = urlsplit(self.path).path.rsplit('/', 1)[-1]
+        if method_name in ('sendMessage', 'editMessageText'):
+            result = {'message_id': 1, 'date': int(time.time()), 'chat': {'id': 1, 'type': 'private'}, 'text': ''}
+        else:
+            result = True
+        body = json.dumps({'ok': True, 'result': result}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_bot_api(latency: float) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotApiHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, name='fake_bot_api', daemon=True).start()
+    return server
+
+
+def measure(bot: TeleBot, calls: int, concurrency: int) -> tuple[list[float], float]:
+    """
+    Sends the messages from the threads and returns the duration of each call and the total one in seconds.
+    """
+    def call(_):
+        started_at = time.perf_counter()
+        bot.send_message(1, 'benchmark')
+        return time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        durations = list(executor.map(call, range(calls)))
+    return durations, time.perf_counter() - started_at
+
+
+def main():
+    """
+    Measures the per call latency of the bot against a fake Bot API answering after each of the given round trips,
+    e.g. 0 ms for a Local Bot API Server and 50 ms for api.telegram.org.
+    """
+    args = define_benchmark_arg_parser().parse_args()
+
+    results = []
+    for latency_ms in args.latencies:
+        server = start_fake_bot_api(latency_ms / 1000)
+        try:
+            apihelper.API_URL, apihelper.FILE_URL = api_urls(f"http://127.0.0.1:{server.server_port}")
+            bot = TeleBot(BENCHMARK_TOKEN)
+            transport = BotApiTransport(pool_size=args.concurrency)
+            transport.install(bot)
+            measure(bot, args.concurrency, args.concurrency)  # warms up the connections
+            durations, total = measure(bot, args.calls, args.concurrency)
+            transport.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        durations.sort()
+        results.append((latency_ms, statistics.mean(durations)))
+        print(f"{latency_ms:>8.1f} ms round trip: "
+              f"mean {statistics.mean(durations) * 1000:.2f} ms, "
+              f"p50 {durations[len(durations) // 2] * 1000:.2f} ms, "
+              f"p95 {durations[int(len(durations) * 0.95)] * 1000:.2f} ms, "
+              f"p99 {durations[int(len(durations) * 0.99)] * 1000:.2f} ms, "
+              f"{args.calls / total:.0f} calls/s")
+
+    fastest_latency, fastest_mean = min(results, key=lambda result: result[1])
+    for latency_ms, mean in results:
+        if latency_ms != fastest_latency:
+            print(f"{fastest_latency:.1f} ms vs {latency_ms:.1f} ms round trip saves "
+                  f"{(mean - fastest_mean) * 1000:.2f} ms per call")
+
+
+def callback_prefixes(count: int) -> list[str]:
+    """
+    Returns the prefixes in the order the prefix filters need, a nested one before the one it starts with.
+    """
+    prefixes = []
+    for i in range(count // 2):
+        prefixes += [f"item{i}_back", f"item{i}_"]
+    return prefixes
+
+
+def callback_update(update_id: int, data: str) -> Update:
+    return Update.de_json({
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id), 'chat_instance': '1', 'data': data,
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'benchmark'},
+        },
+    })
+
+
+def measure_callbacks(bot: TeleBot, updates: list[Update]) -> float:
+    """
+    Passes the callbacks to the bot one by one and returns the average time to handle one in seconds.
+    """
+    started_at = time.perf_counter()
+    for update in updates:
+        bot.process_new_updates([update])
+    return (time.perf_counter() - started_at) / len(updates)
+
+
+def callbacks_main():
+    """
+    Measures the time to route a callback query to its handler by the prefix filters of the handlers
+    tested in turn and by the trie of the CallbackRouter, for the given numbers of the registered prefixes.
+    """
+    args = define_callback_benchmark_arg_parser().parse_args()
+
+    def handler(call, bot):
+        handled.append(call.data)
+
+    for count in args.prefixes:
+        prefixes = callback_prefixes(count)
+        updates = [callback_update(i, f"{random.choice(prefixes)}{i}") for i in range(args.calls)]
+
+        # threaded=False handles the callbacks on the calling thread, so only the routing is measured
+        filters_bot = TeleBot(BENCHMARK_TOKEN, threaded=False, use_class_middlewares=True)
+        filters_bot.add_custom_filter(CallbackDataPrefixFilter())
+        for prefix in prefixes:
+            filters_bot.register_callback_query_handler(handler, func=None, prefix=prefix, pass_bot=True)
+
+        router_bot = TeleBot(BENCHMARK_TOKEN, threaded=False, use_class_middlewares=True)
+        router = CallbackRouter()
+        for prefix in reversed(prefixes):
+            router.add(prefix, handler)
+        router.install(router_bot)
+
+        handled = []
+        filters_time = measure_callbacks(filters_bot, updates)
+        filters_handled, handled = handled, []
+        router_time = measure_callbacks(router_bot, updates)
+        if handled != filters_handled:
+            raise RuntimeError("The router and the prefix filters handled different callbacks")
+
+        print(f"{len(prefixes):>6} prefixes: "
+              f"filters {filters_time * 1e6:.1f} us, "
+              f"router {router_time * 1e6:.1f} us per callback, "
+              f"{filters_time / router_time:.1f}x")
+
+
+def sample_order(discounts: int = 1) -> OrderDTO:
+    """
+    Returns a confirmed order of a user with the discounts of the given number of producers,
+    the first one being the producer of the order.
+    """
+    producers = [ProducerDTO('Бетон Київ' if i == 0 else f'Виробник {i}', id=i + 1) for i in range(discounts)]
+    user = UserDTO(
+        first_name='Андрій', tg_user_id=1, tg_chat_id=1, tg_username='benchmark', id=1, phone='+380000000000',
+        discounts=[UserDiscountDTO(id=producer.id, user_id=1, producer_id=producer.id, concrete_discount=5,
+                                   delivery_discount=10, concrete_discount_vat=3, delivery_discount_vat=7,
+                                   producer=producer)
+                   for producer in producers],
+        register_time=datetime(2024, 1, 1, 12, 0),
+    )
+    return OrderDTO(
+        user=user,
+        payment_type=texts.cash_payment,
+        producer='Бетон Київ',
+        dispatch_point=DispatchPointDTO('вул. Бетонна, 1', 50.45, 30.52),
+        user_location=UserLocationDTO('вул. Хрещатик, 1', 50.44, 30.52),
+        distance=DistanceDTO(12345, 1200),
+        concrete=ConcreteDTO('C20/25 П3', 'P3', money.to_kopiykas('2650.50'), 'Бетон Київ'),
+        amount=12,
+        delivery_cost=money.to_kopiykas('3600'),
+        concrete_cost=money.multiply(money.to_kopiykas('2650.50'), 12),
+        delivery_price=money.to_kopiykas('300'),
+    )
+
+
+def measure_render(render, calls: int, repeat: int) -> float:
+    """
+    Returns the time of the fastest run to render the message once in seconds.
+    """
+    return min(timeit.repeat(render, number=calls, repeat=repeat)) / calls
+
+
+def templates_main():
+    """
+    Measures the time to render the order messages from the compiled templates and from the same layouts
+    formatted with str.format, which parses the layout on every message. The record with the discounts
+    looked up and the costs formatted is built once per order for both, so it is measured on its own.
+    """
+    args = define_template_benchmark_arg_parser().parse_args()
+
+    order = sample_order()
+    record = templates.order_record(order)
+    record['user_info'] = templates.user_info(order.user)
+    record_time = measure_render(lambda: templates.order_record(order), args.calls, args.repeat)
+    print(f"{'order record':>14}: {record_time * 1e6:.2f} us")
+
+    for name, template in (('order', templates.ORDER), ('order summary', templates.ORDER_SUMMARY),
+                           ('delivery', templates.DELIVERY_MIXER)):
+        if template.layout.format_map(record) != template.render(record):
+            raise RuntimeError(f"The {name} template and str.format rendered different messages")
+        format_time = measure_render(lambda: template.layout.format_map(record), args.calls, args.repeat)
+        render_time = measure_render(lambda: template.render(record), args.calls, args.repeat)
+        print(f"{name:>14}: str.format {format_time * 1e6:.2f} us, "
+              f"template {render_time * 1e6:.2f} us per message, {format_time / render_time:.1f}x")
+
+    order_time = measure_render(lambda: templates.render_order(order), args.calls, args.repeat)
+    summary_time = measure_render(lambda: templates.render_order_summary(order), args.calls, args.repeat)
+    print(f"{'per message':>14}: order {order_time * 1e6:.2f} us, "
+          f"order summary {summary_time * 1e6:.2f} us with the record built")
+
+
+def codecs_main():
+    """
+    Measures the size and the encoding and decoding time of an order session in the SessionCodec format,
+    with and without compression, against pickle and JSON, for the given numbers of the user discounts.
+    JSON is decoded to the plain dicts, rebuilding the DTOs would only add to its time.
+    """
+    args = define_codec_benchmark_arg_parser().parse_args()
+
+    for discounts in args.discounts:
+        order = sample_order(discounts)
+        codec = SessionCodec()
+        compressing_codec = SessionCodec(compression=True)
+        if codec.decode_order(codec.encode_order(order)) != order \
+                or compressing_codec.decode_order(compressing_codec.encode_order(order)) != order:
+            raise RuntimeError("The order session didn't survive the round trip")
+
+        formats = (
+            ('codec', codec.encode_order, codec.decode_order),
+            ('codec zlib', compressing_codec.encode_order, compressing_codec.decode_order),
+            ('pickle', pickle.dumps, pickle.loads),
+            ('json', lambda dto: json.dumps(asdict(dto), default=str, ensure_ascii=False).encode(), json.loads),
+        )
+        print(f"{discounts} discounts:")
+        for name, encode, decode in formats:
+            payload = encode(order)
+            encode_time = measure_render(lambda: encode(order), args.calls, args.repeat)
+            decode_time = measure_render(lambda: decode(payload), args.calls, args.repeat)
+            print(f"{name:>12}: {len(payload):>6} B, "
+                  f"encode {encode_time * 1e6:.2f} us, decode {decode_time * 1e6:.2f} us")
+
+
+class LastActionDict:
+    """
+    The unbounded dict the anti-flood middlewares kept the last action times in, as the baseline.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def touch(self, key, now: float):
+        previous = self._data.get(key)
+        self._data[key] = now
+        return previous if previous is not None and now - previous < self.ttl else None
+
+
+def antiflood_main():
+    """
+    Measures the anti-flood overhead per update, the updates coming from the given number of distinct users,
+    for the unbounded dict and for the TimestampStore with as many users active within the timeout as set,
+    and the size the last action times take.
+    """
+    args = define_antiflood_benchmark_arg_parser().parse_args()
+    timeout = 1.0
+
+    users = [random.randrange(args.users) for _ in range(args.updates)]
+    scenarios = (
+        ('dict, all users active', lambda: LastActionDict(timeout), args.users * 10),
+        ('store, 1k users active', lambda: TimestampStore(timeout, args.users), 1000),
+        ('store, all users active', lambda: TimestampStore(timeout, args.users), args.users * 10),
+        ('store, evicting half', lambda: TimestampStore(timeout, args.users // 2), args.users * 10),
+    )
+    for name, factory, updates_per_timeout in scenarios:
+        # the updates come evenly, so updates_per_timeout of them fall within the timeout
+        times = [i * timeout / updates_per_timeout for i in range(args.updates)]
+        store = factory()
+        touch = store.touch
+        started_at = time.perf_counter()
+        for user, now in zip(users, times):
+            touch(user, now)
+        per_update = (time.perf_counter() - started_at) / args.updates
+        print(f"{name:>24}: {per_update * 1e6:.2f} us per update, {len(store):>7} users kept, "
+              f"{sys.getsizeof(store._data) / 1024 / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
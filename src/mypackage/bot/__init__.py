@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import time
 from typing import Optional
@@ -5,15 +6,27 @@ from typing import Optional
 from sqlalchemy.orm import sessionmaker
 from telebot import TeleBot
 
+from .aio import SyncBotBridge, setup_async_bot, launch_async_bot, set_async_webhook
+from .api import setup_async_google_maps_api
 from .api.google_maps_api import GoogleMapsAPI
 from .api.google_sheet_api import GoogleSheetAPI
+from .deduplication import setup_update_deduplicator
+from .dispatcher import ShardedTeleBot
+from .pricing import QuoteEngine, setup_async_quote_engine
 from ..config.models import BotConfig, BotWebhookConfig, MessagesConfig, ButtonsConfig
 
 from .filters import add_custom_filters
-from .handlers import register_handlers
-from .middlewares import setup_middlewares
+from .handlers import register_handlers, register_async_handlers
+from .keyboards import setup_keyboard_factory
+from .middlewares import setup_middlewares, setup_async_middlewares, setup_token_bucket
+from .callback_answers import setup_callback_answerer
+from .local_api import setup_telegram_api_url
+from .notifications import setup_order_notifier
+from .outbound import setup_outbound_scheduler
+from .transport import setup_bot_api_transport
+from .sessions import setup_order_session_store, setup_async_order_session_store, AsyncRedisOrderSessionStore
 from .states.storage import setup_state_storage
-from ..db import DBAdapter
+from ..db import DBAdapter, OrderWriter, setup_async_session_maker
 
 
 def launch_bot(bot: TeleBot,
@@ -22,9 +35,18 @@ def launch_bot(bot: TeleBot,
                allowed_updates: Optional[list[str]] = None,
                webhook_config: Optional[BotWebhookConfig] = None
                ):
+    if use_webhook and webhook_config is None:
+        raise ValueError('webhook_config is required if use_webhook is True')
+
+    if isinstance(bot, SyncBotBridge):
+        if use_webhook:
+            # the updates are then passed to the bot on the loop of the webhook app
+            asyncio.run(set_async_webhook(bot, drop_pending, allowed_updates, webhook_config))
+        else:
+            asyncio.run(launch_async_bot(bot, drop_pending, allowed_updates))
+        return
+
     if use_webhook:
-        if webhook_config is None:
-            raise ValueError('webhook_config is required if use_webhook is True')
         bot.remove_webhook()
         time.sleep(1)
         bot.set_webhook(
@@ -55,29 +77,113 @@ def stop_bot(bot: TeleBot, use_webhook: bool):
     else:
         bot.stop_polling()
 
+    if isinstance(bot, ShardedTeleBot):
+        bot.stop_workers()
+
 
 def setup_bot(
         bot_config: BotConfig,
         db_session_maker: sessionmaker,
         db_logger: logging.Logger,
+        order_writer: OrderWriter,
         google_sheet_api: GoogleSheetAPI,
         google_maps_api: GoogleMapsAPI,
+        quote_engine: QuoteEngine,
         messages: MessagesConfig,
         buttons: ButtonsConfig,
-        logger: logging.Logger):
-    state_storage = setup_state_storage(bot_config.state_storage)
-    bot = TeleBot(bot_config.token, state_storage=state_storage, use_class_middlewares=bot_config.use_class_middlewares)
+        logger: logging.Logger,
+        threaded: bool = True):
+    # threaded is False where the updates are passed by the workers of an ingress queue,
+    # which keep the order of the updates of a chat only if the handlers run on them
+    order_sessions = setup_order_session_store(bot_config.order_sessions, bot_config.state_storage)
+    if bot_config.async_runtime:
+        # the rest of the setup goes through the blocking facade of the async bot
+        bot = setup_async_bot(bot_config)
+    elif bot_config.dispatcher:
+        state_storage = setup_state_storage(bot_config.state_storage)
+        bot = ShardedTeleBot(bot_config.token, state_storage=state_storage,
+                             use_class_middlewares=bot_config.use_class_middlewares,
+                             workers=bot_config.dispatcher.workers, queue_size=bot_config.dispatcher.queue_size,
+                             logger=logger)
+    else:
+        state_storage = setup_state_storage(bot_config.state_storage)
+        bot = TeleBot(bot_config.token, state_storage=state_storage,
+                      use_class_middlewares=bot_config.use_class_middlewares, threaded=threaded)
+
+    update_deduplicator = setup_update_deduplicator(bot_config, logger)
+    if bot_config.async_runtime:
+        update_deduplicator.install_async(bot.bot, bot.executor)
+    else:
+        update_deduplicator.install(bot)
+    if bot_config.telegram_api_url:
+        setup_telegram_api_url(bot, bot_config.telegram_api_url, bot_config.telegram_api_local)
+    if not bot_config.async_runtime:
+        # AsyncTeleBot sends through its own aiohttp session, sized in setup_async_bot
+        setup_bot_api_transport(bot, bot_config, logger)
+    # on the async bot itself, so the coroutine handlers and the bridged ones share the same buckets
+    setup_outbound_scheduler(bot.bot if bot_config.async_runtime else bot, bot_config, logger)
+    setup_keyboard_factory(bot_config, lambda: google_sheet_api.version)
+    order_notifier = setup_order_notifier(bot, bot_config, logger)
+    if bot_config.async_runtime:
+        # sent through the loop, thus before it is closed, the notifier waits for the loop off it
+        bot.closers.append(lambda: asyncio.get_running_loop().run_in_executor(None, order_notifier.stop))
+    callback_answers = setup_callback_answerer(bot, bot_config, logger)
 
     add_custom_filters(bot, bot_config.owner_tg_id, bot_config.admins)
-    if bot_config.use_class_middlewares:
+    if bot_config.use_class_middlewares and bot_config.async_runtime:
+        async_db_session_maker = setup_async_session_maker()
+        async_google_maps_api = setup_async_google_maps_api(google_maps_api)
+        async_order_sessions = setup_async_order_session_store(bot_config.order_sessions, bot_config.state_storage,
+                                                               order_sessions)
+        token_bucket = setup_token_bucket(bot_config.antiflood, bot_config.state_storage, logger, use_asyncio=True)
+        # closed on the loop they were used on, once the bot stops
+        bot.closers.append(async_google_maps_api.close)
+        bot.closers.append(async_db_session_maker.kw['bind'].dispose)
+        if isinstance(async_order_sessions, AsyncRedisOrderSessionStore):
+            bot.closers.append(async_order_sessions.redis.aclose)
+        if token_bucket is not None:
+            bot.closers.append(token_bucket.redis.aclose)
+        setup_async_middlewares(
+            bridge=bot,
+            db_session_maker=db_session_maker,
+            async_db_session_maker=async_db_session_maker,
+            db_logger=db_logger,
+            order_writer=order_writer,
+            google_sheet_api=google_sheet_api,
+            google_maps_api=google_maps_api,
+            async_google_maps_api=async_google_maps_api,
+            quote_engine=quote_engine,
+            async_quote_engine=setup_async_quote_engine(quote_engine, async_google_maps_api),
+            order_sessions=order_sessions,
+            async_order_sessions=async_order_sessions,
+            order_notifier=order_notifier,
+            timeout_message=messages.anti_flood,
+            timeout=bot_config.actions_timeout,
+            antiflood_max_size=bot_config.antiflood.max_size if bot_config.antiflood else 100000,
+            token_bucket=token_bucket,
+            callback_answers=callback_answers,
+            messages=messages,
+            buttons=buttons,
+            logger=logger,
+            page_size=bot_config.page_size
+        )
+        register_async_handlers(bot, buttons)
+    elif bot_config.use_class_middlewares:
         setup_middlewares(
             bot=bot,
             db_session_maker=db_session_maker,
             db_logger=db_logger,
+            order_writer=order_writer,
             google_sheet_api=google_sheet_api,
             google_maps_api=google_maps_api,
+            quote_engine=quote_engine,
+            order_sessions=order_sessions,
+            order_notifier=order_notifier,
             timeout_message=messages.anti_flood,
             timeout=bot_config.actions_timeout,
+            antiflood_max_size=bot_config.antiflood.max_size if bot_config.antiflood else 100000,
+            token_bucket=setup_token_bucket(bot_config.antiflood, bot_config.state_storage, logger),
+            callback_answers=callback_answers,
             messages=messages,
             buttons=buttons,
             logger=logger,
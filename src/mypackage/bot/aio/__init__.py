@@ -0,0 +1,55 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .bridge import SyncBotBridge
+from ..local_api import api_urls
+from ..states.storage import setup_async_state_storage
+from ...config.models import BotConfig, BotWebhookConfig
+
+
+def setup_async_bot(bot_config: BotConfig) -> SyncBotBridge:
+    try:
+        from telebot import asyncio_helper
+        from telebot.async_telebot import AsyncTeleBot
+    except ImportError:
+        raise ImportError("Please install aiohttp using `pip install aiohttp`")
+
+    if bot_config.telegram_api_url:
+        asyncio_helper.API_URL, asyncio_helper.FILE_URL = api_urls(bot_config.telegram_api_url)
+    if bot_config.transport is not None:
+        # read once the session is created on the loop
+        asyncio_helper.REQUEST_LIMIT = bot_config.transport.pool_size
+
+    bot = AsyncTeleBot(bot_config.token, state_storage=setup_async_state_storage(bot_config.state_storage))
+    executor = ThreadPoolExecutor(max_workers=bot_config.async_runtime.workers, thread_name_prefix="async_runtime")
+    return SyncBotBridge(bot, executor)
+
+
+async def launch_async_bot(bridge: SyncBotBridge, drop_pending: bool, allowed_updates: Optional[list[str]] = None):
+    bridge.loop = asyncio.get_running_loop()
+    try:
+        await bridge.bot.remove_webhook()
+        await asyncio.sleep(1)
+        await bridge.bot.infinity_polling(allowed_updates=allowed_updates, skip_pending=drop_pending)
+    finally:
+        await bridge.close()
+
+
+async def set_async_webhook(bridge: SyncBotBridge, drop_pending: bool, allowed_updates: Optional[list[str]],
+                            webhook_config: BotWebhookConfig):
+    try:
+        await bridge.bot.remove_webhook()
+        await asyncio.sleep(1)
+        await bridge.bot.set_webhook(
+            url=f"{webhook_config.base_url}/{webhook_config.path}",
+            certificate=webhook_config.cert_path,
+            max_connections=webhook_config.max_connections,
+            allowed_updates=allowed_updates,
+            ip_address=webhook_config.ip_address,
+            drop_pending_updates=drop_pending,
+            secret_token=webhook_config.secret_token
+        )
+    finally:
+        # the session is bound to this loop, the app's loop opens its own one
+        await bridge.bot.close_session()
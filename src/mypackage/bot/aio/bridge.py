@@ -0,0 +1,185 @@
+import asyncio
+import functools
+import inspect
+from concurrent.futures import Executor
+from typing import Awaitable, Callable, List, Optional
+
+from requests.exceptions import RequestException
+from telebot import apihelper, asyncio_filters, custom_filters, handler_backends
+
+from ..callback_router import CallbackRouter
+from ..filters import StateFilter, AsyncStateFilter
+
+
+class AsyncSimpleFilterAdapter(asyncio_filters.SimpleCustomFilter):
+    def __init__(self, custom_filter: custom_filters.SimpleCustomFilter):
+        self.key = custom_filter.key
+        self.custom_filter = custom_filter
+
+    async def check(self, message):
+        return self.custom_filter.check(message)
+
+
+class AsyncAdvancedFilterAdapter(asyncio_filters.AdvancedCustomFilter):
+    def __init__(self, custom_filter: custom_filters.AdvancedCustomFilter):
+        self.key = custom_filter.key
+        self.custom_filter = custom_filter
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def check(self, message, text):
+        return self.custom_filter.check(message, text)
+
+
+class _BlockingContext:
+    def __init__(self, bridge: 'SyncBotBridge', context):
+        self.bridge = bridge
+        self.context = context
+
+    def __enter__(self):
+        return self.bridge.run(self.context.__aenter__())
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self.bridge.run(self.context.__aexit__(exc_type, exc_val, exc_tb))
+
+
+class _BlockingCallbackRouter:
+    """
+    The callback router of the async bot as the blocking handlers see it, the handlers added run on the workers.
+    """
+
+    def __init__(self, bridge: 'SyncBotBridge', callback_router: CallbackRouter):
+        self.bridge = bridge
+        self.callback_router = callback_router
+
+    def add(self, prefix: str, handler: Callable):
+        self.callback_router.add(prefix, self.bridge.wrap_handler(handler))
+
+
+class SyncBotBridge:
+    """
+    Blocking facade of AsyncTeleBot for the handlers, middlewares and senders written for TeleBot.
+
+    They run on a bounded pool of workers, and every coroutine method of the bot they call is run on the event loop
+    and waited for, so all the Telegram requests share the loop's aiohttp session. The handlers and filters
+    set up through the bridge are adapted to the async bot, the state filter being replaced with its async version.
+    The updates waiting for a worker are coroutines, not threads.
+
+    The handler middlewares run on the worker around the blocking handlers only, so these get the blocking
+    versions of the arguments the async middlewares pass to the async handlers.
+    """
+
+    def __init__(self, bot, executor: Executor):
+        self.bot = bot
+        self.executor = executor
+        self.loop: Optional[asyncio.AbstractEventLoop] = None  # set once the loop is started
+        self.handler_middlewares: List[handler_backends.BaseMiddleware] = []
+        self.closers: List[Callable[[], Awaitable]] = []  # the async clients to close with the bot
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.bot, name)
+        if not inspect.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def blocking(*args, **kwargs):
+            return self.run(attr(*args, **kwargs))
+
+        return blocking
+
+    def run(self, coro):
+        """
+        Runs the coroutine on the event loop and waits for its result, must not be called on the loop itself.
+
+        The errors of the async helper are raised as the TeleBot ones the callers handle.
+        """
+        if self.loop is None:
+            coro.close()
+            raise RuntimeError("The async runtime is not started")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result()
+        except Exception as e:
+            # imported here as it requires aiohttp, which the sync runtime doesn't
+            from telebot import asyncio_helper
+
+            if isinstance(e, asyncio_helper.ApiTelegramException):
+                raise apihelper.ApiTelegramException(e.function_name, e.result, e.result_json) from e
+            if isinstance(e, (asyncio_helper.ApiException, asyncio_helper.RequestTimeout, asyncio.TimeoutError)):
+                raise RequestException(str(e)) from e
+            raise
+
+    async def close(self):
+        """
+        Closes the async clients and the aiohttp session of the bot if it was opened, and stops the workers.
+        """
+        # imported here as it requires aiohttp, which the sync runtime doesn't
+        from telebot import asyncio_helper
+
+        # before the session, as the closers may still send, e.g. the pending order notifications
+        for close in self.closers:
+            await close()
+        if asyncio_helper.session_manager.session is not None:
+            await self.bot.close_session()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def retrieve_data(self, *args, **kwargs):
+        return _BlockingContext(self, self.bot.retrieve_data(*args, **kwargs))
+
+    def wrap_handler(self, callback):
+        """
+        Returns the coroutine running the blocking handler on a worker, e.g. to be routed by the async bot.
+        """
+        @functools.wraps(callback)
+        async def handler(message, **kwargs):
+            if 'bot' in kwargs:
+                kwargs['bot'] = self
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(self._run_handler, callback, message, kwargs))
+
+        return handler
+
+    def _run_handler(self, callback, message, kwargs: dict):
+        if not self.handler_middlewares:
+            return callback(message, **kwargs)
+
+        data = {}
+        for middleware in self.handler_middlewares:
+            middleware.pre_process(message, data)
+        if isinstance(kwargs.get('data'), dict):
+            kwargs['data'] = {**kwargs['data'], **data}
+        else:
+            # only the arguments the handler takes are passed to it
+            kwargs.update((key, value) for key, value in data.items() if key in kwargs)
+        exception = None
+        try:
+            return callback(message, **kwargs)
+        except Exception as e:
+            exception = e
+            raise
+        finally:
+            for middleware in self.handler_middlewares:
+                middleware.post_process(message, data, exception)
+
+    def blocking_callback_router(self, callback_router: CallbackRouter) -> _BlockingCallbackRouter:
+        """
+        Returns the router to add the blocking callback handlers to, routed by the async bot with the async ones.
+        """
+        return _BlockingCallbackRouter(self, callback_router)
+
+    def register_message_handler(self, callback, *args, **kwargs):
+        self.bot.register_message_handler(self.wrap_handler(callback), *args, **kwargs)
+
+    def register_callback_query_handler(self, callback, *args, **kwargs):
+        self.bot.register_callback_query_handler(self.wrap_handler(callback), *args, **kwargs)
+
+    def add_custom_filter(self, custom_filter):
+        if isinstance(custom_filter, StateFilter):
+            # the sync one would block the loop waiting for the state storage
+            self.bot.add_custom_filter(AsyncStateFilter(self.bot))
+        elif isinstance(custom_filter, custom_filters.SimpleCustomFilter):
+            self.bot.add_custom_filter(AsyncSimpleFilterAdapter(custom_filter))
+        else:
+            self.bot.add_custom_filter(AsyncAdvancedFilterAdapter(custom_filter))
+
+    def setup_handler_middleware(self, middleware: handler_backends.BaseMiddleware):
+        self.handler_middlewares.append(middleware)
@@ -6,7 +6,7 @@ from sqlalchemy import create_engine, URL
 from sqlalchemy.orm import sessionmaker
 
 from ..api.google_sheet_api import GoogleSheetAPI
-from ..api.google_maps_api import GoogleMapsAPI
+from ..api.google_maps_api import GoogleMapsAPI, AsyncGoogleMapsAPI
 from ...config.models import GoogleSheetAPIConfig
 
 
@@ -22,3 +22,10 @@ def setup_google_maps_api(api_key: str):
     _google_maps_api = GoogleMapsAPI(api_key)
 
     return _google_maps_api
+
+
+def setup_async_google_maps_api(google_maps_api: GoogleMapsAPI) -> AsyncGoogleMapsAPI:
+    # the same key and distance cache as the blocking client of the quoting API and the blocking handlers
+    _async_google_maps_api = AsyncGoogleMapsAPI(google_maps_api.api_key, distance_cache=google_maps_api.distance_cache)
+
+    return _async_google_maps_api
@@ -1,70 +1,111 @@
+import asyncio
 import datetime
 import json
-from typing import Tuple, List, Iterable
+from typing import Callable, Tuple, List, Iterable, Optional
 
 import googlemaps
+from googlemaps import convert
 from googlemaps.distance_matrix import distance_matrix
+from googlemaps.exceptions import ApiError, HTTPError
 from googlemaps.geocoding import geocode, reverse_geocode
 from sqlalchemy.orm import sessionmaker
 
+from ..cache import LRUCache
 from ...db import DBAdapter
 from ...db.dto import UserLocationDTO, DispatchPointDTO, DistanceDTO
 
+# ~1 m precision, close enough to share the distances between the same addresses
+COORDS_PRECISION = 5
+
+# The web services the googlemaps client requests, called directly by the async client
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+DISTANCE_MATRIX_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
+
+# The geocoding is limited to the delivery area
+GEOCODE_COMPONENTS = {'locality': 'Kyiv', 'country': 'UA'}
+GEOCODE_LANGUAGE = "uk-UA"
+
+
+def _distance_key(_from: Tuple[float, float], to: Tuple[float, float]) -> tuple:
+    return round(_from[0], COORDS_PRECISION), round(_from[1], COORDS_PRECISION), to[0], to[1]
+
+
+def _dump(filename: str, result):
+    with open(filename, 'w', encoding='utf-8') as json_file:
+        json.dump(result, json_file, ensure_ascii=False, indent=4)
+
+
+def _parse_distance(result: dict) -> DistanceDTO:
+    return DistanceDTO(result["rows"][0]["elements"][0]["distance"]["value"],
+                       result["rows"][0]["elements"][0]["duration"]["value"])
+
+
+def _parse_address(result: list) -> UserLocationDTO | None:
+    user_location = None
+    if result:
+        address = (", ".join(component["long_name"] for component in result[0]["address_components"]))
+        user_location = UserLocationDTO(
+            # address=result[0]["formatted_address"],
+            address=address,
+            latitude=result[0]["geometry"]["location"]["lat"],
+            longitude=result[0]["geometry"]["location"]["lng"]
+        )
+    return user_location
+
+
+def _parse_coords(result: list) -> UserLocationDTO:
+    return UserLocationDTO(
+        address=result[0]["formatted_address"],
+        latitude=result[0]["geometry"]["location"]["lat"],
+        longitude=result[0]["geometry"]["location"]["lng"]
+    )
+
 
 class GoogleMapsAPI:
-    def __init__(self, api_key):
+    def __init__(self, api_key, distance_cache_size: int = 4096):
+        self.api_key = api_key
         self.gmaps = googlemaps.Client(api_key)
+        self.distance_cache = LRUCache(max_size=distance_cache_size)
 
     def _get_distance(self, _from: Tuple[float, float], to: Tuple[float, float], debug=False):
+        key = _distance_key(_from, to)
+        distance = self.distance_cache.get(key)
+        if distance is None:
+            distance = self._request_distance(_from, to, debug=debug)
+            self.distance_cache.set(key, distance)
+        return distance
+
+    def _request_distance(self, _from: Tuple[float, float], to: Tuple[float, float], debug=False):
         result = distance_matrix(self.gmaps, _from, to)
 
         if debug:
-            with open('distance_result.json', 'w', encoding='utf-8') as json_file:
-                json.dump(result, json_file, ensure_ascii=False, indent=4)
+            _dump('distance_result.json', result)
 
-        distance = DistanceDTO(result["rows"][0]["elements"][0]["distance"]["value"],
-                               result["rows"][0]["elements"][0]["duration"]["value"])
-
-        return distance
+        return _parse_distance(result)
 
     def from_address(self, address: str, debug=False) -> UserLocationDTO | None:
-        components = {'locality': 'Kyiv', 'country': 'UA'}
-        result = geocode(self.gmaps, address, language="uk-UA", components=components)
+        result = geocode(self.gmaps, address, language=GEOCODE_LANGUAGE, components=GEOCODE_COMPONENTS)
         if debug:
-            with open('geocode_result.json', 'w', encoding='utf-8') as json_file:
-                json.dump(result, json_file, ensure_ascii=False, indent=4)
-
-        user_location = None
-        if result:
-            address = (", ".join(component["long_name"] for component in result[0]["address_components"]))
-            user_location = UserLocationDTO(
-                # address=result[0]["formatted_address"],
-                address=address,
-                latitude=result[0]["geometry"]["location"]["lat"],
-                longitude=result[0]["geometry"]["location"]["lng"]
-            )
+            _dump('geocode_result.json', result)
 
-        return user_location
+        return _parse_address(result)
 
     def from_coords(self, coords: Tuple[float, float], debug=False) -> UserLocationDTO:
         result = reverse_geocode(self.gmaps, coords)
 
-        user_location = UserLocationDTO(
-            address=result[0]["formatted_address"],
-            latitude=result[0]["geometry"]["location"]["lat"],
-            longitude=result[0]["geometry"]["location"]["lng"]
-        )
-
         if debug:
-            with open('reverse_geocode_result.json', 'w', encoding='utf-8') as json_file:
-                json.dump(result, json_file, ensure_ascii=False, indent=4)
+            _dump('reverse_geocode_result.json', result)
 
-        return user_location
+        return _parse_coords(result)
 
-    def get_closest_point(self, dp_list: Iterable[DispatchPointDTO],
-                          coords: tuple[float, float]) -> Tuple[DispatchPointDTO, DistanceDTO]:
+    def get_closest_point(self, dp_list: Iterable[DispatchPointDTO], coords: tuple[float, float],
+                          is_cancelled: Optional[Callable[[], bool]] = None
+                          ) -> Tuple[DispatchPointDTO, DistanceDTO] | None:
         distances = {}
         for dp in dp_list:
+            # the remaining requests are skipped once the caller doesn't need the result anymore
+            if is_cancelled is not None and is_cancelled():
+                return None
             result = self._get_distance(coords, dp.coords)
             distances[result.distance_metres] = (dp, result)
 
@@ -72,3 +113,83 @@ class GoogleMapsAPI:
         return distances[min_distance]
 
 
+class AsyncGoogleMapsAPI:
+    """
+    GoogleMapsAPI of the async runtime, requesting the same web services over aiohttp on the event loop.
+
+    The distances of a lookup are requested concurrently, and the cache is the one of the blocking client if given,
+    so both runtimes reuse the distances looked up. The errors are the googlemaps ones.
+    """
+
+    def __init__(self, api_key, distance_cache: Optional[LRUCache] = None, distance_cache_size: int = 4096,
+                 timeout: float = 10.0):
+        self.api_key = api_key
+        self.distance_cache = distance_cache if distance_cache is not None else LRUCache(max_size=distance_cache_size)
+        self.timeout = timeout
+        self._session = None  # opened on the loop by the first request
+
+    async def _request(self, url: str, params: dict) -> dict:
+        # imported here as it is only required by the async runtime
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        async with self._session.get(url, params={**params, 'key': self.api_key}) as response:
+            if response.status != 200:
+                raise HTTPError(response.status)
+            body = await response.json()
+
+        # the statuses are checked as the googlemaps client does
+        if body["status"] in ("OK", "ZERO_RESULTS"):
+            return body
+        raise ApiError(body["status"], body.get("error_message"))
+
+    async def _get_distance(self, _from: Tuple[float, float], to: Tuple[float, float], debug=False):
+        key = _distance_key(_from, to)
+        distance = self.distance_cache.get(key)
+        if distance is None:
+            distance = await self._request_distance(_from, to, debug=debug)
+            self.distance_cache.set(key, distance)
+        return distance
+
+    async def _request_distance(self, _from: Tuple[float, float], to: Tuple[float, float], debug=False):
+        result = await self._request(DISTANCE_MATRIX_URL, {'origins': convert.latlng(_from),
+                                                           'destinations': convert.latlng(to)})
+        if debug:
+            await asyncio.to_thread(_dump, 'distance_result.json', result)
+
+        return _parse_distance(result)
+
+    async def from_address(self, address: str, debug=False) -> UserLocationDTO | None:
+        result = (await self._request(GEOCODE_URL, {'address': address, 'language': GEOCODE_LANGUAGE,
+                                                    'components': convert.components(GEOCODE_COMPONENTS)}
+                                      )).get("results", [])
+        if debug:
+            await asyncio.to_thread(_dump, 'geocode_result.json', result)
+
+        return _parse_address(result)
+
+    async def from_coords(self, coords: Tuple[float, float], debug=False) -> UserLocationDTO:
+        result = (await self._request(GEOCODE_URL, {'latlng': convert.latlng(coords)})).get("results", [])
+
+        if debug:
+            await asyncio.to_thread(_dump, 'reverse_geocode_result.json', result)
+
+        return _parse_coords(result)
+
+    async def get_closest_point(self, dp_list: Iterable[DispatchPointDTO], coords: tuple[float, float],
+                                is_cancelled: Optional[Callable[[], bool]] = None
+                                ) -> Tuple[DispatchPointDTO, DistanceDTO] | None:
+        # the requests already sent are cancelled with the task of the lookup
+        if is_cancelled is not None and is_cancelled():
+            return None
+        dp_list = list(dp_list)
+        results = await asyncio.gather(*(self._get_distance(coords, dp.coords) for dp in dp_list))
+        distances = {result.distance_metres: (dp, result) for dp, result in zip(dp_list, results)}
+
+        min_distance = min(distances.keys())
+        return distances[min_distance]
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -1,15 +1,24 @@
 import datetime
+import threading
 from concurrent.futures import ThreadPoolExecutor
-from typing import Dict, Set, List
+from typing import Dict, Set, List, Callable
 
 import gspread
 from sqlalchemy.orm import sessionmaker
 
 from ...db import DBAdapter
-from ...db.dto import DispatchPointDTO, ConcreteDTO, ConcreteTypeDTO, ConcreteDataDTO, ProducerDTO
+from ...db.dto import DispatchPointDTO, ConcreteDTO, ConcreteTypeDTO, ConcreteDataDTO, ProducerDTO, CatalogDiffDTO
+from ...money import to_kopiykas
 
 type dispatch_points_set = Set[DispatchPointDTO]
 
+TRUCK_DELIVERY_TYPE = "Самоскид"
+MIXER_DELIVERY_TYPE = "Автобетонозмішувач"
+
+
+def get_delivery_type(concrete_type: str) -> str:
+    return TRUCK_DELIVERY_TYPE if concrete_type in ["P1", "P2"] else MIXER_DELIVERY_TYPE
+
 
 class GoogleSheetAPI:
     def __init__(self,
@@ -34,6 +43,11 @@ class GoogleSheetAPI:
 
         self.refresh_time = refresh_time
 
+        # catalog version, incremented on every refresh that changed anything
+        self.version = 0
+        self._refresh_lock = threading.Lock()
+        self._listeners: List[Callable[[CatalogDiffDTO], None]] = []
+
         self.check_producers()
         self.get_delivery_price_list("P1")
         self.get_delivery_price_list("P3")
@@ -59,12 +73,58 @@ class GoogleSheetAPI:
 
         return self._concrete_data
 
-    def remove_data(self):
-        self._producer_titles = []
-        self._concrete_data = None
+    def subscribe(self, listener: Callable[[CatalogDiffDTO], None]):
+        """
+        Registers a listener called with the catalog diff after every refresh that changed anything.
+        """
+        self._listeners.append(listener)
 
-        self.delivery_mixer_price_data = []
-        self.delivery_truck_price_data = []
+    def refresh(self) -> CatalogDiffDTO:
+        """
+        Reloads the catalog from the Google Sheets document and notifies the listeners about the changes.
+
+        Returns:
+            CatalogDiffDTO: The producers, concrete types and tariff columns that changed.
+        """
+        with self._refresh_lock:
+            producers = self.get_producers_with_dispatch_points()
+            concrete_data = self.get_concrete_data()
+            worksheet = self.sh.worksheet("!delivery_prices")
+            delivery_truck_price_data = self._get_delivery_price_column(worksheet, TRUCK_DELIVERY_TYPE)
+            delivery_mixer_price_data = self._get_delivery_price_column(worksheet, MIXER_DELIVERY_TYPE)
+
+            diff = CatalogDiffDTO()
+
+            old_dispatch_points = {producer.title: producer.dispatch_points for producer in self._producers or []}
+            new_dispatch_points = {producer.title: producer.dispatch_points for producer in producers}
+            for title in old_dispatch_points.keys() | new_dispatch_points.keys():
+                if old_dispatch_points.get(title) != new_dispatch_points.get(title):
+                    diff.producers.add(title)
+
+            old_concretes = self._concrete_data.concretes_by_type if self._concrete_data else {}
+            new_concretes = concrete_data.concretes_by_type
+            for concrete_type in old_concretes.keys() | new_concretes.keys():
+                if old_concretes.get(concrete_type) != new_concretes.get(concrete_type):
+                    diff.concrete_types.add(concrete_type)
+
+            if delivery_truck_price_data != self.delivery_truck_price_data:
+                diff.delivery_types.add(TRUCK_DELIVERY_TYPE)
+            if delivery_mixer_price_data != self.delivery_mixer_price_data:
+                diff.delivery_types.add(MIXER_DELIVERY_TYPE)
+
+            self._producers = producers
+            self._producer_titles = set(new_dispatch_points)
+            self._concrete_data = concrete_data
+            self.delivery_truck_price_data = delivery_truck_price_data
+            self.delivery_mixer_price_data = delivery_mixer_price_data
+
+            if diff:
+                self.version += 1
+
+        if diff:
+            for listener in self._listeners:
+                listener(diff)
+        return diff
 
     def check_producers(self):
         actual_producer_titles = self.get_producers_title_set()
@@ -114,8 +174,7 @@ class GoogleSheetAPI:
 
             for el in range(1, 7):
                 if el < len(data[0]) - 1:
-                    concrete = ConcreteDTO(data[0][el], f"P{concrete_type_number}",
-                                           float(data[1][el].replace(",", ".")))
+                    concrete = ConcreteDTO(data[0][el], f"P{concrete_type_number}", to_kopiykas(data[1][el]))
                     concretes.append(concrete)
                 else:
                     break
@@ -125,26 +184,26 @@ class GoogleSheetAPI:
 
         return ConcreteDataDTO(result)
 
+    @staticmethod
+    def _get_delivery_price_column(worksheet, delivery_type: str) -> List[str]:
+        data_col_index = worksheet.row_values(1).index(delivery_type) + 1
+        return worksheet.col_values(data_col_index)[1:]
+
     def get_delivery_price_list(self, concrete_type: str) -> List[str]:
-        if concrete_type in ["P1", "P2"]:
-            delivery_type = "Самоскид"
-        else:
-            delivery_type = "Автобетонозмішувач"
+        delivery_type = get_delivery_type(concrete_type)
 
-        if delivery_type == "Самоскид":
+        if delivery_type == TRUCK_DELIVERY_TYPE:
             if not self.delivery_truck_price_data:
                 worksheet = self.sh.worksheet("!delivery_prices")
-                data_col_index = worksheet.row_values(1).index(delivery_type) + 1
-                self.delivery_truck_price_data = worksheet.col_values(data_col_index)[1:]
+                self.delivery_truck_price_data = self._get_delivery_price_column(worksheet, delivery_type)
 
             return self.delivery_truck_price_data
 
-        elif delivery_type == "Автобетонозмішувач":
+        elif delivery_type == MIXER_DELIVERY_TYPE:
             if not self.delivery_mixer_price_data:
                 worksheet = self.sh.worksheet("!delivery_prices")
-                data_col_index = worksheet.row_values(1).index(delivery_type) + 1
+                self.delivery_mixer_price_data = self._get_delivery_price_column(worksheet, delivery_type)
 
-                self.delivery_mixer_price_data = worksheet.col_values(data_col_index)[1:]
             return self.delivery_mixer_price_data
 
         return []
@@ -0,0 +1,124 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache with an optional time-to-live for the entries.
+
+    Entries are kept in an OrderedDict in the order of the last access, so both the lookup
+    and the eviction of the least recently used entry are O(1).
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return self.get(key) is not None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def evict(self, predicate: Callable[[Hashable], bool]) -> List[Hashable]:
+        """
+        Evicts all the entries whose keys match the predicate.
+
+        Returns:
+            List[Hashable]: The evicted keys.
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+        return keys
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TimestampStore:
+    """
+    Thread-safe store of the last action time per key, e.g. per user for the anti-flood middlewares.
+
+    Entries are kept in an OrderedDict in the order of the last action, so the expired ones gather at its start
+    and are swept lazily on every action, as are the oldest ones once the store is full. Both are O(1) amortized,
+    thus the store holds only the keys active within the time-to-live, and never more than the max size.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: OrderedDict[Hashable, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def touch(self, key: Hashable, now: float) -> Optional[float]:
+        """
+        Records the action time of the key.
+
+        Args:
+            key: The key, e.g. the user id.
+            now: The action time, the values of a store must come from the same clock.
+
+        Returns:
+            Optional[float]: The time of the previous action of the key if it is within the time-to-live, else None.
+        """
+        with self._lock:
+            data = self._data
+            previous = data.pop(key, None)
+            data[key] = now
+            if previous is not None and now - previous >= self.ttl:
+                previous = None
+
+            expired = now - self.ttl
+            while len(data) > 1:
+                oldest = next(iter(data))
+                if data[oldest] > expired and len(data) <= self.max_size:
+                    break
+                del data[oldest]
+            return previous
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,135 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from requests.exceptions import RequestException
+from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
+
+from ..config.models import BotConfig
+
+
+@dataclass
+class CallbackAnswerDTO:
+    callback_query_id: str
+    due: float
+    text: Optional[str] = None
+    show_alert: Optional[bool] = None
+    url: Optional[str] = None
+    cache_time: Optional[int] = None
+
+
+class CallbackAnswerer:
+    """
+    Answers the callback queries in the background, so the handlers start without waiting for Telegram.
+
+    The default answer of a query is scheduled as the update comes and is sent once its handler returns,
+    or once the hold time passes if the handler runs longer. An answer given by the handler before that
+    replaces the default one, so every query is answered by a single request.
+    """
+
+    def __init__(self, bot: TeleBot, hold_time: float = 0.5, workers: int = 2,
+                 logger: Optional[logging.Logger] = None):
+        self.bot = bot
+        self.hold_time = hold_time
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._pending: Dict[str, CallbackAnswerDTO] = {}  # the answers not sent yet by query id
+        self._due = []  # heap of (due time, sequence number, query id), an entry is stale if the due time changed
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._workers = [threading.Thread(target=self._run, name=f"callback_answerer_{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def schedule(self, callback_query_id: str, text: Optional[str] = None, show_alert: Optional[bool] = None,
+                 hold: bool = True):
+        """
+        Schedules the default answer of the query, held until the handler returns if hold is set.
+        """
+        due = time.monotonic() + self.hold_time if hold else 0
+        with self._condition:
+            self._push(CallbackAnswerDTO(callback_query_id, due, text, show_alert))
+
+    def answer(self, callback_query_id: str, text: Optional[str] = None, show_alert: Optional[bool] = None,
+               url: Optional[str] = None, cache_time: Optional[int] = None) -> bool:
+        """
+        Replaces the default answer of the query with the given one and sends it right away.
+
+        Returns:
+            bool: False if the default answer has already been sent, thus the query can't be answered again.
+        """
+        with self._condition:
+            if callback_query_id not in self._pending:
+                self.logger.warning(f"Callback query {callback_query_id} has already been answered")
+                return False
+            self._push(CallbackAnswerDTO(callback_query_id, 0, text, show_alert, url, cache_time))
+        return True
+
+    def release(self, callback_query_id: str):
+        """
+        Sends the held default answer of the query right away, e.g. once its handler returns.
+        """
+        with self._condition:
+            answer = self._pending.get(callback_query_id)
+            if answer is not None and answer.due:
+                answer.due = 0
+                heapq.heappush(self._due, (0, next(self._sequence), callback_query_id))
+                self._condition.notify()
+
+    def _push(self, answer: CallbackAnswerDTO):
+        self._pending[answer.callback_query_id] = answer
+        heapq.heappush(self._due, (answer.due, next(self._sequence), answer.callback_query_id))
+        self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._due or self._due[0][0] > time.monotonic()):
+                    timeout = self._due[0][0] - time.monotonic() if self._due else None
+                    self._condition.wait(timeout)
+                if not self._due:
+                    return
+                due, _, callback_query_id = heapq.heappop(self._due)
+                answer = self._pending.get(callback_query_id)
+                if answer is None or answer.due != due:
+                    continue
+                del self._pending[callback_query_id]
+
+            self._send(answer)
+
+    def _send(self, answer: CallbackAnswerDTO):
+        try:
+            self.bot.answer_callback_query(answer.callback_query_id, answer.text, answer.show_alert, answer.url,
+                                           answer.cache_time)
+        except (ApiTelegramException, RequestException) as e:
+            # the query expires in seconds, thus a failed answer isn't retried
+            self.logger.error(f"Failed to answer callback query {answer.callback_query_id}: {e}")
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Sends the pending answers without holding them and stops the workers.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+
+
+def setup_callback_answerer(bot: TeleBot, bot_config: BotConfig, logger: logging.Logger) -> CallbackAnswerer:
+    if bot_config.callback_answers is None:
+        return CallbackAnswerer(bot, logger=logger)
+
+    return CallbackAnswerer(
+        bot,
+        hold_time=bot_config.callback_answers.hold_time,
+        workers=bot_config.callback_answers.workers,
+        logger=logger,
+    )
@@ -0,0 +1,109 @@
+import inspect
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from telebot import TeleBot
+from telebot.types import CallbackQuery
+
+if TYPE_CHECKING:
+    # imports aiohttp, which is only required by the async runtime
+    from telebot.async_telebot import AsyncTeleBot
+
+
+class _TrieNode:
+    __slots__ = ('children', 'handler', 'params')
+
+    def __init__(self):
+        self.children: Dict[str, _TrieNode] = {}
+        self.handler: Optional[Callable] = None
+        self.params: List[str] = []
+
+
+class CallbackRouter:
+    """
+    Dispatches the callback queries to the handler of the longest registered prefix of their callback data.
+
+    The prefixes are compiled into a trie of their characters, so a callback is routed in a single walk over its data
+    however many prefixes are registered, instead of testing the prefix filter of every handler in turn.
+    The longest prefix wins regardless of the registration order, e.g. user_back and user_page# over user_.
+    The handlers get the bot and the middleware data they take, as TeleBot passes them.
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self.prefixes: List[str] = []
+        self.routed_count: Dict[str, int] = {}
+
+    def add(self, prefix: str, handler: Callable):
+        node = self._root
+        for char in prefix:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _TrieNode()
+            node = child
+        if node.handler is not None:
+            raise ValueError(f'A callback handler is already registered for the prefix "{prefix}"')
+
+        node.handler = handler
+        node.params = list(inspect.signature(handler).parameters)
+        self.prefixes.append(prefix)
+        self.routed_count[prefix] = 0
+
+    def _resolve(self, data: str) -> tuple[Optional[_TrieNode], int]:
+        matched, matched_length = (self._root, 0) if self._root.handler is not None else (None, 0)
+        node = self._root
+        for length, char in enumerate(data, 1):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.handler is not None:
+                matched, matched_length = node, length
+        return matched, matched_length
+
+    def resolve(self, data: Optional[str]) -> Optional[Callable]:
+        """
+        Returns the handler of the longest registered prefix of the callback data, if any.
+        """
+        if data is None:
+            return None
+        node, _ = self._resolve(data)
+        return node.handler if node is not None else None
+
+    def matches(self, call: CallbackQuery) -> bool:
+        return self.resolve(call.data) is not None
+
+    def dispatch(self, call: CallbackQuery, data: Optional[dict] = None, bot: Optional[TeleBot] = None):
+        node, length = self._resolve(call.data)
+        if node is None:
+            return None
+        self.routed_count[call.data[:length]] += 1
+
+        # the same arguments TeleBot would pass to the handler registered on its own
+        kwargs = {key: value for key, value in (data or {}).items() if key in node.params}
+        if 'bot' in node.params:
+            kwargs['bot'] = bot
+        return node.handler(call, **kwargs)
+
+    async def dispatch_async(self, call: CallbackQuery, data: Optional[dict] = None,
+                             bot: Optional['AsyncTeleBot'] = None):
+        return await self.dispatch(call, data, bot)
+
+    def install(self, bot: TeleBot):
+        """
+        Registers the router as a single callback query handler taking only the callbacks it has a handler for,
+        so the handlers registered after it, e.g. the unhandled callbacks one, get the rest.
+        """
+        bot.register_callback_query_handler(self.dispatch, func=self.matches, pass_bot=True)
+        bot.callback_router = self
+
+    def install_async(self, bot: 'AsyncTeleBot'):
+        """
+        Registers the router on AsyncTeleBot as install does, all its handlers being coroutine functions.
+        """
+        bot.register_callback_query_handler(self.dispatch_async, func=self.matches, pass_bot=True)
+        bot.callback_router = self
+
+    def get_metrics(self) -> Dict[str, object]:
+        """
+        Returns the number of the registered prefixes and the callbacks routed to each one.
+        """
+        return {'prefixes': len(self.prefixes), 'routed': dict(self.routed_count)}
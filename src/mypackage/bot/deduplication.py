@@ -0,0 +1,190 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from telebot import TeleBot
+from telebot.types import Update
+
+from ..config.models import BotConfig
+
+# Telegram picks the next update id at random after a week without updates
+SEQUENCE_RESET_TIME = 7 * 86400
+
+
+class UpdateIdWindow:
+    """
+    Sliding window of the update ids processed recently, a ring of bits indexed by the update id.
+
+    Telegram numbers the updates of a bot in sequence, so the window follows the highest id seen and only
+    the ids within the size below it are told apart, the older ones are taken as replays. Checking an id
+    is O(1), moving the window clears the bits of the ids it passed, once each.
+    """
+
+    def __init__(self, size: int = 100000, reset_time: float = SEQUENCE_RESET_TIME):
+        self.size = size
+        self.reset_time = reset_time
+        self._bits = bytearray((size + 7) // 8)
+        self._max_id: Optional[int] = None
+        self._updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def _has(self, update_id: int) -> bool:
+        position = update_id % self.size
+        return bool(self._bits[position >> 3] & (1 << (position & 7)))
+
+    def _set(self, update_id: int, value: bool):
+        position = update_id % self.size
+        if value:
+            self._bits[position >> 3] |= 1 << (position & 7)
+        else:
+            self._bits[position >> 3] &= ~(1 << (position & 7)) & 0xFF
+
+    def __contains__(self, update_id: int) -> bool:
+        with self._lock:
+            if self._max_id is None or time.monotonic() - self._updated_at > self.reset_time:
+                return False
+            if update_id > self._max_id:
+                return False
+            return update_id <= self._max_id - self.size or self._has(update_id)
+
+    def add(self, update_id: int) -> bool:
+        """
+        Marks the update id as processed.
+
+        Returns:
+            bool: False if it was processed before or is older than the window, thus the update is a duplicate.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._max_id is None or now - self._updated_at > self.reset_time:
+                # a new sequence
+                self._bits = bytearray(len(self._bits))
+                self._max_id = update_id
+            elif update_id > self._max_id:
+                if update_id - self._max_id >= self.size:
+                    self._bits = bytearray(len(self._bits))
+                else:
+                    for passed_id in range(self._max_id + 1, update_id + 1):
+                        self._set(passed_id, False)
+                self._max_id = update_id
+            elif update_id <= self._max_id - self.size or self._has(update_id):
+                return False
+
+            self._updated_at = now
+            self._set(update_id, True)
+            return True
+
+
+class UpdateDeduplicator:
+    """
+    Drops the updates processed already, e.g. delivered again by Telegram after a webhook timeout
+    or fetched again by the polling restarted without dropping the pending ones.
+
+    The ids are marked in the local window, or in Redis if set, with the window as the fallback, so the ids
+    are shared by all the processes of the bot. A Redis id is a key set only if it doesn't exist, expiring after
+    the ttl, so a check is a single O(1) round trip.
+    """
+
+    def __init__(self, window: UpdateIdWindow, redis=None, prefix: str = 'telebot_', ttl: int = 86400,
+                 logger: Optional[logging.Logger] = None):
+        self.window = window
+        self.redis = redis
+        self.prefix = f"{prefix}update_"
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger(__name__)
+        self.duplicates_count = 0
+
+    def was_processed(self, update_id: int) -> bool:
+        """
+        Whether the update has been marked in the local window, without marking it.
+        """
+        return update_id in self.window
+
+    def filter(self, updates: List[Update]) -> List[Update]:
+        """
+        Marks the updates as processed and returns the ones that weren't processed before.
+        """
+        is_new = [self.window.add(update.update_id) for update in updates]
+        if self.redis is not None:
+            from redis.exceptions import RedisError
+
+            try:
+                with self.redis.pipeline(transaction=False) as pipeline:
+                    for update in updates:
+                        pipeline.set(f"{self.prefix}{update.update_id}", 1, nx=True, ex=self.ttl)
+                    # the local window only knows the updates of this process
+                    is_new = [bool(result) for result in pipeline.execute()]
+            except RedisError as e:
+                self.logger.warning(f"Redis update ids are unavailable, using the local window: {e}")
+
+        new_updates = [update for update, new in zip(updates, is_new) if new]
+        if len(new_updates) < len(updates):
+            self.duplicates_count += len(updates) - len(new_updates)
+            self.logger.info(f"Dropped {len(updates) - len(new_updates)} duplicate updates")
+        return new_updates
+
+    def install(self, bot: TeleBot):
+        """
+        Filters the updates passed to the bot, both by the polling and by the webhook.
+        """
+        process_new_updates = bot.process_new_updates
+
+        @functools.wraps(process_new_updates)
+        def deduplicated(updates: List[Update]):
+            updates = self.filter(updates)
+            if updates:
+                process_new_updates(updates)
+
+        bot.process_new_updates = deduplicated
+        bot.update_deduplicator = self
+
+    def install_async(self, bot, executor):
+        """
+        Filters the updates passed to AsyncTeleBot, checked on the executor as Redis blocks.
+        """
+        process_new_updates = bot.process_new_updates
+
+        @functools.wraps(process_new_updates)
+        async def deduplicated(updates: List[Update]):
+            updates = await asyncio.get_running_loop().run_in_executor(executor, self.filter, updates)
+            if updates:
+                await process_new_updates(updates)
+
+        bot.process_new_updates = deduplicated
+        bot.update_deduplicator = self
+
+    def get_metrics(self) -> Dict[str, int]:
+        return {'duplicates': self.duplicates_count}
+
+
+def setup_update_deduplicator(bot_config: BotConfig, logger: logging.Logger) -> UpdateDeduplicator:
+    deduplication_config = bot_config.deduplication
+    if deduplication_config is None:
+        return UpdateDeduplicator(UpdateIdWindow(), logger=logger)
+
+    window = UpdateIdWindow(deduplication_config.window)
+    if deduplication_config.type == 'memory':
+        return UpdateDeduplicator(window, logger=logger)
+
+    # the ids live next to the states, thus the state storage connection settings are reused
+    state_storage_config = bot_config.state_storage
+    if state_storage_config is None or state_storage_config.redis is None:
+        raise ValueError('state_storage.redis is required if deduplication.type is "redis"')
+    try:
+        from redis import Redis
+    except ImportError:
+        raise ImportError("Please install redis using `pip install redis`")
+
+    redis_config = state_storage_config.redis
+    # the ids are per bot, as several bots may share the Redis
+    bot_id = bot_config.token.split(':')[0]
+    return UpdateDeduplicator(
+        window,
+        Redis(host=redis_config.host, port=redis_config.port, db=redis_config.db, password=redis_config.password),
+        prefix=f"{redis_config.prefix}{bot_id}_",
+        ttl=deduplication_config.ttl,
+        logger=logger,
+    )
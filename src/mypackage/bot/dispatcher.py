@@ -0,0 +1,137 @@
+import logging
+import queue
+import threading
+from typing import Dict, List, Optional
+
+from telebot import TeleBot
+from telebot.types import Update
+
+# the update fields whose objects carry the chat, in the order of the lookup
+_CHAT_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'business_message',
+                'edited_business_message', 'my_chat_member', 'chat_member', 'chat_join_request',
+                'message_reaction', 'message_reaction_count', 'chat_boost', 'removed_chat_boost')
+# the update fields whose objects only carry the user
+_USER_FIELDS = ('callback_query', 'inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+                'poll_answer', 'purchased_paid_media')
+
+
+def get_update_shard_key(update: Update) -> int:
+    """
+    Returns the chat id of the update, or the user id if the update has no chat, or the update id otherwise.
+    """
+    for field in _CHAT_FIELDS:
+        obj = getattr(update, field, None)
+        if obj is not None and getattr(obj, 'chat', None) is not None:
+            return obj.chat.id
+
+    callback_query = update.callback_query
+    if callback_query is not None and callback_query.message is not None:
+        return callback_query.message.chat.id
+
+    for field in _USER_FIELDS:
+        obj = getattr(update, field, None)
+        user = getattr(obj, 'from_user', None) or getattr(obj, 'user', None)
+        if user is not None:
+            return user.id
+
+    return update.update_id
+
+
+def get_update_json_shard_key(update_json: dict) -> int:
+    """
+    Returns the same key as get_update_shard_key for the update not parsed yet.
+    """
+    for field in _CHAT_FIELDS:
+        obj = update_json.get(field)
+        if obj is not None and obj.get('chat') is not None:
+            return obj['chat']['id']
+
+    callback_query = update_json.get('callback_query')
+    if callback_query is not None and callback_query.get('message') is not None:
+        return callback_query['message']['chat']['id']
+
+    for field in _USER_FIELDS:
+        obj = update_json.get(field)
+        user = obj.get('from') or obj.get('user') if obj is not None else None
+        if user is not None:
+            return user['id']
+
+    return update_json['update_id']
+
+
+class ShardedTeleBot(TeleBot):
+    """
+    TeleBot processing the updates on worker threads sharded by chat id.
+
+    Every chat is always handled by the same worker, so the updates of a user are processed one by one
+    in the order they came, while the different users are processed in parallel. The queues are bounded,
+    thus a full queue blocks the polling loop or the webhook request until its worker catches up.
+    """
+
+    def __init__(self, *args, workers: int = 8, queue_size: int = 100, logger: Optional[logging.Logger] = None,
+                 **kwargs):
+        # the handlers run on the shard workers, the TeleBot thread pool would lose the order of the updates
+        kwargs['threaded'] = False
+        super().__init__(*args, **kwargs)
+
+        self.shard_logger = logger or logging.getLogger(__name__)
+        self.shards: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.dispatched_count = [0] * workers
+        self.processed_count = [0] * workers
+        self.max_depths = [0] * workers
+
+        self.workers = [threading.Thread(target=self._process_shard, args=(shard_id,),
+                                         name=f"update_shard_{shard_id}", daemon=True)
+                        for shard_id in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def process_new_updates(self, updates: List[Update]):
+        for update in updates:
+            shard_id = get_update_shard_key(update) % len(self.shards)
+            shard = self.shards[shard_id]
+            if shard.full():
+                self.shard_logger.warning(f"Update shard {shard_id} is full, waiting for its worker")
+            shard.put(update)
+
+            self.dispatched_count[shard_id] += 1
+            self.max_depths[shard_id] = max(self.max_depths[shard_id], shard.qsize())
+
+    def _process_shard(self, shard_id: int):
+        shard = self.shards[shard_id]
+        while True:
+            update = shard.get()
+            if update is None:
+                break
+            try:
+                # the updates are passed one by one, as TeleBot would handle a batch grouped by the update type
+                super().process_new_updates([update])
+            except Exception as e:
+                self.shard_logger.error(f"Exception while processing update {update.update_id}: {e}")
+            finally:
+                self.processed_count[shard_id] += 1
+
+    @property
+    def queue_depths(self) -> List[int]:
+        return [shard.qsize() for shard in self.shards]
+
+    def get_metrics(self) -> Dict[str, object]:
+        """
+        Returns the current depth, the highest depth seen and the update counters of every shard queue.
+        """
+        return {
+            'queue_depths': self.queue_depths,
+            'max_queue_depths': list(self.max_depths),
+            'queue_size': self.shards[0].maxsize,
+            'dispatched': list(self.dispatched_count),
+            'processed': list(self.processed_count),
+        }
+
+    def stop_workers(self, timeout: Optional[float] = None):
+        """
+        Lets the workers process the already queued updates and stops them.
+        """
+        for shard in self.shards:
+            shard.put(None)
+        for worker in self.workers:
+            worker.join(timeout)
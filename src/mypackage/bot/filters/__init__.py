@@ -1,12 +1,11 @@
 from typing import List
 
 from telebot import TeleBot
-from telebot.custom_filters import StateFilter
-
 
 from .callback_data import CallbackDataFilter, CallbackDataPrefixFilter, CallbackDataPaginationFilter
 from .text import TextEqualsFilter
 from .roles import IsOwnerFilter, IsAdminFilter
+from .state import StateFilter, AsyncStateFilter
 
 
 def add_custom_filters(bot: TeleBot, owner_tg_id: int, admins: List[int]):
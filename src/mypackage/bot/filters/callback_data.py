@@ -32,8 +32,8 @@ class CallbackDataPrefixFilter(AdvancedCustomFilter):
             # exact match with any of the texts
             return message.data in text
         elif isinstance(text, str):
-            # exact match with the text
-            return message.data.startswith(text) and text in message.data
+            # the data starts with the text
+            return message.data.startswith(text)
         else:
             # unexpected type
             return False
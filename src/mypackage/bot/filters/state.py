@@ -0,0 +1,55 @@
+from typing import TYPE_CHECKING, Union
+
+from telebot import TeleBot, asyncio_filters
+from telebot.custom_filters import AdvancedCustomFilter
+from telebot.handler_backends import State
+from telebot.types import Message, CallbackQuery
+
+if TYPE_CHECKING:
+    # imports aiohttp, which is only required by the async runtime
+    from telebot.async_telebot import AsyncTeleBot
+
+
+class StateFilter(AdvancedCustomFilter):
+    key = 'state'
+
+    def __init__(self, bot: TeleBot):
+        self.bot = bot
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    # message is an update, text is a value passed to the filter on handler registration
+    def check(self, message: Union[Message, CallbackQuery], text: Union[str, State, list]):
+        # the state is looked up in the storage once per update and then reused by the other state handlers
+        if not hasattr(message, 'cached_state'):
+            chat = message.message.chat if isinstance(message, CallbackQuery) else message.chat
+            message.cached_state = self.bot.get_state(message.from_user.id, chat.id)
+        user_state = message.cached_state
+
+        states = text if isinstance(text, list) else [text]
+        states = [state.name if isinstance(state, State) else state for state in states]
+        if "*" in states:
+            return user_state is not None
+        return user_state in states
+
+
+class AsyncStateFilter(asyncio_filters.AdvancedCustomFilter):
+    """
+    StateFilter of the async runtime, looking the state up in the async storage once per update as well.
+    """
+    key = 'state'
+
+    def __init__(self, bot: 'AsyncTeleBot'):
+        self.bot = bot
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def check(self, message: Union[Message, CallbackQuery], text: Union[str, State, list]):
+        if not hasattr(message, 'cached_state'):
+            chat = message.message.chat if isinstance(message, CallbackQuery) else message.chat
+            message.cached_state = await self.bot.get_state(message.from_user.id, chat.id)
+        user_state = message.cached_state
+
+        states = text if isinstance(text, list) else [text]
+        states = [state.name if isinstance(state, State) else state for state in states]
+        if "*" in states:
+            return user_state is not None
+        return user_state in states
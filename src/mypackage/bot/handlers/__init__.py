@@ -1,20 +1,36 @@
 from telebot import TeleBot
 
+from ..aio import SyncBotBridge
+from ..callback_router import CallbackRouter
 from ...config.models import ButtonsConfig
 
 from . import (
     basic_commands,
     unhandled, calculations,
-    admin_menu
+    admin_menu, async_calculations
 )
 
 
 def register_handlers(bot: TeleBot, buttons: ButtonsConfig):
     # TODO: register all handlers here
+    # the callbacks are routed by the longest prefix of their data, whatever order the prefixes are added in
+    callback_router = CallbackRouter()
     basic_commands.register_handlers(bot, buttons)
-    calculations.register_handlers(bot)
-    admin_menu.register_handlers(bot)
+    calculations.register_handlers(bot, callback_router)
+    admin_menu.register_handlers(bot, callback_router)
+    callback_router.install(bot)
     print("tg handlers ready!")
 
     # TODO: register all other handlers before this line
     # unhandled.register_handlers(bot)
+
+
+def register_async_handlers(bridge: SyncBotBridge, buttons: ButtonsConfig):
+    # the calculation flow runs on the loop, the commands and the admin menu on the workers of the bridge,
+    # all the callbacks being routed by the same router in the order of register_handlers
+    callback_router = CallbackRouter()
+    basic_commands.register_handlers(bridge, buttons)
+    async_calculations.register_handlers(bridge.bot, callback_router)
+    admin_menu.register_handlers(bridge, bridge.blocking_callback_router(callback_router))
+    callback_router.install_async(bridge.bot)
+    print("tg handlers ready!")
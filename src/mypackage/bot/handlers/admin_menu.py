@@ -7,6 +7,9 @@ from telebot import TeleBot
 from telebot.types import Message, CallbackQuery
 
 from .. import keyboards, texts
+from ..callback_answers import CallbackAnswerer
+from ..callback_router import CallbackRouter
+from ..states import AdminStates
 from ..texts import main_menu, admin_panel
 from ..utils import dummy_true
 from ...bot import GoogleSheetAPI, GoogleMapsAPI
@@ -24,13 +27,14 @@ def callback_debug(
         buttons: ButtonsConfig,
         google_sheet_api: GoogleSheetAPI,
         google_maps_api: GoogleMapsAPI,
+        callback_answers: CallbackAnswerer,
         db_adapter: DBAdapter,
         logger: Logger,
         **kwargs):
     print("--------------------- DEBUG ---------------------")
     print(f"callback_data = {call.data}")
     print("-------------------------------------------------")
-    print(bot.answer_callback_query(call, call.data, show_alert=True))
+    print(callback_answers.answer(call.id, call.data, show_alert=True))
 
 
 def send_admin_panel(
@@ -247,10 +251,9 @@ def choose_user(
         reply_markup=keyboards.empty_inline()
     )
     bot.send_message(call.message.chat.id, msg, reply_markup=keyboards.remove_reply())
-    bot.register_next_step_handler(call.message, set_discount, bot=bot, buttons=buttons,
-                                   google_sheet_api=google_sheet_api, google_maps_api=google_maps_api,
-                                   db_adapter=db_adapter, logger=logger, user_id=tg_user_id,
-                                   producer_title=producer_title)
+    bot.set_state(call.from_user.id, AdminStates.discount, call.message.chat.id)
+    bot.add_data(call.from_user.id, call.message.chat.id, discount_tg_user_id=tg_user_id,
+                 discount_producer_title=producer_title)
 
 
 def set_discount(
@@ -261,11 +264,16 @@ def set_discount(
         google_maps_api: GoogleMapsAPI,
         db_adapter: DBAdapter,
         logger: logging.Logger,
-        user_id: int,
-        producer_title: str,
         **kwargs):
     print('-------------------')
     print('/set_discount')
+    with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+        user_id = data.get('discount_tg_user_id')
+        producer_title = data.get('discount_producer_title')
+    bot.delete_state(message.from_user.id, message.chat.id)
+    if user_id is None or not message.text:
+        return
+
     print(message.text)
     discount_parts = message.text.split(",")
     print(discount_parts)
@@ -305,7 +313,7 @@ def set_discount(
                          reply_markup=keyboards.admin_panel_keyboard())
 
 
-def register_handlers(bot: TeleBot):
+def register_handlers(bot: TeleBot, callback_router: CallbackRouter):
     # bot.register_callback_query_handler(callback_debug, func=dummy_true, pass_bot=True)  # DEBUG
 
     bot.register_message_handler(send_admin_panel, commands=['admin_panel'], is_admin=True, pass_bot=True)
@@ -315,10 +323,8 @@ def register_handlers(bot: TeleBot):
                                  is_admin=True, pass_bot=True)
     bot.register_message_handler(send_producer_list, text_equals=admin_panel.users_discount_button,
                                  is_admin=True, pass_bot=True)
-    bot.register_callback_query_handler(back_to_producer_list, func=dummy_true,
-                                        prefix="user_back", pass_bot=True)
-    bot.register_callback_query_handler(send_user_discount_list, func=dummy_true,
-                                        prefix="discount_producer_", pass_bot=True)
-    bot.register_callback_query_handler(edit_user_discount_list, func=dummy_true,
-                                        pagination_prefix="user_page", pass_bot=True)
-    bot.register_callback_query_handler(choose_user, func=dummy_true, prefix="user_", pass_bot=True)
+    callback_router.add("user_back", back_to_producer_list)
+    callback_router.add("discount_producer_", send_user_discount_list)
+    callback_router.add("user_page#", edit_user_discount_list)
+    callback_router.add("user_", choose_user)
+    bot.register_message_handler(set_discount, state=AdminStates.discount, is_admin=True, pass_bot=True)
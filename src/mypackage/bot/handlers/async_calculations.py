@@ -0,0 +1,383 @@
+import asyncio
+from logging import Logger
+from typing import TYPE_CHECKING
+
+from telebot.types import Message, CallbackQuery
+
+from . import calculation_steps as steps
+from .. import texts, keyboards
+from ..api.google_maps_api import AsyncGoogleMapsAPI
+from ..callback_router import CallbackRouter
+from ..notifications import OrderNotifier
+from ..pricing import AsyncQuoteEngine
+from ..response import AsyncResponseBuilder
+from ..sessions import AsyncOrderSessionStore
+from ..states import CalculationStates
+from ..texts import main_menu
+from ...bot import GoogleSheetAPI
+from ...config.models import ButtonsConfig
+from ...db import AsyncDBAdapter, OrderWriter
+from ...db.dto import OrderDTO
+
+if TYPE_CHECKING:
+    # imports aiohttp, which is only required by the async runtime
+    from telebot.async_telebot import AsyncTeleBot
+
+# The calculation flow of the async runtime: the steps of the calculations handlers, waiting for Google,
+# the database, the order sessions and Telegram on the event loop
+
+
+async def cancel_calculation(bot: 'AsyncTeleBot', user_id: int, chat_id: int, quote_engine: AsyncQuoteEngine,
+                             order_sessions: AsyncOrderSessionStore):
+    """
+    Leaves the calculation of the user: the state, the lookups in progress and the order session are dropped.
+    """
+    await bot.delete_state(user_id, chat_id)
+    quote_engine.flows.cancel(user_id)
+    await order_sessions.clear(user_id)
+
+
+async def refresh(
+        message: Message,
+        bot: 'AsyncTeleBot',
+        google_sheet_api: GoogleSheetAPI):
+    # the Google Sheets client is blocking, and the refresh is a rare admin command
+    await asyncio.to_thread(google_sheet_api.refresh)
+    await asyncio.to_thread(google_sheet_api.check_producers)
+    await bot.send_message(message.chat.id, "Дані оновлено!")
+
+
+async def get_dispatch_point(
+        message: Message,
+        bot: 'AsyncTeleBot',
+        quote_engine: AsyncQuoteEngine,
+        order_sessions: AsyncOrderSessionStore,
+        response: AsyncResponseBuilder,
+        db_adapter: AsyncDBAdapter,
+        **kwargs):
+    # a new flow cancels the lookups still running for the previous one
+    quote_engine.flows.start(message.from_user.id)
+    await order_sessions.clear(message.from_user.id)
+
+    order_dto = OrderDTO(await db_adapter.get_user_with_discounts(message.from_user.id))
+    await order_sessions.save_order(message.from_user.id, order_dto)
+    response.send_message(message.chat.id, **steps.payment_type_reply(order_dto.payment_type).kwargs)
+    response.send_message(message.chat.id, **steps.location_request_reply().kwargs)
+    await bot.set_state(message.from_user.id, CalculationStates.location, message.chat.id)
+
+
+async def choose_payment_type(
+        call: CallbackQuery,
+        bot: 'AsyncTeleBot',
+        order_sessions: AsyncOrderSessionStore,
+        **kwargs):
+    prefix = "payment_"
+    order_dto = await order_sessions.get_order(call.from_user.id)
+    if order_dto is None:
+        return
+    reply = steps.switch_payment_type(order_dto, call.data[len(prefix):])
+    await order_sessions.save_order(call.from_user.id, order_dto)
+    await bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.id, **reply.kwargs)
+
+
+async def get_user_location(
+        message: Message,
+        bot: 'AsyncTeleBot',
+        google_maps_api: AsyncGoogleMapsAPI,
+        quote_engine: AsyncQuoteEngine,
+        order_sessions: AsyncOrderSessionStore,
+        **kwargs):
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    order_dto = await order_sessions.get_order(message.from_user.id)
+    if order_dto is None:
+        return
+    if message.text == main_menu.cancel_button:
+        quote_engine.flows.cancel(message.from_user.id)
+        await bot.send_message(message.chat.id, **steps.main_menu_reply(order_dto.user.is_admin).kwargs)
+        await order_sessions.clear(message.from_user.id)
+        return
+
+    flow = quote_engine.flows.current(message.from_user.id)
+
+    if message.text:
+        user_location = await google_maps_api.from_address(message.text)
+    else:
+        user_location = await google_maps_api.from_coords((message.location.latitude, message.location.longitude))
+    if flow.cancelled:
+        # the user started a new flow or cancelled this one while the location was looked up
+        return
+    if not user_location:
+        await bot.send_message(message.chat.id, **steps.main_menu_reply(order_dto.user.is_admin,
+                                                                        texts.geopos_not_found).kwargs)
+        return
+
+    reply = steps.set_user_location(order_dto, user_location, message.text)
+    await order_sessions.save_order(message.from_user.id, order_dto)
+    await bot.send_message(message.chat.id, **reply.kwargs)
+
+
+async def is_correct_geo(
+        call: CallbackQuery,
+        bot: 'AsyncTeleBot',
+        quote_engine: AsyncQuoteEngine,
+        order_sessions: AsyncOrderSessionStore,
+        response: AsyncResponseBuilder,
+        db_adapter: AsyncDBAdapter,
+        **kwargs):
+    prefix = "geo_"
+    answer = call.data[len(prefix):]
+    if answer == steps.GEO_CONFIRM:
+        await bot.edit_message_text(call.message.text + "\n\n🕑", chat_id=call.message.chat.id,
+                                    message_id=call.message.id)
+        await get_closest_dispatch_point(call.message, bot=bot, quote_engine=quote_engine,
+                                         order_sessions=order_sessions, response=response, db_adapter=db_adapter,
+                                         user_id=call.from_user.id)
+    else:
+        await bot.edit_message_text(call.message.text + "\n\n❌", chat_id=call.message.chat.id,
+                                    message_id=call.message.id)
+        await bot.send_message(call.message.chat.id, **steps.location_request_reply().kwargs)
+        await bot.set_state(call.from_user.id, CalculationStates.location, call.message.chat.id)
+
+
+async def get_closest_dispatch_point(
+        message: Message,
+        bot: 'AsyncTeleBot',
+        quote_engine: AsyncQuoteEngine,
+        order_sessions: AsyncOrderSessionStore,
+        response: AsyncResponseBuilder,
+        db_adapter: AsyncDBAdapter,
+        user_id: int,
+        **kwargs):
+    order_dto = await order_sessions.get_order(user_id)
+    if order_dto is None:
+        return
+
+    closest_dispatch_points_dict = await quote_engine.closest_dispatch_points(order_dto.user_location.coords,
+                                                                              quote_engine.flows.current(user_id))
+    if closest_dispatch_points_dict is None:
+        # the flow is cancelled, thus the distances are dropped instead of being saved into the new one
+        return
+    await order_sessions.save_closest_dispatch_points(user_id, closest_dispatch_points_dict)
+
+    best_producer_title = quote_engine.best_producer(closest_dispatch_points_dict, order_dto.user)
+
+    if best_producer_title is None:
+        response.edit_message_text(message.text + "\n\n❌", chat_id=message.chat.id, message_id=message.id)
+        for reply in steps.too_far_replies():
+            response.send_message(message.chat.id, **reply.kwargs)
+        await bot.set_state(user_id, CalculationStates.location, message.chat.id)
+        return
+
+    response.edit_message_text(message.text + "\n\n✅", chat_id=message.chat.id, message_id=message.id)
+    producer_dtos = await db_adapter.get_all_producers()
+    response.send_message(message.chat.id, **steps.producers_reply(producer_dtos, best_producer_title).kwargs)
+
+
+async def choose_concrete_producer(
+        call: CallbackQuery,
+        google_sheet_api: GoogleSheetAPI,
+        order_sessions: AsyncOrderSessionStore,
+        response: AsyncResponseBuilder,
+        db_adapter: AsyncDBAdapter,
+        **kwargs):
+    prefix = "producer_"
+    producer_id = int(call.data[len(prefix):])
+
+    order_dto, closest_dispatch_points = await asyncio.gather(
+        order_sessions.get_order(call.from_user.id),
+        order_sessions.get_closest_dispatch_points(call.from_user.id))
+    if order_dto is None or closest_dispatch_points is None:
+        return
+
+    producer_dto = await db_adapter.get_producer_by_id(producer_id)
+    replies = steps.choose_producer(order_dto, producer_dto.title, closest_dispatch_points, google_sheet_api)
+    await order_sessions.save_order(call.from_user.id, order_dto)
+    for reply in replies:
+        response.send_message(call.message.chat.id, **reply.kwargs)
+
+
+async def fold_or_unfold_instruction(
+        call: CallbackQuery,
+        bot: 'AsyncTeleBot',
+        **kwargs):
+    prefix = "instruction_"
+    reply = steps.instruction_reply(unfolded=call.data[len(prefix):] == steps.INSTRUCTION_UNFOLD)
+    await bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.id, **reply.kwargs)
+
+
+async def concrete_type_button_handler(
+        call: CallbackQuery,
+        bot: 'AsyncTeleBot',
+        google_sheet_api: GoogleSheetAPI,
+        quote_engine: AsyncQuoteEngine,
+        order_sessions: AsyncOrderSessionStore,
+        **kwargs):
+    prefix = "type_"
+    order_dto = await order_sessions.get_order(call.from_user.id)
+    if order_dto is None:
+        return
+    reply = steps.choose_concrete_type(order_dto, call.data[len(prefix):], google_sheet_api, quote_engine)
+    await order_sessions.save_order(call.from_user.id, order_dto)
+    await bot.send_message(call.message.chat.id, **reply.kwargs)
+
+
+async def concrete_button_handler(
+        call: CallbackQuery,
+        bot: 'AsyncTeleBot',
+        google_sheet_api: GoogleSheetAPI,
+        order_sessions: AsyncOrderSessionStore,
+        response: AsyncResponseBuilder,
+        **kwargs):
+    prefix = "concrete_"
+    order_dto = await order_sessions.get_order(call.from_user.id)
+    if order_dto is None:
+        return
+    replies = steps.choose_concrete(order_dto, call.data[len(prefix):], google_sheet_api)
+    await order_sessions.save_order(call.from_user.id, order_dto)
+    for reply in replies:
+        response.send_message(call.message.chat.id, **reply.kwargs)
+    await bot.set_state(call.from_user.id, CalculationStates.amount, call.message.chat.id)
+
+
+async def get_concrete_amount(
+        message: Message,
+        bot: 'AsyncTeleBot',
+        buttons: ButtonsConfig,
+        google_sheet_api: GoogleSheetAPI,
+        quote_engine: AsyncQuoteEngine,
+        order_sessions: AsyncOrderSessionStore,
+        **kwargs):
+    order_dto = await order_sessions.get_order(message.from_user.id)
+    if order_dto is None:
+        await bot.delete_state(message.from_user.id, message.chat.id)
+        return
+    if steps.leaves_amount_step(message.text, buttons):
+        await cancel_calculation(bot, message.from_user.id, message.chat.id, quote_engine, order_sessions)
+        await bot.send_message(message.chat.id, **steps.main_menu_reply(order_dto.user.is_admin).kwargs)
+        return
+    if not message.text or not message.text.isdigit():
+        # the state is kept, so the next message is the amount again
+        await bot.send_message(message.chat.id, **steps.not_a_number_reply().kwargs)
+        return
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    reply = steps.set_amount(order_dto, int(message.text), google_sheet_api)
+    await order_sessions.save_order(message.from_user.id, order_dto)
+    await bot.send_message(message.chat.id, **reply.kwargs)
+
+
+async def confirm_order(
+        call: CallbackQuery,
+        bot: 'AsyncTeleBot',
+        order_sessions: AsyncOrderSessionStore,
+        order_notifier: OrderNotifier,
+        order_writer: OrderWriter,
+        **kwargs):
+    prefix = "order_"
+    answer = call.data[len(prefix):]
+
+    order_dto = await order_sessions.get_order(call.from_user.id)
+    if order_dto is None:
+        return
+
+    if answer == steps.ORDER_PLACE:
+        await bot.edit_message_reply_markup(chat_id=call.message.chat.id, message_id=call.message.message_id,
+                                            reply_markup=steps.order_confirmation_keyboard())
+        return
+    if answer != steps.ORDER_CANCEL:
+        await bot.edit_message_reply_markup(chat_id=call.message.chat.id, message_id=call.message.message_id,
+                                            reply_markup=keyboards.empty_inline())
+    # both only enqueue the order, the notifications and the write happen in the background
+    reply = steps.finish_order(order_dto, answer, order_notifier, order_writer)
+    await bot.send_message(call.message.chat.id, **reply.kwargs)
+
+
+async def get_price_sheet(
+        message: Message,
+        bot: 'AsyncTeleBot',
+        quote_engine: AsyncQuoteEngine,
+        order_sessions: AsyncOrderSessionStore,
+        **kwargs):
+    quote_engine.flows.start(message.from_user.id)
+    await order_sessions.clear(message.from_user.id)
+    await bot.send_message(message.chat.id, **steps.location_request_reply().kwargs)
+    await bot.set_state(message.from_user.id, CalculationStates.price_sheet_location, message.chat.id)
+
+
+async def send_price_sheet(
+        message: Message,
+        bot: 'AsyncTeleBot',
+        quote_engine: AsyncQuoteEngine,
+        db_adapter: AsyncDBAdapter,
+        logger: Logger,
+        **kwargs):
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    user_dto = await db_adapter.get_user_with_discounts(message.from_user.id)
+    if message.text == main_menu.cancel_button:
+        quote_engine.flows.cancel(message.from_user.id)
+        await bot.send_message(message.chat.id, **steps.main_menu_reply(user_dto.is_admin).kwargs)
+        return
+
+    flow = quote_engine.flows.current(message.from_user.id)
+    if message.text:
+        user_location = await quote_engine.locate(address=message.text, flow=flow)
+    elif message.location:
+        user_location = await quote_engine.locate(coords=(message.location.latitude, message.location.longitude),
+                                                  flow=flow)
+    else:
+        user_location = None
+
+    if flow.cancelled:
+        return
+    if not user_location:
+        await bot.send_message(message.chat.id,
+                               **steps.main_menu_reply(user_dto.is_admin, texts.geopos_not_found).kwargs)
+        return
+
+    # the whole table is calculated in a single pass, with the distances looked up once per producer
+    quote = await quote_engine.quote(user_location, user=user_dto, flow=flow)
+    if quote is None:
+        return
+    logger.debug(f"User {message.from_user.id} got the price sheet for {user_location.address}")
+    for reply in steps.price_sheet_replies(quote, user_dto.is_admin):
+        await bot.send_message(message.chat.id, **reply.kwargs)
+
+
+async def back_to_menu(
+        message: Message,
+        bot: 'AsyncTeleBot',
+        quote_engine: AsyncQuoteEngine,
+        order_sessions: AsyncOrderSessionStore,
+        db_adapter: AsyncDBAdapter,
+        **kwargs):
+    if message.text == main_menu.cancel_button:
+        await bot.delete_state(message.from_user.id, message.chat.id)
+        quote_engine.flows.cancel(message.from_user.id)
+        order_dto = await order_sessions.get_order(message.from_user.id)
+        if order_dto is not None:
+            await bot.send_message(message.chat.id, **steps.main_menu_reply(order_dto.user.is_admin).kwargs)
+            await order_sessions.clear(message.from_user.id)
+        else:
+            user_dto = await db_adapter.get_user(message.from_user.id)
+            await bot.send_message(message.chat.id, **steps.main_menu_reply(user_dto.is_admin).kwargs)
+
+
+def register_handlers(bot: 'AsyncTeleBot', callback_router: CallbackRouter):
+    # registered in the order of the calculations handlers, so the same update goes to the same step
+    bot.register_message_handler(get_user_location, state=CalculationStates.location,
+                                 content_types=['text', 'location'], pass_bot=True)
+    bot.register_message_handler(get_concrete_amount, state=CalculationStates.amount, pass_bot=True)
+    bot.register_message_handler(send_price_sheet, state=CalculationStates.price_sheet_location,
+                                 content_types=['text', 'location'], pass_bot=True)
+    bot.register_message_handler(get_dispatch_point, commands=['calculate'], is_admin=True, pass_bot=True)
+    bot.register_message_handler(refresh, commands=['refresh'], pass_bot=True)
+    bot.register_message_handler(get_dispatch_point, text_equals=main_menu.make_calculation_button, pass_bot=True)
+    bot.register_message_handler(get_price_sheet, commands=['prices'], pass_bot=True)
+    bot.register_message_handler(get_price_sheet, text_equals=main_menu.price_sheet_button, pass_bot=True)
+    bot.register_message_handler(back_to_menu, text_equals=main_menu.cancel_button, pass_bot=True)
+    callback_router.add("type_", concrete_type_button_handler)
+    callback_router.add("concrete_", concrete_button_handler)
+    callback_router.add("producer_", choose_concrete_producer)
+    callback_router.add("geo_", is_correct_geo)
+    callback_router.add("order_", confirm_order)
+    callback_router.add("instruction_", fold_or_unfold_instruction)
+    callback_router.add("payment_", choose_payment_type)
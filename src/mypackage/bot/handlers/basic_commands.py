@@ -4,7 +4,10 @@ from sqlalchemy.exc import IntegrityError
 from telebot import TeleBot
 from telebot.types import Message
 
+from .calculations import cancel_calculation
 from .. import keyboards
+from ..pricing import QuoteEngine
+from ..sessions import OrderSessionStore
 from ..texts.main_menu import welcome_message
 from ...config.models import MessagesConfig, ButtonsConfig
 from ...db import DBAdapter, DBError
@@ -23,9 +26,13 @@ def start_handler(
         messages: MessagesConfig,
         buttons: ButtonsConfig,
         db_adapter: DBAdapter,
+        quote_engine: QuoteEngine,
+        order_sessions: OrderSessionStore,
         logger: Logger,
         **kwargs):
     logger.debug(f"User {message.from_user.id} @{message.from_user.username} started the bot")
+    # /start always brings the user back to the main menu, whatever calculation was in progress
+    cancel_calculation(bot, message.from_user.id, message.chat.id, quote_engine, order_sessions)
 
     # bot.set_state(message.from_user.id, UnregisteredStates.started, message.chat.id)
 
@@ -0,0 +1,192 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from telebot.types import InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telebot.util import smart_split
+
+from .. import texts, keyboards, templates
+from ..api.google_sheet_api import GoogleSheetAPI
+from ..keyboards import create_inline_keyboard
+from ..notifications import OrderNotifier
+from ..pricing import QuoteEngine
+from ..texts import main_menu, admin_panel
+from ..utils import calculate_delivery_cost, calculate_concrete_cost
+from ...config.models import ButtonsConfig
+from ...db import OrderWriter
+from ...db.dto import OrderDTO, ProducerDTO, UserLocationDTO, DispatchPointDTO, DistanceDTO, QuoteDTO
+from ...money import apply_discount, format_uah
+
+# The steps of the calculation flow shared by the calculations handlers and their async version: each one updates
+# the order and builds the replies, the handlers only load and save the order session and send the replies
+
+# The texts of the main menu buttons, taken for leaving the calculation if sent instead of an answer
+MENU_TEXTS = frozenset((main_menu.make_calculation_button, main_menu.price_sheet_button, main_menu.admin_button,
+                        main_menu.cancel_button))
+
+GEO_CONFIRM = "Так"
+ORDER_PLACE, ORDER_CONFIRM, ORDER_CANCEL = "Замовити", "Підтвердити", "Скасувати"
+INSTRUCTION_UNFOLD, INSTRUCTION_FOLD = "Розгорнути", "Згорнути"
+
+
+@dataclass
+class Reply:
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup | ReplyKeyboardMarkup | ReplyKeyboardRemove] = None
+    parse_mode: Optional[str] = None
+
+    @property
+    def kwargs(self) -> dict:
+        """
+        The arguments of send_message and edit_message_text besides the chat and the message.
+        """
+        return {'text': self.text, 'reply_markup': self.reply_markup, 'parse_mode': self.parse_mode}
+
+
+def main_menu_reply(is_admin: bool, text: str = admin_panel.back_to_main_menu_message) -> Reply:
+    return Reply(text, keyboards.main_menu_keyboard(is_admin=is_admin))
+
+
+def location_request_reply() -> Reply:
+    return Reply(texts.get_location_message, keyboards.create_keyboard([main_menu.cancel_button]))
+
+
+def payment_type_reply(payment_type: str) -> Reply:
+    return Reply(f"{texts.payment_type}\n\n<i>Натисніть для зміни</i>",
+                 keyboards.create_inline_keyboard([payment_type], prefix="payment_"), "HTML")
+
+
+def switch_payment_type(order_dto: OrderDTO, shown_payment_type: str) -> Reply:
+    order_dto.payment_type = texts.cashless_payment if shown_payment_type == texts.cash_payment \
+        else texts.cash_payment
+    return payment_type_reply(order_dto.payment_type)
+
+
+def set_user_location(order_dto: OrderDTO, user_location: UserLocationDTO, address: Optional[str] = None) -> Reply:
+    """
+    Sets the location found for the address typed by the user, or for the location they sent, and asks to confirm it.
+    """
+    if address is not None:
+        user_location.address += f" ({address})"
+    order_dto.user_location = user_location
+    return Reply(f"{texts.is_user_location}\n\n{user_location.address}",
+                 keyboards.create_inline_keyboard([GEO_CONFIRM, "Спробувати ще раз"], "geo_"), "HTML")
+
+
+def too_far_replies() -> List[Reply]:
+    return [Reply(texts.user_location_too_far), location_request_reply()]
+
+
+def producers_reply(producer_dtos: List[ProducerDTO], best_producer_title: str) -> Reply:
+    titles = [f"{producer.title} {texts.best_option_emoji}" if producer.title == best_producer_title
+              else producer.title
+              for producer in producer_dtos]
+    return Reply(texts.choose_producer,
+                 keyboards.create_inline_keyboard(titles, prefix="producer_",
+                                                  callback_data=[str(producer.id) for producer in producer_dtos]))
+
+
+def choose_producer(order_dto: OrderDTO, producer_title: str,
+                    closest_dispatch_points: Dict[str, Tuple[DispatchPointDTO, DistanceDTO]],
+                    google_sheet_api: GoogleSheetAPI) -> List[Reply]:
+    dispatch_point, distance = closest_dispatch_points[producer_title]
+    order_dto.dispatch_point = dispatch_point
+    order_dto.producer = producer_title
+    order_dto.distance = distance
+
+    return [
+        Reply(texts.closest_point + f"<b>{dispatch_point.address}</b> "
+                                    f"<i>({int(distance.distance_metres / 1000)} км)</i>", parse_mode="HTML"),
+        instruction_reply(unfolded=False),
+        Reply(texts.choose_concrete_type,
+              create_inline_keyboard(google_sheet_api.concrete_data.concrete_type_titles, prefix="type_")),
+    ]
+
+
+def instruction_reply(unfolded: bool) -> Reply:
+    if unfolded:
+        return Reply(texts.concrete_instruction, create_inline_keyboard([INSTRUCTION_FOLD], prefix="instruction_"))
+    return Reply(texts.concrete_instruction_preview,
+                 create_inline_keyboard([INSTRUCTION_UNFOLD], prefix="instruction_"))
+
+
+def choose_concrete_type(order_dto: OrderDTO, concrete_type_title: str, google_sheet_api: GoogleSheetAPI,
+                         quote_engine: QuoteEngine) -> Reply:
+    concrete_type = concrete_type_title[:2]
+    delivery_price_list = google_sheet_api.get_delivery_price_list(concrete_type)
+    order_dto.delivery_price = calculate_delivery_cost(concrete_type, delivery_price_list,
+                                                       order_dto.distance.distance_metres)
+
+    prices = quote_engine.concrete_type_prices(order_dto.producer, concrete_type, order_dto.distance.distance_metres,
+                                               order_dto.user, order_dto.payment_type)
+    current_concrete_type = google_sheet_api.concrete_data.get_type(concrete_type_title)
+    return Reply(templates.render_concrete_type_prices(order_dto.payment_type, concrete_type_title, prices),
+                 create_inline_keyboard([concrete.title for concrete in current_concrete_type.concretes],
+                                        prefix="concrete_"),
+                 "HTML")
+
+
+def choose_concrete(order_dto: OrderDTO, concrete_title: str, google_sheet_api: GoogleSheetAPI) -> List[Reply]:
+    current_concrete = google_sheet_api.concrete_data.get_concrete(concrete_title)
+    order_dto.concrete = current_concrete
+
+    # the same kopiyka arithmetic as the concrete type prices, so both messages show the same price
+    price = (apply_discount(current_concrete.price, order_dto.concrete_discount)
+             + apply_discount(order_dto.delivery_price, order_dto.delivery_discount))
+    msg = f"Ви обрали: <b>{current_concrete.title}</b>\n"
+    msg += texts.cash_emoji if order_dto.payment_type == texts.cash_payment else texts.cashless_emoji
+    msg += f"Ціна за 1 м³: <b>{format_uah(price)} UAH</b>\n"
+    # sent as a single message with the price
+    return [Reply(msg, keyboards.remove_reply(), "HTML"), Reply("Скільки Вам потрібно м³?\nНапишіть число: ")]
+
+
+def leaves_amount_step(text: Optional[str], buttons: ButtonsConfig) -> bool:
+    """
+    Whether the message sent instead of the amount is a menu text or a command, which leave the calculation.
+    """
+    # the reply keyboard is hidden while the amount is asked, so the menu is brought back,
+    # instead of keeping the user in the state until a number is sent
+    return bool(text) and (text in MENU_TEXTS or text == buttons.help or text.startswith('/'))
+
+
+def not_a_number_reply() -> Reply:
+    return Reply("Введіть будь ласка тільки число!")
+
+
+def set_amount(order_dto: OrderDTO, amount: int, google_sheet_api: GoogleSheetAPI) -> Reply:
+    order_dto.amount = amount
+    order_dto.concrete_cost = calculate_concrete_cost(order_dto.concrete.price, order_dto.amount)
+    order_dto.delivery_cost = calculate_delivery_cost(
+        order_dto.concrete.type_,
+        price_list=google_sheet_api.get_delivery_price_list(order_dto.concrete.type_),
+        distance=order_dto.distance.distance_metres,
+        amount=order_dto.amount)
+
+    return Reply(templates.render_order_summary(order_dto),
+                 create_inline_keyboard([ORDER_PLACE, ORDER_CANCEL], prefix="order_"), "HTML")
+
+
+def order_confirmation_keyboard() -> InlineKeyboardMarkup:
+    return keyboards.create_inline_keyboard([ORDER_CONFIRM, ORDER_CANCEL], prefix="order_")
+
+
+def finish_order(order_dto: OrderDTO, answer: str, order_notifier: OrderNotifier, order_writer: OrderWriter) -> Reply:
+    """
+    Places the confirmed order, the notifications and the write happen in the background.
+    """
+    if answer == ORDER_CONFIRM:
+        msg = texts.order_confirmed
+        # rendered once and sent to the recipients in the background, the customer is answered right away
+        order_notifier.notify(templates.render_order(order_dto))
+        order_writer.add(order_dto)
+    elif answer == ORDER_CANCEL:
+        msg = texts.order_canceled
+    else:
+        msg = texts.unknown_error
+    return main_menu_reply(order_dto.user.is_admin, msg)
+
+
+def price_sheet_replies(quote: QuoteDTO, is_admin: bool) -> List[Reply]:
+    main_menu_keyboard = keyboards.main_menu_keyboard(is_admin=is_admin)
+    if quote.too_far:
+        return [Reply(texts.user_location_too_far, main_menu_keyboard)]
+    return [Reply(msg, main_menu_keyboard, "HTML") for msg in smart_split(templates.render_price_sheet(quote))]
@@ -4,6 +4,7 @@ from telebot.types import InlineKeyboardMarkup
 from telebot.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton
 from telebot.types import ReplyKeyboardRemove
 
+from .factory import KeyboardFactory, keyboard_factory, setup_keyboard_factory
 from ..texts import main_menu, admin_panel
 from ...db.dto import DispatchPointDTO
 
@@ -11,9 +12,11 @@ from ...db.dto import DispatchPointDTO
 # TODO: define all keyboards and/or keyboard builders here or in the submodules of this module
 
 
+@keyboard_factory.memoize
 def main_menu_keyboard(is_admin: bool = False):
     keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
     keyboard.add(KeyboardButton(main_menu.make_calculation_button))
+    keyboard.add(KeyboardButton(main_menu.price_sheet_button))
     if is_admin:
         keyboard.add(KeyboardButton(main_menu.admin_button))
     # keyboard.add(KeyboardButton("Кнопка 2"))
@@ -21,6 +24,7 @@ def main_menu_keyboard(is_admin: bool = False):
     return keyboard
 
 
+@keyboard_factory.memoize
 def admin_panel_keyboard():
     keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
     keyboard.add(KeyboardButton(admin_panel.make_mailing_button))
@@ -32,6 +36,7 @@ def admin_panel_keyboard():
     return keyboard
 
 
+@keyboard_factory.memoize
 def dispatch_points_keyboard(dispatch_points_list: Iterable[DispatchPointDTO]):
     keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
     for dp in dispatch_points_list:
@@ -39,6 +44,7 @@ def dispatch_points_keyboard(dispatch_points_list: Iterable[DispatchPointDTO]):
     return keyboard
 
 
+@keyboard_factory.memoize
 def create_inline_keyboard(buttons_list: Iterable, prefix="", callback_data: List = None):
     keyboard = InlineKeyboardMarkup()
     for i, button in enumerate(buttons_list):
@@ -48,6 +54,7 @@ def create_inline_keyboard(buttons_list: Iterable, prefix="", callback_data: Lis
     return keyboard
 
 
+@keyboard_factory.memoize
 def create_keyboard(buttons_list: Iterable):
     keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
     for button in buttons_list:
@@ -112,19 +119,23 @@ def create_inline_pagination_markup(
     return markup
 
 
+@keyboard_factory.memoize
 def help_reply_keyboard(help_btn: str):
     keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
     keyboard.add(KeyboardButton(help_btn))
     return keyboard
 
 
+@keyboard_factory.memoize
 def empty_inline():
     return InlineKeyboardMarkup()
 
 
+@keyboard_factory.memoize
 def empty_reply():
     return ReplyKeyboardMarkup()
 
 
+@keyboard_factory.memoize
 def remove_reply():
     return ReplyKeyboardRemove()
@@ -0,0 +1,103 @@
+import functools
+import threading
+from typing import Callable, Dict, Optional
+
+from telebot.types import JsonSerializable
+
+from ..cache import LRUCache
+from ...config.models import BotConfig
+
+
+class _SerializedMarkup:
+    """
+    Base of the memoized markups, serialized once and shared by all the messages they are sent with.
+    """
+
+    def to_json(self):
+        return self._serialized_json
+
+    def add(self, *args, **kwargs):
+        raise TypeError("The memoized keyboards are shared, build a new one to change it")
+
+    row = add
+
+
+_serialized_classes: Dict[type, type] = {}
+
+
+def _freeze(markup: JsonSerializable) -> JsonSerializable:
+    markup_class = type(markup)
+    serialized_class = _serialized_classes.get(markup_class)
+    if serialized_class is None:
+        serialized_class = _serialized_classes.setdefault(
+            markup_class, type(f"Serialized{markup_class.__name__}", (_SerializedMarkup, markup_class), {}))
+    markup._serialized_json = markup.to_json()
+    markup.__class__ = serialized_class
+    return markup
+
+
+def _freeze_argument(value):
+    # the lists and the generators are passed as tuples, so they are hashable and can be iterated again
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return value
+    return tuple(value)
+
+
+class KeyboardFactory:
+    """
+    Bounded cache of the keyboards, so each one is built and serialized once and not on every send.
+
+    The keyboards are keyed by the builder, its arguments and the catalog version, thus the ones listing
+    the catalog are built again after a refresh changed it, and the stale ones are evicted as the least used.
+    The cached markups can't be changed, the keyboards with arguments that can't be hashed aren't cached.
+    """
+
+    def __init__(self, max_size: int = 1024, version: Optional[Callable[[], int]] = None):
+        self._cache = LRUCache(max_size=max_size)
+        self._version = version
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_size: int, version: Optional[Callable[[], int]]):
+        self._cache = LRUCache(max_size=max_size)
+        self._version = version
+
+    def memoize(self, builder: Callable[..., JsonSerializable]) -> Callable[..., JsonSerializable]:
+        @functools.wraps(builder)
+        def memoized(*args, **kwargs):
+            args = tuple(_freeze_argument(arg) for arg in args)
+            kwargs = {name: _freeze_argument(value) for name, value in kwargs.items()}
+            version = self._version() if self._version is not None else 0
+            key = (builder.__name__, version, args, tuple(sorted(kwargs.items())))
+            try:
+                markup = self._cache.get(key)
+            except TypeError:
+                return builder(*args, **kwargs)
+
+            if markup is None:
+                markup = self._cache.get_or_set(key, lambda: _freeze(builder(*args, **kwargs)))
+                with self._lock:
+                    self.misses += 1
+            else:
+                with self._lock:
+                    self.hits += 1
+            return markup
+
+        return memoized
+
+    def get_metrics(self) -> Dict[str, int]:
+        """
+        Returns the number of the cached keyboards and of the cache hits and misses.
+        """
+        return {'size': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+# The factory of the keyboards module, configured once the catalog is set up
+keyboard_factory = KeyboardFactory()
+
+
+def setup_keyboard_factory(bot_config: BotConfig, version: Callable[[], int]) -> KeyboardFactory:
+    max_size = bot_config.keyboards.max_size if bot_config.keyboards else 1024
+    keyboard_factory.configure(max_size, version)
+    return keyboard_factory
@@ -0,0 +1,40 @@
+import functools
+import os
+
+from telebot import TeleBot, apihelper
+
+# Seconds to wait for a connection to a Local Bot API Server, which is on the same host or network
+LOCAL_CONNECT_TIMEOUT = 1.0
+
+
+def api_urls(telegram_api_url: str) -> tuple[str, str]:
+    """
+    Returns the method and the file url templates of apihelper for the Bot API server base url,
+    e.g. http://localhost:8081.
+    """
+    base_url = telegram_api_url.rstrip('/')
+    return f"{base_url}/bot{{0}}/{{1}}", f"{base_url}/file/bot{{0}}/{{1}}"
+
+
+def _read_local_file(download_file):
+    @functools.wraps(download_file)
+    def read(file_path: str):
+        # the server in the local mode gives the absolute paths on its disk instead of serving the files
+        if os.path.isabs(file_path):
+            with open(file_path, 'rb') as f:
+                return f.read()
+        return download_file(file_path)
+
+    return read
+
+
+def setup_telegram_api_url(bot: TeleBot, telegram_api_url: str, local_mode: bool):
+    """
+    Sends all the requests of the bot to the Bot API server at the url instead of api.telegram.org.
+
+    The bot has to be logged out of the cloud Bot API with log_out before it is launched on a server for the first
+    time. If the server runs with --local, the files it gives are read from its disk, which the bot has to share.
+    """
+    apihelper.API_URL, apihelper.FILE_URL = api_urls(telegram_api_url)
+    if local_mode:
+        bot.download_file = _read_local_file(bot.download_file)
@@ -1,30 +1,91 @@
 import logging
+from typing import Optional
 
 from sqlalchemy.orm import sessionmaker
 from telebot import TeleBot
 
-from .callback_query_antiflood import CallbackQueryAntiFloodMiddleware
-from .extra_arguments import ExtraArgumentsMiddleware
-from .message_antiflood import MessageAntiFloodMiddleware
-from .. import GoogleSheetAPI, GoogleMapsAPI
+from .callback_query_antiflood import CallbackQueryAntiFloodMiddleware, AsyncCallbackQueryAntiFloodMiddleware
+from .extra_arguments import ExtraArgumentsMiddleware, AsyncExtraArgumentsMiddleware
+from .message_antiflood import MessageAntiFloodMiddleware, AsyncMessageAntiFloodMiddleware
+from .response import ResponseMiddleware, AsyncResponseMiddleware
+from .token_bucket import RedisTokenBucket, AsyncRedisTokenBucket, setup_token_bucket
+from .. import GoogleSheetAPI, GoogleMapsAPI, QuoteEngine
+from ..aio import SyncBotBridge
+from ..api.google_maps_api import AsyncGoogleMapsAPI
+from ..callback_answers import CallbackAnswerer
+from ..notifications import OrderNotifier
+from ..pricing import AsyncQuoteEngine
+from ..sessions import OrderSessionStore, AsyncOrderSessionStore
 from ...config.models import MessagesConfig, ButtonsConfig
+from ...db import OrderWriter
 
 
 def setup_middlewares(
         bot: TeleBot,
         db_session_maker: sessionmaker,
         db_logger: logging.Logger,
+        order_writer: OrderWriter,
         google_sheet_api: GoogleSheetAPI,
         google_maps_api: GoogleMapsAPI,
+        quote_engine: QuoteEngine,
+        order_sessions: OrderSessionStore,
+        order_notifier: OrderNotifier,
         timeout_message: str,
         timeout: float,
+        antiflood_max_size: int,
+        token_bucket: Optional[RedisTokenBucket],
+        callback_answers: CallbackAnswerer,
         messages: MessagesConfig,
         buttons: ButtonsConfig,
         logger: logging.Logger,
         page_size: int):
     # TODO: setup all middlewares here
-    bot.setup_middleware(MessageAntiFloodMiddleware(bot, timeout_message, timeout))
-    bot.setup_middleware(CallbackQueryAntiFloodMiddleware(bot, timeout_message, timeout))
-    bot.setup_middleware(ExtraArgumentsMiddleware(db_session_maker, db_logger, google_sheet_api, google_maps_api,
+    bot.setup_middleware(MessageAntiFloodMiddleware(bot, timeout_message, timeout, antiflood_max_size,
+                                                    token_bucket))
+    bot.setup_middleware(CallbackQueryAntiFloodMiddleware(bot, timeout_message, timeout, antiflood_max_size,
+                                                          token_bucket, callback_answers))
+    bot.setup_middleware(ResponseMiddleware(bot, logger))
+    bot.setup_middleware(ExtraArgumentsMiddleware(db_session_maker, db_logger, order_writer, google_sheet_api,
+                                                  google_maps_api, quote_engine, order_sessions, order_notifier,
                                                   messages, buttons, logger, page_size))
     pass
+
+
+def setup_async_middlewares(
+        bridge: SyncBotBridge,
+        db_session_maker: sessionmaker,
+        async_db_session_maker,
+        db_logger: logging.Logger,
+        order_writer: OrderWriter,
+        google_sheet_api: GoogleSheetAPI,
+        google_maps_api: GoogleMapsAPI,
+        async_google_maps_api: AsyncGoogleMapsAPI,
+        quote_engine: QuoteEngine,
+        async_quote_engine: AsyncQuoteEngine,
+        order_sessions: OrderSessionStore,
+        async_order_sessions: AsyncOrderSessionStore,
+        order_notifier: OrderNotifier,
+        timeout_message: str,
+        timeout: float,
+        antiflood_max_size: int,
+        token_bucket: Optional[AsyncRedisTokenBucket],
+        callback_answers: CallbackAnswerer,
+        messages: MessagesConfig,
+        buttons: ButtonsConfig,
+        logger: logging.Logger,
+        page_size: int):
+    bot = bridge.bot
+    bot.setup_middleware(AsyncMessageAntiFloodMiddleware(bot, timeout_message, timeout, antiflood_max_size,
+                                                         token_bucket))
+    bot.setup_middleware(AsyncCallbackQueryAntiFloodMiddleware(timeout_message, timeout, callback_answers,
+                                                               antiflood_max_size, token_bucket))
+    bot.setup_middleware(AsyncResponseMiddleware(bot, logger))
+    bot.setup_middleware(AsyncExtraArgumentsMiddleware(async_db_session_maker, db_logger, order_writer,
+                                                       google_sheet_api, async_google_maps_api, async_quote_engine,
+                                                       async_order_sessions, order_notifier, messages, buttons,
+                                                       logger, page_size))
+    # the blocking handlers get the blocking versions of the same arguments on their worker
+    bridge.setup_handler_middleware(ExtraArgumentsMiddleware(db_session_maker, db_logger, order_writer,
+                                                             google_sheet_api, google_maps_api, quote_engine,
+                                                             order_sessions, order_notifier, messages, buttons,
+                                                             logger, page_size))
@@ -1,33 +1,91 @@
 import time
+from typing import Optional
 
-from telebot import TeleBot
+from telebot import TeleBot, asyncio_handler_backends
 from telebot.types import CallbackQuery
 from telebot.handler_backends import BaseMiddleware, CancelUpdate
 
+from .token_bucket import RedisTokenBucket, AsyncRedisTokenBucket, ALLOWED, USER_LIMITED
+from ..cache import TimestampStore
+from ..callback_answers import CallbackAnswerer
+
 
 class CallbackQueryAntiFloodMiddleware(BaseMiddleware):
-    def __init__(self, bot: TeleBot, timeout_message: str, timeout: float):
+    def __init__(self, bot: TeleBot, timeout_message: str, timeout: float, max_size: int = 100000,
+                 token_bucket: Optional[RedisTokenBucket] = None, callback_answers: Optional[CallbackAnswerer] = None):
         super().__init__()
         self.bot = bot
         self.timeout_message = timeout_message
         self.timeout = timeout
         self.update_types = ['callback_query']
-        self.last_query = {}
+        self.last_query = TimestampStore(timeout, max_size)
+        self.token_bucket = token_bucket
+        self.callback_answers = callback_answers or CallbackAnswerer(bot)
 
     # argument naming is kept from the base class to avoid possible errors if passed as kwargs
     def pre_process(self, message: CallbackQuery, data: dict):
-        now = time.time()
-        if message.from_user.id not in self.last_query:
-            self.last_query[message.from_user.id] = now
-            self.bot.answer_callback_query(message.id)  # always answer callback query
-            return
-        if now - self.last_query[message.from_user.id] < self.timeout:
-            self.last_query[message.from_user.id] = now
-            self.bot.answer_callback_query(message.id, self.timeout_message, show_alert=True)
+        if self.token_bucket is not None:
+            result = self.token_bucket.acquire('callback_query', message.from_user.id)
+            if result == ALLOWED:
+                return self._pass(message, data)
+            if result is not None:
+                # the global limit means the bot is overloaded, thus the query is answered without the alert
+                if result == USER_LIMITED:
+                    self.callback_answers.schedule(message.id, self.timeout_message, show_alert=True, hold=False)
+                else:
+                    self.callback_answers.schedule(message.id, hold=False)
+                return CancelUpdate()
+        if self.last_query.touch(message.from_user.id, time.monotonic()) is not None:
+            self.callback_answers.schedule(message.id, self.timeout_message, show_alert=True, hold=False)
             return CancelUpdate()
-        self.last_query[message.from_user.id] = now
-        self.bot.answer_callback_query(message.id)  # always answer callback query
+        return self._pass(message, data)
+
+    def _pass(self, message: CallbackQuery, data: dict):
+        # always answer callback query, the handler may replace the answer until it returns
+        self.callback_answers.schedule(message.id)
+        data['callback_answers'] = self.callback_answers
 
     # argument naming is kept from the base class to avoid possible errors if passed as kwargs
     def post_process(self, message: CallbackQuery, data: dict, exception: BaseException):
-        pass
+        self.callback_answers.release(message.id)
+
+
+class AsyncCallbackQueryAntiFloodMiddleware(asyncio_handler_backends.BaseMiddleware):
+    """
+    CallbackQueryAntiFloodMiddleware of the async runtime, the answers are scheduled on the same answerer.
+    """
+
+    def __init__(self, timeout_message: str, timeout: float, callback_answers: CallbackAnswerer,
+                 max_size: int = 100000, token_bucket: Optional[AsyncRedisTokenBucket] = None):
+        super().__init__()
+        self.timeout_message = timeout_message
+        self.timeout = timeout
+        self.update_types = ['callback_query']
+        self.last_query = TimestampStore(timeout, max_size)
+        self.token_bucket = token_bucket
+        self.callback_answers = callback_answers
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def pre_process(self, message: CallbackQuery, data: dict):
+        if self.token_bucket is not None:
+            result = await self.token_bucket.acquire('callback_query', message.from_user.id)
+            if result == ALLOWED:
+                return self._pass(message, data)
+            if result is not None:
+                if result == USER_LIMITED:
+                    self.callback_answers.schedule(message.id, self.timeout_message, show_alert=True, hold=False)
+                else:
+                    self.callback_answers.schedule(message.id, hold=False)
+                return asyncio_handler_backends.CancelUpdate()
+        if self.last_query.touch(message.from_user.id, time.monotonic()) is not None:
+            self.callback_answers.schedule(message.id, self.timeout_message, show_alert=True, hold=False)
+            return asyncio_handler_backends.CancelUpdate()
+        return self._pass(message, data)
+
+    def _pass(self, message: CallbackQuery, data: dict):
+        self.callback_answers.schedule(message.id)
+        data['callback_answers'] = self.callback_answers
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def post_process(self, message: CallbackQuery, data: dict, exception: BaseException):
+        self.callback_answers.release(message.id)
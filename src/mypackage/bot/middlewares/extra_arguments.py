@@ -1,11 +1,16 @@
 import logging
 
 from sqlalchemy.orm import sessionmaker
+from telebot import asyncio_handler_backends
 from telebot.handler_backends import BaseMiddleware
 
-from .. import GoogleSheetAPI, GoogleMapsAPI
+from .. import GoogleSheetAPI, GoogleMapsAPI, QuoteEngine
+from ..api.google_maps_api import AsyncGoogleMapsAPI
+from ..notifications import OrderNotifier
+from ..pricing import AsyncQuoteEngine
+from ..sessions import OrderSessionStore, AsyncOrderSessionStore
 from ...config.models import MessagesConfig, ButtonsConfig
-from ...db import DBAdapter
+from ...db import DBAdapter, AsyncDBAdapter, OrderWriter
 
 
 class ExtraArgumentsMiddleware(BaseMiddleware):
@@ -13,8 +18,12 @@ class ExtraArgumentsMiddleware(BaseMiddleware):
             self,
             db_session_maker: sessionmaker,
             db_logger: logging.Logger,
+            order_writer: OrderWriter,
             google_sheet_api: GoogleSheetAPI,
             google_maps_api: GoogleMapsAPI,
+            quote_engine: QuoteEngine,
+            order_sessions: OrderSessionStore,
+            order_notifier: OrderNotifier,
             messages: MessagesConfig,
             buttons: ButtonsConfig,
             logger: logging.Logger,
@@ -22,8 +31,12 @@ class ExtraArgumentsMiddleware(BaseMiddleware):
         super().__init__()
         self.db_session_maker = db_session_maker
         self.db_logger = db_logger
+        self.order_writer = order_writer
         self.google_sheet_api = google_sheet_api
         self.google_maps_api = google_maps_api
+        self.quote_engine = quote_engine
+        self.order_sessions = order_sessions
+        self.order_notifier = order_notifier
         self.messages = messages
         self.buttons = buttons
         self.logger = logger
@@ -35,8 +48,12 @@ class ExtraArgumentsMiddleware(BaseMiddleware):
         # passing extra arguments to handlers
         db_adapter = DBAdapter(self.db_session_maker(), self.db_logger)
         data['db_adapter'] = db_adapter
+        data['order_writer'] = self.order_writer
         data['google_sheet_api'] = self.google_sheet_api
         data['google_maps_api'] = self.google_maps_api
+        data['quote_engine'] = self.quote_engine
+        data['order_sessions'] = self.order_sessions
+        data['order_notifier'] = self.order_notifier
         data['messages'] = self.messages
         data['buttons'] = self.buttons
         data['logger'] = self.logger
@@ -45,3 +62,58 @@ class ExtraArgumentsMiddleware(BaseMiddleware):
     # argument naming is kept from the base class to avoid possible errors if passed as kwargs
     def post_process(self, message, data: dict, exception: BaseException):
         data['db_adapter'].session.close()
+
+
+class AsyncExtraArgumentsMiddleware(asyncio_handler_backends.BaseMiddleware):
+    """
+    ExtraArgumentsMiddleware of the async runtime, passing the async database session, Maps client, quote engine
+    and order sessions, whose blocking versions the bridge passes to the blocking handlers instead.
+    """
+
+    def __init__(
+            self,
+            db_session_maker,
+            db_logger: logging.Logger,
+            order_writer: OrderWriter,
+            google_sheet_api: GoogleSheetAPI,
+            google_maps_api: AsyncGoogleMapsAPI,
+            quote_engine: AsyncQuoteEngine,
+            order_sessions: AsyncOrderSessionStore,
+            order_notifier: OrderNotifier,
+            messages: MessagesConfig,
+            buttons: ButtonsConfig,
+            logger: logging.Logger,
+            page_size: int):
+        super().__init__()
+        self.db_session_maker = db_session_maker
+        self.db_logger = db_logger
+        self.order_writer = order_writer
+        self.google_sheet_api = google_sheet_api
+        self.google_maps_api = google_maps_api
+        self.quote_engine = quote_engine
+        self.order_sessions = order_sessions
+        self.order_notifier = order_notifier
+        self.messages = messages
+        self.buttons = buttons
+        self.logger = logger
+        self.page_size = page_size
+        self.update_types = ['message', 'callback_query']
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def pre_process(self, message, data: dict):
+        # the session connects on its first query only
+        data['db_adapter'] = AsyncDBAdapter(self.db_session_maker(), self.db_logger)
+        data['order_writer'] = self.order_writer
+        data['google_sheet_api'] = self.google_sheet_api
+        data['google_maps_api'] = self.google_maps_api
+        data['quote_engine'] = self.quote_engine
+        data['order_sessions'] = self.order_sessions
+        data['order_notifier'] = self.order_notifier
+        data['messages'] = self.messages
+        data['buttons'] = self.buttons
+        data['logger'] = self.logger
+        data['page_size'] = self.page_size
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def post_process(self, message, data: dict, exception: BaseException):
+        await data['db_adapter'].session.close()
@@ -1,28 +1,73 @@
-from telebot import TeleBot
+from typing import Optional
+
+from telebot import TeleBot, asyncio_handler_backends
 from telebot.types import Message
 from telebot.handler_backends import BaseMiddleware, CancelUpdate
 
+from .token_bucket import RedisTokenBucket, AsyncRedisTokenBucket, ALLOWED, USER_LIMITED
+from ..cache import TimestampStore
+
 
 class MessageAntiFloodMiddleware(BaseMiddleware):
-    def __init__(self, bot: TeleBot, timeout_message: str, timeout: float):
+    def __init__(self, bot: TeleBot, timeout_message: str, timeout: float, max_size: int = 100000,
+                 token_bucket: Optional[RedisTokenBucket] = None):
         super().__init__()
         self.bot = bot
         self.timeout_message = timeout_message
         self.timeout = timeout
-        self.last_message = {}
+        self.last_message = TimestampStore(timeout, max_size)
+        self.token_bucket = token_bucket
         self.update_types = ['message']
 
     # argument naming is kept from the base class to avoid possible errors if passed as kwargs
     def pre_process(self, message: Message, data: dict):
-        if message.from_user.id not in self.last_message:
-            self.last_message[message.from_user.id] = message.date
-            return
-        if message.date - self.last_message[message.from_user.id] < self.timeout:
-            self.last_message[message.from_user.id] = message.date
+        if self.token_bucket is not None:
+            result = self.token_bucket.acquire('message', message.from_user.id)
+            if result == ALLOWED:
+                return
+            if result is not None:
+                # the global limit means the bot is overloaded, thus the update is dropped without a reply
+                if result == USER_LIMITED:
+                    self.bot.send_message(message.chat.id, self.timeout_message)
+                return CancelUpdate()
+        if self.last_message.touch(message.from_user.id, message.date) is not None:
             self.bot.send_message(message.chat.id, self.timeout_message)
             return CancelUpdate()
-        self.last_message[message.from_user.id] = message.date
 
     # argument naming is kept from the base class to avoid possible errors if passed as kwargs
     def post_process(self, message: Message, data: dict, exception: BaseException):
         pass
+
+
+class AsyncMessageAntiFloodMiddleware(asyncio_handler_backends.BaseMiddleware):
+    """
+    MessageAntiFloodMiddleware of the async runtime, sending the timeout message through AsyncTeleBot.
+    """
+
+    def __init__(self, bot, timeout_message: str, timeout: float, max_size: int = 100000,
+                 token_bucket: Optional[AsyncRedisTokenBucket] = None):
+        super().__init__()
+        self.bot = bot
+        self.timeout_message = timeout_message
+        self.timeout = timeout
+        self.last_message = TimestampStore(timeout, max_size)
+        self.token_bucket = token_bucket
+        self.update_types = ['message']
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def pre_process(self, message: Message, data: dict):
+        if self.token_bucket is not None:
+            result = await self.token_bucket.acquire('message', message.from_user.id)
+            if result == ALLOWED:
+                return
+            if result is not None:
+                if result == USER_LIMITED:
+                    await self.bot.send_message(message.chat.id, self.timeout_message)
+                return asyncio_handler_backends.CancelUpdate()
+        if self.last_message.touch(message.from_user.id, message.date) is not None:
+            await self.bot.send_message(message.chat.id, self.timeout_message)
+            return asyncio_handler_backends.CancelUpdate()
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def post_process(self, message: Message, data: dict, exception: BaseException):
+        pass
@@ -0,0 +1,41 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot import TeleBot, asyncio_handler_backends
+from telebot.handler_backends import BaseMiddleware
+
+from ..response import ResponseBuilder, AsyncResponseBuilder
+
+
+class ResponseMiddleware(BaseMiddleware):
+    def __init__(self, bot: TeleBot, logger: logging.Logger, workers: int = 8):
+        super().__init__()
+        self.bot = bot
+        self.logger = logger
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="response")
+        self.update_types = ['message', 'callback_query']
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    def pre_process(self, message, data: dict):
+        data['response'] = ResponseBuilder(self.bot, self.executor, self.logger)
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    def post_process(self, message, data: dict, exception: BaseException):
+        # what the handler collected before an exception is sent as well, as it would have been sent right away
+        data['response'].flush()
+
+
+class AsyncResponseMiddleware(asyncio_handler_backends.BaseMiddleware):
+    def __init__(self, bot, logger: logging.Logger):
+        super().__init__()
+        self.bot = bot
+        self.logger = logger
+        self.update_types = ['message', 'callback_query']
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def pre_process(self, message, data: dict):
+        data['response'] = AsyncResponseBuilder(self.bot, self.logger)
+
+    # argument naming is kept from the base class to avoid possible errors if passed as kwargs
+    async def post_process(self, message, data: dict, exception: BaseException):
+        await data['response'].flush()
@@ -0,0 +1,127 @@
+import logging
+from typing import Optional
+
+from ...config.models import BotAntiFloodConfig, BotStateStorageConfig
+
+# The results of the token bucket check
+ALLOWED = 0
+USER_LIMITED = 1
+GLOBAL_LIMITED = 2
+
+# Checks and takes a token from the user bucket and from the global one atomically, using the Redis clock,
+# so the workers' clocks don't matter. A bucket is a hash of the tokens left and the time of the last take,
+# expiring once it would be full again, so the idle users don't stay in Redis. A rejection writes nothing,
+# as the refill only depends on the time passed since the last take.
+_TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local function refill(key, rate, burst)
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1])
+    if tokens == nil then
+        return burst
+    end
+    return math.min(burst, tokens + math.max(0, now - tonumber(bucket[2])) * rate / 1000)
+end
+
+local function take(key, tokens, rate, burst)
+    tokens = tokens - 1
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil((burst - tokens) / rate * 1000))
+end
+
+local user_rate, user_burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local global_rate, global_burst = tonumber(ARGV[3]), tonumber(ARGV[4])
+
+local user_tokens = refill(KEYS[1], user_rate, user_burst)
+if user_tokens < 1 then
+    return 1
+end
+local global_tokens = refill(KEYS[2], global_rate, global_burst)
+if global_tokens < 1 then
+    return 2
+end
+take(KEYS[1], user_tokens, user_rate, user_burst)
+take(KEYS[2], global_tokens, global_rate, global_burst)
+return 0
+"""
+
+
+class RedisTokenBucket:
+    """
+    Token buckets of the anti-flood middlewares shared by all the bot workers, per user and global.
+
+    Both buckets are checked by a single Lua script, so a check is one round trip, EVALSHA of the script
+    registered once. Any Redis client is accepted, e.g. fakeredis.FakeRedis as a local stand-in in tests.
+    """
+
+    def __init__(self, redis, prefix: str = 'telebot_', user_rate: float = 1.0, user_burst: int = 5,
+                 global_rate: float = 100.0, global_burst: int = 200, logger: Optional[logging.Logger] = None):
+        self.redis = redis
+        self.prefix = f"{prefix}antiflood_"
+        self.global_key = f"{self.prefix}global"
+        self.logger = logger or logging.getLogger(__name__)
+        self._args = [user_rate, user_burst, global_rate, global_burst]
+        self._script = redis.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    def acquire(self, scope: str, user_id: int) -> Optional[int]:
+        """
+        Takes a token from the user bucket of the scope, e.g. the update type, and from the global bucket.
+
+        Returns:
+            Optional[int]: ALLOWED, USER_LIMITED or GLOBAL_LIMITED, or None if Redis is unavailable.
+        """
+        from redis.exceptions import RedisError
+
+        try:
+            return int(self._script(keys=[f"{self.prefix}{scope}_{user_id}", self.global_key], args=self._args))
+        except RedisError as e:
+            self.logger.warning(f"Anti-flood token bucket is unavailable, using the local timeout: {e}")
+            return None
+
+
+class AsyncRedisTokenBucket(RedisTokenBucket):
+    """
+    RedisTokenBucket of the async runtime, checking the same buckets through a redis.asyncio client.
+    """
+
+    async def acquire(self, scope: str, user_id: int) -> Optional[int]:
+        from redis.exceptions import RedisError
+
+        try:
+            return int(await self._script(keys=[f"{self.prefix}{scope}_{user_id}", self.global_key], args=self._args))
+        except RedisError as e:
+            self.logger.warning(f"Anti-flood token bucket is unavailable, using the local timeout: {e}")
+            return None
+
+
+def setup_token_bucket(antiflood_config: Optional[BotAntiFloodConfig],
+                       state_storage_config: Optional[BotStateStorageConfig],
+                       logger: logging.Logger,
+                       use_asyncio: bool = False) -> Optional[RedisTokenBucket]:
+    if antiflood_config is None or antiflood_config.type == 'memory':
+        return None
+
+    # the buckets live next to the states, thus the state storage connection settings are reused
+    if state_storage_config is None or state_storage_config.redis is None:
+        raise ValueError('state_storage.redis is required if antiflood.type is "redis"')
+    try:
+        if use_asyncio:
+            from redis.asyncio import Redis
+        else:
+            from redis import Redis
+    except ImportError:
+        raise ImportError("Please install redis using `pip install redis`")
+
+    redis_config = state_storage_config.redis
+    token_bucket_class = AsyncRedisTokenBucket if use_asyncio else RedisTokenBucket
+    return token_bucket_class(
+        Redis(host=redis_config.host, port=redis_config.port, db=redis_config.db, password=redis_config.password),
+        prefix=redis_config.prefix,
+        user_rate=antiflood_config.user_rate,
+        user_burst=antiflood_config.user_burst,
+        global_rate=antiflood_config.global_rate,
+        global_burst=antiflood_config.global_burst,
+        logger=logger,
+    )
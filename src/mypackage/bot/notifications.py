@@ -0,0 +1,129 @@
+import atexit
+import heapq
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from requests.exceptions import RequestException
+from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
+
+from .outbound import send_priority, BROADCAST
+from ..config.models import BotConfig
+
+
+@dataclass
+class NotificationDTO:
+    chat_id: int
+    text: str
+    parse_mode: Optional[str] = None
+    attempt: int = 0
+
+
+class OrderNotifier:
+    """
+    Sends the order notifications to the recipient chats in the background.
+
+    The message is rendered once by the caller and fanned out to every recipient as a separate delivery,
+    so a failing recipient is retried with an exponential backoff, or after the time Telegram asks
+    to wait on 429, without delaying the others and without keeping the customer waiting.
+    """
+
+    def __init__(self, bot: TeleBot, chat_ids: List[int], max_retries: int = 5, retry_delay: float = 1.0,
+                 logger: Optional[logging.Logger] = None):
+        self.bot = bot
+        self.chat_ids = chat_ids
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._deliveries = []  # heap of (due time, sequence number, notification)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name="order_notifier", daemon=True)
+        self._worker.start()
+
+    def notify(self, text: str, parse_mode: Optional[str] = "HTML"):
+        with self._condition:
+            for chat_id in self.chat_ids:
+                self._schedule(NotificationDTO(chat_id, text, parse_mode), due=0)
+            self._condition.notify()
+
+    def _schedule(self, notification: NotificationDTO, due: float):
+        heapq.heappush(self._deliveries, (due, next(self._sequence), notification))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._deliveries or self._deliveries[0][0] > time.monotonic()):
+                    timeout = self._deliveries[0][0] - time.monotonic() if self._deliveries else None
+                    self._condition.wait(timeout)
+                if not self._deliveries:
+                    return
+                _, _, notification = heapq.heappop(self._deliveries)
+
+            delay = self._send(notification)
+            if delay is not None:
+                with self._condition:
+                    self._schedule(notification, due=time.monotonic() + delay)
+
+    def _send(self, notification: NotificationDTO) -> Optional[float]:
+        """
+        Sends the notification.
+
+        Returns:
+            Optional[float]: The delay in seconds before the next attempt, or None if there won't be any.
+        """
+        try:
+            # the customers' replies go first when the outbound requests are rate limited
+            with send_priority(BROADCAST):
+                self.bot.send_message(notification.chat_id, notification.text, parse_mode=notification.parse_mode)
+            return None
+        except ApiTelegramException as e:
+            retry_after = (e.result_json.get('parameters') or {}).get('retry_after') if e.error_code == 429 else None
+            if e.error_code != 429 and e.error_code < 500:
+                self.logger.error(f"Order notification to {notification.chat_id} failed: {e}")
+                return None
+            error = e
+        except RequestException as e:
+            retry_after = None
+            error = e
+
+        notification.attempt += 1
+        if notification.attempt > self.max_retries or self._stopped:
+            self.logger.error(f"Order notification to {notification.chat_id} failed "
+                              f"after {notification.attempt} attempts: {error}")
+            return None
+
+        delay = retry_after or self.retry_delay * 2 ** (notification.attempt - 1)
+        self.logger.warning(f"Order notification to {notification.chat_id} failed, retrying in {delay}s: {error}")
+        return delay
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Sends the pending notifications without waiting for their retry time and stops the worker.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._worker.join(timeout)
+
+
+def setup_order_notifier(bot: TeleBot, bot_config: BotConfig, logger: logging.Logger) -> OrderNotifier:
+    if bot_config.notifications is None:
+        order_notifier = OrderNotifier(bot, [bot_config.owner_tg_id], logger=logger)
+    else:
+        order_notifier = OrderNotifier(
+            bot,
+            chat_ids=bot_config.notifications.chat_ids,
+            max_retries=bot_config.notifications.max_retries,
+            retry_delay=bot_config.notifications.retry_delay,
+            logger=logger,
+        )
+    # the pending notifications are sent on any normal interpreter exit, including Ctrl+C
+    atexit.register(order_notifier.stop)
+    return order_notifier
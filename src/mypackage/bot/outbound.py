@@ -0,0 +1,301 @@
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import functools
+import inspect
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
+
+from ..config.models import BotConfig
+
+# Priority classes of the outbound requests, the lower goes first
+USER_REPLY = 0
+BROADCAST = 1
+
+# The TeleBot methods sending to a chat, thus limited by Telegram per chat and globally
+RATE_LIMITED_METHODS = ('send_message', 'edit_message_text', 'edit_message_reply_markup', 'send_photo',
+                        'send_document', 'send_location', 'send_media_group', 'forward_message', 'copy_message')
+
+_priority = contextvars.ContextVar('outbound_priority', default=USER_REPLY)
+
+
+@contextlib.contextmanager
+def send_priority(priority: int):
+    """
+    Sets the priority class of the requests sent within the block, e.g. BROADCAST for the admin notifications.
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated_at', 'paused_until')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated_at = now
+        self.paused_until = 0.0
+
+    def refill(self, now: float, rate: float, burst: float):
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+
+    def delay(self, now: float, rate: float) -> float:
+        """
+        Returns the seconds until the bucket has a token and isn't paused, 0 if it is ready now.
+        """
+        return max(0.0, self.paused_until - now, (1 - self.tokens) / rate)
+
+
+class OutboundScheduler:
+    """
+    Rate limiter of the requests the bot sends to the chats, wrapping the TeleBot instance.
+
+    Once installed, the rate limited methods of the bot wait for a token of the global bucket and of the chat
+    bucket before sending, so Telegram's limits are kept instead of being hit. The waiting requests are let through
+    by priority class and then in the order they came, a request of a chat whose bucket is empty doesn't hold
+    the other chats. A 429 pauses the chat for the retry_after Telegram asks and the request is retried.
+    The calls stay blocking and return the result of the wrapped method, the coroutine methods of AsyncTeleBot
+    stay coroutines waiting on the loop.
+    """
+
+    def __init__(self, bot: TeleBot, global_rate: float = 30.0, global_burst: int = 30, chat_rate: float = 1.0,
+                 chat_burst: int = 3, group_rate: float = 20 / 60, max_retries: int = 3,
+                 max_chats: int = 100000, logger: Optional[logging.Logger] = None):
+        self.bot = bot
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._condition = threading.Condition()
+        self._sequence = itertools.count()
+        self._waiters = []  # sorted [priority, sequence number, chat id] of the requests waiting for the tokens
+        self._global = _Bucket(global_burst, time.monotonic())
+        # the chat buckets in the order of the last request, the ones full again are swept from the start
+        self._chats: OrderedDict[int, _Bucket] = OrderedDict()
+
+        self.sent_count = [0, 0]
+        self.retried_count = 0
+        self.total_wait = [0.0, 0.0]
+        self.max_wait = [0.0, 0.0]
+
+    def install(self):
+        """
+        Replaces the rate limited methods of the bot instance with the scheduled ones.
+        """
+        for name in RATE_LIMITED_METHODS:
+            method = getattr(self.bot, name)
+            setattr(self.bot, name, self._wrap(method))
+        # kept on the bot, so the metrics are reachable wherever the bot is
+        self.bot.outbound_scheduler = self
+
+    def _wrap(self, method):
+        signature = inspect.signature(method)
+
+        if inspect.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def scheduled_async(*args, **kwargs):
+                chat_id = signature.bind_partial(*args, **kwargs).arguments.get('chat_id')
+                return await self.send_async(method, chat_id, *args, **kwargs)
+
+            return scheduled_async
+
+        @functools.wraps(method)
+        def scheduled(*args, **kwargs):
+            chat_id = signature.bind_partial(*args, **kwargs).arguments.get('chat_id')
+            return self.send(method, chat_id, *args, **kwargs)
+
+        return scheduled
+
+    def send(self, method, chat_id: Optional[int | str], /, *args, **kwargs):
+        """
+        Calls the method once the buckets allow it, retrying it after the retry_after of a 429.
+        """
+        priority = _priority.get()
+        attempt = 0
+        while True:
+            self._acquire(chat_id, priority)
+            try:
+                return method(*args, **kwargs)
+            except ApiTelegramException as e:
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after') if e.error_code == 429 else None
+                if retry_after is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retried_count += 1
+                self.logger.warning(f"Chat {chat_id} is rate limited by Telegram, retrying in {retry_after}s")
+                self._pause(chat_id, retry_after)
+
+    async def send_async(self, method, chat_id: Optional[int | str], /, *args, **kwargs):
+        """
+        Awaits the coroutine method once the buckets allow it, retrying it after the retry_after of a 429.
+        """
+        # imported here as it requires aiohttp, which the sync runtime doesn't
+        from telebot.asyncio_helper import ApiTelegramException as AsyncApiTelegramException
+
+        priority = _priority.get()
+        attempt = 0
+        while True:
+            await self._acquire_async(chat_id, priority)
+            try:
+                return await method(*args, **kwargs)
+            except AsyncApiTelegramException as e:
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after') if e.error_code == 429 else None
+                if retry_after is None or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self.retried_count += 1
+                self.logger.warning(f"Chat {chat_id} is rate limited by Telegram, retrying in {retry_after}s")
+                self._pause(chat_id, retry_after)
+
+    def _rate(self, chat_id: Optional[int | str]) -> float:
+        # the channels and groups have negative ids or usernames, the private chats have positive ids
+        return self.chat_rate if isinstance(chat_id, int) and chat_id > 0 else self.group_rate
+
+    def _chat_bucket(self, chat_id: Optional[int | str], now: float) -> Optional[_Bucket]:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = _Bucket(self.chat_burst, now)
+        bucket.refill(now, self._rate(chat_id), self.chat_burst)
+        return bucket
+
+    def _poll(self, waiter: list, now: float) -> Optional[float]:
+        """
+        Returns 0 if the waiter may go now, else the seconds to wait, or None to wait for the one going first.
+        """
+        self._global.refill(now, self.global_rate, self.global_burst)
+        timeout = self._global.delay(now, self.global_rate)
+        if timeout == 0:
+            # the first waiter whose chat is ready goes, a busy chat only holds its own requests
+            for first in self._waiters:
+                bucket = self._chat_bucket(first[2], now)
+                delay = bucket.delay(now, self._rate(first[2])) if bucket is not None else 0
+                if delay == 0:
+                    break
+                timeout = min(timeout, delay) if timeout else delay
+            else:
+                first = None
+            if first is waiter:
+                return 0
+            if first is not None:
+                # someone else goes first, this waiter is woken up after it
+                self._condition.notify_all()
+                timeout = None
+        return timeout
+
+    def _take(self, waiter: list, now: float, enqueued_at: float):
+        priority, _, chat_id = waiter
+        self._waiters.remove(waiter)
+        self._global.tokens -= 1
+        bucket = self._chat_bucket(chat_id, now)
+        if bucket is not None:
+            bucket.tokens -= 1
+            self._chats.move_to_end(chat_id)
+            self._sweep(now)
+
+        wait = now - enqueued_at
+        self.sent_count[priority] += 1
+        self.total_wait[priority] += wait
+        self.max_wait[priority] = max(self.max_wait[priority], wait)
+        self._condition.notify_all()
+
+    def _acquire(self, chat_id: Optional[int | str], priority: int):
+        waiter = [priority, next(self._sequence), chat_id]
+        enqueued_at = time.monotonic()
+        with self._condition:
+            bisect.insort(self._waiters, waiter)
+            while True:
+                now = time.monotonic()
+                timeout = self._poll(waiter, now)
+                if timeout == 0:
+                    break
+                self._condition.wait(timeout)
+            self._take(waiter, now, enqueued_at)
+
+    async def _acquire_async(self, chat_id: Optional[int | str], priority: int):
+        waiter = [priority, next(self._sequence), chat_id]
+        enqueued_at = time.monotonic()
+        with self._condition:
+            bisect.insort(self._waiters, waiter)
+        try:
+            while True:
+                with self._condition:
+                    now = time.monotonic()
+                    timeout = self._poll(waiter, now)
+                    if timeout == 0:
+                        self._take(waiter, now, enqueued_at)
+                        return
+                # the condition doesn't wake the coroutines up, thus the ones behind another one check again
+                # after the time a token takes
+                await asyncio.sleep(timeout if timeout is not None else 1 / self.global_rate)
+        except asyncio.CancelledError:
+            with self._condition:
+                self._waiters.remove(waiter)
+                self._condition.notify_all()
+            raise
+
+    def _sweep(self, now: float):
+        while len(self._chats) > 1:
+            chat_id = next(iter(self._chats))
+            bucket = self._chats[chat_id]
+            full = (bucket.paused_until <= now
+                    and bucket.tokens + (now - bucket.updated_at) * self._rate(chat_id) >= self.chat_burst)
+            if not full and len(self._chats) <= self.max_chats:
+                break
+            del self._chats[chat_id]
+
+    def _pause(self, chat_id: Optional[int | str], retry_after: float):
+        with self._condition:
+            now = time.monotonic()
+            bucket = self._chat_bucket(chat_id, now) if chat_id is not None else self._global
+            bucket.paused_until = max(bucket.paused_until, now + retry_after)
+            self._condition.notify_all()
+
+    def get_metrics(self) -> Dict[str, object]:
+        """
+        Returns the number of the waiting requests, the requests sent and their queue wait time per priority class.
+        """
+        return {
+            'waiting': len(self._waiters),
+            'sent': list(self.sent_count),
+            'retried': self.retried_count,
+            'average_wait': [total / sent if sent else 0.0 for total, sent in zip(self.total_wait, self.sent_count)],
+            'max_wait': list(self.max_wait),
+        }
+
+
+def setup_outbound_scheduler(bot: TeleBot, bot_config: BotConfig, logger: logging.Logger) -> OutboundScheduler:
+    outbound_config = bot_config.outbound
+    if outbound_config is None:
+        scheduler = OutboundScheduler(bot, logger=logger)
+    else:
+        scheduler = OutboundScheduler(
+            bot,
+            global_rate=outbound_config.global_rate,
+            global_burst=outbound_config.global_burst,
+            chat_rate=outbound_config.chat_rate,
+            chat_burst=outbound_config.chat_burst,
+            group_rate=outbound_config.group_rate,
+            max_retries=outbound_config.max_retries,
+            logger=logger,
+        )
+    scheduler.install()
+    return scheduler
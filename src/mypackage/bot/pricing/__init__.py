@@ -0,0 +1,16 @@
+from .engine import QuoteEngine, AsyncQuoteEngine
+from .flows import FlowRegistry, FlowToken
+from ..api.google_maps_api import GoogleMapsAPI, AsyncGoogleMapsAPI
+from ..api.google_sheet_api import GoogleSheetAPI
+
+
+def setup_quote_engine(google_sheet_api: GoogleSheetAPI, google_maps_api: GoogleMapsAPI) -> QuoteEngine:
+    _quote_engine = QuoteEngine(google_sheet_api, google_maps_api)
+
+    return _quote_engine
+
+
+def setup_async_quote_engine(quote_engine: QuoteEngine, google_maps_api: AsyncGoogleMapsAPI) -> AsyncQuoteEngine:
+    _async_quote_engine = AsyncQuoteEngine(quote_engine, google_maps_api)
+
+    return _async_quote_engine
@@ -0,0 +1,33 @@
+from typing import List, NamedTuple
+
+from ..api.google_sheet_api import get_delivery_type
+from ..cache import LRUCache
+from ...db.dto import CatalogDiffDTO
+
+
+class QuoteKey(NamedTuple):
+    producer: str
+    concrete_type: str
+    distance_metres: int
+    concrete_discount: int
+    delivery_discount: int
+
+
+class QuoteCache(LRUCache):
+    """
+    Cache of the per concrete type price rows.
+
+    The keys hold every input of the calculation except the catalog itself,
+    thus only the catalog changes have to invalidate the cache.
+    """
+
+    def invalidate(self, diff: CatalogDiffDTO) -> List[QuoteKey]:
+        """
+        Evicts only the price rows that depend on the changed catalog entries.
+
+        Returns:
+            List[QuoteKey]: The evicted keys.
+        """
+        return self.evict(lambda key: key.producer in diff.producers
+                          or key.concrete_type in diff.concrete_types
+                          or get_delivery_type(key.concrete_type) in diff.delivery_types)
@@ -0,0 +1,291 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from typing import Dict, List, Optional, Tuple
+
+from .cache import QuoteCache, QuoteKey
+from .flows import FlowRegistry, FlowToken
+from .. import texts
+from ..api.google_maps_api import GoogleMapsAPI, AsyncGoogleMapsAPI
+from ..api.google_sheet_api import GoogleSheetAPI
+from ..utils import calculate_delivery_cost, find_best_producer, MAX_DELIVERY_DISTANCE
+from ...db.dto import (UserDTO, UserLocationDTO, DispatchPointDTO, DistanceDTO,
+                       ConcretePriceDTO, ProducerQuoteDTO, QuoteDTO, CatalogDiffDTO)
+from ...money import apply_discount
+
+
+class QuoteEngine:
+    """
+    Runs the calculation pipeline without Telegram: location in, best producer and per-concrete prices out.
+
+    The engine shares the Google Sheet catalog, the Google Maps distance cache, the price rows cache
+    and a single thread pool between the bot handlers and the HTTP quoting API.
+    The bot handlers pass the user's flow token, so the lookups of an abandoned flow are cancelled.
+    """
+
+    def __init__(self,
+                 google_sheet_api: GoogleSheetAPI,
+                 google_maps_api: GoogleMapsAPI,
+                 max_workers: int = 8,
+                 cache_size: int = 8192):
+        self.google_sheet_api = google_sheet_api
+        self.google_maps_api = google_maps_api
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quote_engine")
+        self.cache = QuoteCache(max_size=cache_size)
+        self.flows = FlowRegistry()
+
+        self.google_sheet_api.subscribe(self.on_catalog_change)
+
+    def locate(self, address: Optional[str] = None,
+               coords: Optional[Tuple[float, float]] = None,
+               flow: Optional[FlowToken] = None) -> UserLocationDTO | None:
+        """
+        Geocodes the address or the coordinates, None is returned if the flow is cancelled meanwhile.
+        """
+        if flow is not None and flow.cancelled:
+            return None
+        if coords:
+            user_location = self.google_maps_api.from_coords(coords)
+        elif address:
+            user_location = self.google_maps_api.from_address(address)
+        else:
+            return None
+        return None if flow is not None and flow.cancelled else user_location
+
+    def closest_dispatch_points(self,
+                                coords: Tuple[float, float],
+                                flow: Optional[FlowToken] = None
+                                ) -> Dict[str, Tuple[DispatchPointDTO, DistanceDTO]] | None:
+        """
+        Looks up the closest dispatch point of every producer in parallel, None is returned if the flow is cancelled.
+        """
+        is_cancelled = (lambda: flow.cancelled) if flow is not None else None
+
+        def get_closest_dispatch_point(producer_dto):
+            return producer_dto.title, self.google_maps_api.get_closest_point(producer_dto.dispatch_points, coords,
+                                                                              is_cancelled)
+
+        futures = [self.executor.submit(get_closest_dispatch_point, producer_dto)
+                   for producer_dto in self.google_sheet_api.producers]
+        if flow is not None:
+            flow.track(futures)
+        try:
+            closest_dispatch_points = dict(future.result() for future in futures)
+        except CancelledError:
+            return None
+        return None if flow is not None and flow.cancelled else closest_dispatch_points
+
+    def best_producer(self,
+                      closest_dispatch_points: Dict[str, Tuple[DispatchPointDTO, DistanceDTO]],
+                      user: Optional[UserDTO] = None) -> str | None:
+        producers = [producer for producer in self.google_sheet_api.producers
+                     if producer.title in closest_dispatch_points
+                     and closest_dispatch_points[producer.title][1].distance_metres <= MAX_DELIVERY_DISTANCE]
+        if not producers:
+            return None
+
+        best_producer = find_best_producer(producers, closest_dispatch_points, user,
+                                           delivery_price_list=self.google_sheet_api.get_delivery_price_list("P3"))
+        return best_producer.title if best_producer else None
+
+    def concrete_type_prices(self,
+                             producer: str,
+                             concrete_type: str,
+                             distance_metres: int,
+                             user: Optional[UserDTO] = None,
+                             payment_type: str = texts.cash_payment) -> List[ConcretePriceDTO]:
+        """
+        Returns the prices per m³ (delivery included) of the concretes of the type, cached until the catalog changes.
+
+        The prices are integer kopiykas, the discounts being the only rounding point.
+        """
+        user_discount = user.get_producer_discounts(producer) if user else None
+        concrete_discount = (user_discount.get_concrete_discount(payment_type) if user_discount else 0) or 0
+        delivery_discount = (user_discount.get_delivery_discount(payment_type) if user_discount else 0) or 0
+
+        key = QuoteKey(producer, concrete_type, distance_metres, concrete_discount, delivery_discount)
+        return self.cache.get_or_set(key, lambda: self._calculate_concrete_type_prices(key))
+
+    def _calculate_concrete_type_prices(self, key: QuoteKey) -> List[ConcretePriceDTO]:
+        concretes = self.google_sheet_api.concrete_data.concretes_by_type.get(key.concrete_type, [])
+
+        # the delivery price only depends on the tariff column, thus is calculated once per concrete type
+        delivery_price = calculate_delivery_cost(key.concrete_type,
+                                                 self.google_sheet_api.get_delivery_price_list(key.concrete_type),
+                                                 key.distance_metres)
+        delivery_price = apply_discount(delivery_price, key.delivery_discount)
+
+        prices = []
+        for concrete in concretes:
+            concrete_price = apply_discount(concrete.price, key.concrete_discount)
+            prices.append(ConcretePriceDTO(concrete, concrete_price, delivery_price,
+                                           price=concrete_price + delivery_price))
+        return prices
+
+    def on_catalog_change(self, diff: CatalogDiffDTO):
+        """
+        Evicts the price rows depending on the changed catalog entries and recomputes them in the background.
+
+        The rows of the producers whose dispatch points changed are not recomputed,
+        as their distances have to be looked up again anyway.
+        """
+        evicted_keys = self.cache.invalidate(diff)
+        concrete_types = self.google_sheet_api.concrete_data.concretes_by_type
+        for key in evicted_keys:
+            if key.producer not in diff.producers and key.concrete_type in concrete_types:
+                self.executor.submit(self._warm_up, key)
+
+    def _warm_up(self, key: QuoteKey):
+        self.cache.get_or_set(key, lambda: self._calculate_concrete_type_prices(key))
+
+    def quote(self,
+              user_location: UserLocationDTO,
+              user: Optional[UserDTO] = None,
+              payment_type: str = texts.cash_payment,
+              closest_dispatch_points: Optional[Dict[str, Tuple[DispatchPointDTO, DistanceDTO]]] = None,
+              flow: Optional[FlowToken] = None) -> QuoteDTO | None:
+        """
+        Calculates the prices per m³ (delivery included) of every concrete for every producer.
+
+        Args:
+            user_location: The delivery location.
+            user: The user whose discounts to apply, list prices are returned if None.
+            payment_type: The payment type the discounts depend on.
+            closest_dispatch_points: Already looked up closest dispatch points, if any.
+            flow: The user's flow token, if any.
+
+        Returns:
+            QuoteDTO | None: The quote with the best producer, or without one if the location is too far,
+                None if the flow is cancelled.
+        """
+        if closest_dispatch_points is None:
+            closest_dispatch_points = self.closest_dispatch_points(user_location.coords, flow)
+            if closest_dispatch_points is None:
+                return None
+        return self.build_quote(user_location, closest_dispatch_points, user, payment_type)
+
+    def build_quote(self,
+                    user_location: UserLocationDTO,
+                    closest_dispatch_points: Dict[str, Tuple[DispatchPointDTO, DistanceDTO]],
+                    user: Optional[UserDTO] = None,
+                    payment_type: str = texts.cash_payment) -> QuoteDTO:
+        """
+        Calculates the quote for the closest dispatch points already looked up, without any Google request.
+        """
+        concrete_types = self.google_sheet_api.concrete_data.concretes_by_type
+        quote = QuoteDTO(user_location, payment_type,
+                         best_producer=self.best_producer(closest_dispatch_points, user))
+
+        for producer_title, (dispatch_point, distance) in closest_dispatch_points.items():
+            producer_quote = ProducerQuoteDTO(producer_title, dispatch_point, distance)
+            for concrete_type in concrete_types:
+                producer_quote.prices.extend(self.concrete_type_prices(producer_title, concrete_type,
+                                                                       distance.distance_metres, user, payment_type))
+            quote.producers.append(producer_quote)
+
+        return quote
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class _LoopTask:
+    """
+    A task of the event loop as the flow token tracks it, cancelled on its loop whichever thread cancels the flow.
+    """
+    __slots__ = ('task', 'loop')
+
+    def __init__(self, task: asyncio.Task, loop: asyncio.AbstractEventLoop):
+        self.task = task
+        self.loop = loop
+
+    def done(self) -> bool:
+        return self.task.done()
+
+    def cancel(self):
+        self.loop.call_soon_threadsafe(self.task.cancel)
+
+
+class AsyncQuoteEngine:
+    """
+    QuoteEngine of the async runtime: the Google lookups are tasks on the event loop instead of pool jobs.
+
+    The catalog, the price rows cache and the users' flows are the ones of the blocking engine, shared with
+    the blocking handlers and the quoting API, so a flow cancelled by either runtime cancels the tasks of the other.
+    """
+
+    def __init__(self, quote_engine: QuoteEngine, google_maps_api: AsyncGoogleMapsAPI):
+        self.quote_engine = quote_engine
+        self.google_sheet_api = quote_engine.google_sheet_api
+        self.google_maps_api = google_maps_api
+        self.flows = quote_engine.flows
+
+    async def locate(self, address: Optional[str] = None,
+                     coords: Optional[Tuple[float, float]] = None,
+                     flow: Optional[FlowToken] = None) -> UserLocationDTO | None:
+        """
+        Geocodes the address or the coordinates, None is returned if the flow is cancelled meanwhile.
+        """
+        if flow is not None and flow.cancelled:
+            return None
+        if coords:
+            user_location = await self.google_maps_api.from_coords(coords)
+        elif address:
+            user_location = await self.google_maps_api.from_address(address)
+        else:
+            return None
+        return None if flow is not None and flow.cancelled else user_location
+
+    async def closest_dispatch_points(self,
+                                      coords: Tuple[float, float],
+                                      flow: Optional[FlowToken] = None
+                                      ) -> Dict[str, Tuple[DispatchPointDTO, DistanceDTO]] | None:
+        """
+        Looks up the closest dispatch point of every producer concurrently, None is returned if the flow is cancelled.
+        """
+        is_cancelled = (lambda: flow.cancelled) if flow is not None else None
+
+        async def get_closest_dispatch_point(producer_dto):
+            return producer_dto.title, await self.google_maps_api.get_closest_point(producer_dto.dispatch_points,
+                                                                                    coords, is_cancelled)
+
+        loop = asyncio.get_running_loop()
+        tasks = [loop.create_task(get_closest_dispatch_point(producer_dto))
+                 for producer_dto in self.google_sheet_api.producers]
+        if flow is not None:
+            flow.track(_LoopTask(task, loop) for task in tasks)
+        try:
+            closest_dispatch_points = dict(await asyncio.gather(*tasks))
+        except asyncio.CancelledError:
+            # only the cancellation of the flow is taken for its result, not the one of the caller
+            if flow is None or not flow.cancelled:
+                raise
+            return None
+        return None if flow is not None and flow.cancelled else closest_dispatch_points
+
+    def best_producer(self,
+                      closest_dispatch_points: Dict[str, Tuple[DispatchPointDTO, DistanceDTO]],
+                      user: Optional[UserDTO] = None) -> str | None:
+        return self.quote_engine.best_producer(closest_dispatch_points, user)
+
+    def concrete_type_prices(self,
+                             producer: str,
+                             concrete_type: str,
+                             distance_metres: int,
+                             user: Optional[UserDTO] = None,
+                             payment_type: str = texts.cash_payment) -> List[ConcretePriceDTO]:
+        return self.quote_engine.concrete_type_prices(producer, concrete_type, distance_metres, user, payment_type)
+
+    async def quote(self,
+                    user_location: UserLocationDTO,
+                    user: Optional[UserDTO] = None,
+                    payment_type: str = texts.cash_payment,
+                    closest_dispatch_points: Optional[Dict[str, Tuple[DispatchPointDTO, DistanceDTO]]] = None,
+                    flow: Optional[FlowToken] = None) -> QuoteDTO | None:
+        """
+        Calculates the prices per m³ (delivery included) of every concrete for every producer, as QuoteEngine.quote.
+        """
+        if closest_dispatch_points is None:
+            closest_dispatch_points = await self.closest_dispatch_points(user_location.coords, flow)
+            if closest_dispatch_points is None:
+                return None
+        return self.quote_engine.build_quote(user_location, closest_dispatch_points, user, payment_type)
@@ -0,0 +1,82 @@
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Iterable, List, Optional
+
+from ..cache import LRUCache
+
+
+class FlowToken:
+    """
+    Generation token of a user's calculation flow, cancelled once the user starts a new flow or cancels this one.
+
+    The jobs of the flow check the token before every Google request, the ones still queued are dropped,
+    and the results coming after the cancellation are discarded by the caller.
+    """
+
+    def __init__(self, user_id: int, generation: int):
+        self.user_id = user_id
+        self.generation = generation
+        self._cancelled = threading.Event()
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def track(self, futures: Iterable[Future]):
+        with self._lock:
+            self._futures = [future for future in self._futures if not future.done()]
+            self._futures.extend(futures)
+        if self.cancelled:
+            self.cancel()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.cancel()
+
+    def __repr__(self):
+        return f"FlowToken(user_id={self.user_id}, generation={self.generation}, cancelled={self.cancelled})"
+
+
+class FlowRegistry:
+    """
+    Current flow tokens of the users, kept for the ttl of inactivity like the order sessions.
+    """
+
+    def __init__(self, ttl: Optional[float] = 86400, max_size: int = 10000):
+        self._tokens = LRUCache(max_size=max_size, ttl=ttl)
+        self._generations = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, user_id: int) -> FlowToken:
+        """
+        Cancels the current flow of the user, if any, and starts a new one.
+        """
+        with self._lock:
+            previous = self._tokens.pop(user_id)
+            token = FlowToken(user_id, next(self._generations))
+            self._tokens.set(user_id, token)
+        if previous is not None:
+            previous.cancel()
+        return token
+
+    def current(self, user_id: int) -> FlowToken:
+        """
+        Returns the current flow of the user, starting one if there is none, e.g. after a restart.
+        """
+        with self._lock:
+            token = self._tokens.get(user_id)
+            if token is None:
+                token = FlowToken(user_id, next(self._generations))
+                self._tokens.set(user_id, token)
+        return token
+
+    def cancel(self, user_id: int):
+        token = self._tokens.pop(user_id)
+        if token is not None:
+            token.cancel()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telebot import TeleBot, REPLY_MARKUP_TYPES
+from telebot.formatting import escape_html
+from telebot.types import InlineKeyboardMarkup
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+@dataclass
+class OutgoingMessageDTO:
+    chat_id: int | str
+    text: str
+    parse_mode: Optional[str] = None
+    reply_markup: Optional[REPLY_MARKUP_TYPES] = None
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+
+def _merge(first: OutgoingMessageDTO, second: OutgoingMessageDTO) -> Optional[OutgoingMessageDTO]:
+    """
+    Returns the message combining both, or None if they have to stay separate.
+
+    The messages with an inline keyboard are never merged, as the callbacks edit them by id later.
+    """
+    if first.chat_id != second.chat_id or first.kwargs or second.kwargs:
+        return None
+    if first.reply_markup is not None and second.reply_markup is not None:
+        return None
+    reply_markup = first.reply_markup if first.reply_markup is not None else second.reply_markup
+    if isinstance(reply_markup, InlineKeyboardMarkup):
+        return None
+
+    if first.parse_mode == second.parse_mode:
+        parse_mode, first_text, second_text = first.parse_mode, first.text, second.text
+    elif first.parse_mode is None and second.parse_mode == "HTML":
+        parse_mode, first_text, second_text = "HTML", escape_html(first.text), second.text
+    elif first.parse_mode == "HTML" and second.parse_mode is None:
+        parse_mode, first_text, second_text = "HTML", first.text, escape_html(second.text)
+    else:
+        return None
+
+    text = f"{first_text}\n\n{second_text}"
+    if len(text) > MAX_MESSAGE_LENGTH:
+        return None
+    return OutgoingMessageDTO(first.chat_id, text, parse_mode, reply_markup)
+
+
+class ResponseBuilder:
+    """
+    Collects the messages and the edits a handler sends in response to an update, and sends them once it returns.
+
+    The consecutive messages that can be combined are sent as one. The messages of a chat are still sent one by one
+    in order, while the edits, which don't change the order of the chat, are sent concurrently with them.
+    The requests needed before a slow step, e.g. a progress mark, are sent right away with flush().
+    """
+
+    def __init__(self, bot: TeleBot, executor: Executor, logger: Optional[logging.Logger] = None):
+        self.bot = bot
+        self.executor = executor
+        self.logger = logger or logging.getLogger(__name__)
+        self._messages: List[OutgoingMessageDTO] = []
+        # the requests to send in order by their target: the chat for the messages, the message for the edits
+        self._requests: Dict[Tuple, List[Tuple[Callable, tuple, dict]]] = {}
+
+    def send_message(self, chat_id: int | str, text: str, parse_mode: Optional[str] = None,
+                     reply_markup: Optional[REPLY_MARKUP_TYPES] = None, **kwargs):
+        message = OutgoingMessageDTO(chat_id, text, parse_mode, reply_markup, kwargs)
+        merged = _merge(self._messages[-1], message) if self._messages else None
+        if merged is not None:
+            self._messages[-1] = merged
+        else:
+            self._messages.append(message)
+
+    def edit_message_text(self, text: str, chat_id: Optional[int | str] = None, message_id: Optional[int] = None,
+                          **kwargs):
+        self._requests.setdefault(('edit', chat_id, message_id), []).append(
+            (self.bot.edit_message_text, (text, ), dict(chat_id=chat_id, message_id=message_id, **kwargs)))
+
+    def edit_message_reply_markup(self, chat_id: Optional[int | str] = None, message_id: Optional[int] = None,
+                                  reply_markup: Optional[REPLY_MARKUP_TYPES] = None, **kwargs):
+        self._requests.setdefault(('edit', chat_id, message_id), []).append(
+            (self.bot.edit_message_reply_markup, (),
+             dict(chat_id=chat_id, message_id=message_id, reply_markup=reply_markup, **kwargs)))
+
+    def _take_requests(self) -> Dict[Tuple, List[Tuple[Callable, tuple, dict]]]:
+        """
+        Returns the chains of requests of everything collected so far and starts collecting anew.
+        """
+        requests = self._requests
+        for message in self._messages:
+            requests.setdefault(('send', message.chat_id), []).append(
+                (self.bot.send_message, (message.chat_id, message.text),
+                 dict(parse_mode=message.parse_mode, reply_markup=message.reply_markup, **message.kwargs)))
+        self._messages = []
+        self._requests = {}
+        return requests
+
+    def flush(self):
+        """
+        Sends everything collected so far and waits for it, the failed requests are logged.
+        """
+        requests = self._take_requests()
+        if len(requests) == 1:
+            self._send_in_order(next(iter(requests.values())))
+            return
+        futures = [self.executor.submit(self._send_in_order, chain) for chain in requests.values()]
+        for future in futures:
+            future.result()
+
+    def _send_in_order(self, chain: List[Tuple[Callable, tuple, dict]]):
+        for method, args, kwargs in chain:
+            try:
+                method(*args, **kwargs)
+            except Exception as e:
+                self.logger.error(f"Failed to send the response {method.__name__}{args}: {e}")
+
+
+class AsyncResponseBuilder(ResponseBuilder):
+    """
+    ResponseBuilder of the async runtime, sending through AsyncTeleBot: the chains of requests are coroutines
+    run concurrently on the loop instead of jobs of an executor.
+    """
+
+    def __init__(self, bot, logger: Optional[logging.Logger] = None):
+        super().__init__(bot, None, logger)
+
+    async def flush(self):
+        """
+        Sends everything collected so far and waits for it, the failed requests are logged.
+        """
+        await asyncio.gather(*(self._send_in_order(chain) for chain in self._take_requests().values()))
+
+    async def _send_in_order(self, chain: List[Tuple[Callable, tuple, dict]]):
+        for method, args, kwargs in chain:
+            try:
+                await method(*args, **kwargs)
+            except Exception as e:
+                self.logger.error(f"Failed to send the response {method.__name__}{args}: {e}")
@@ -0,0 +1,4 @@
+from .codec import SessionCodec
+from .storage import (OrderSessionStore, MemoryOrderSessionStore, RedisOrderSessionStore,
+                      AsyncOrderSessionStore, AsyncMemoryOrderSessionStore, AsyncRedisOrderSessionStore,
+                      setup_order_session_store, setup_async_order_session_store)
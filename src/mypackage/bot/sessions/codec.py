@@ -0,0 +1,240 @@
+import struct
+import zlib
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+from ...db.dto import (OrderDTO, UserDTO, UserDiscountDTO, ProducerDTO, DispatchPointDTO, UserLocationDTO,
+                       DistanceDTO, ConcreteDTO)
+
+# Scalar field kinds are struct codes and are packed together with the record header
+INT32 = 'i'
+INT64 = 'q'
+FLOAT = 'd'
+BOOL = '?'
+# Variable-size field kinds only put their length or count into the record header
+STR = 'str'
+DATETIME = 'datetime'
+
+ClosestDispatchPoints = Dict[str, Tuple[DispatchPointDTO, DistanceDTO]]
+
+_HEADER = struct.Struct("!BB")  # schema version, flags
+_COMPRESSED = 0b1
+
+_SCALAR, _STR, _DATETIME, _LIST, _RECORD = range(5)
+
+
+class ListOf:
+    def __init__(self, schema: 'RecordSchema'):
+        self.schema = schema
+
+
+class RecordSchema:
+    """
+    Positional binary layout of a dataclass.
+
+    A record is a single struct holding the null bitmap, the scalar values and the string lengths
+    and list counts, followed by the UTF-8 strings and then the nested records, in the field order.
+    The field names are not stored, so any change of the fields requires a new schema version.
+    """
+
+    def __init__(self, cls: type, fields: Sequence[Tuple[str, Any]]):
+        self.cls = cls
+        self.fields = tuple(fields)
+        if len(self.fields) > 32:
+            raise ValueError(f"{cls.__name__} schema has more than 32 fields")
+
+        codes = []
+        # the layout is resolved once, so encoding and decoding don't inspect the field kinds
+        self._plan = []
+        for index, (name, kind) in enumerate(self.fields):
+            if isinstance(kind, RecordSchema):
+                self._plan.append((name, _RECORD, 1 << index, kind))
+                continue
+            if isinstance(kind, ListOf):
+                self._plan.append((name, _LIST, 1 << index, kind.schema))
+                codes.append('H')
+            elif kind == STR or kind == DATETIME:
+                self._plan.append((name, _STR if kind == STR else _DATETIME, 1 << index, None))
+                codes.append('H')
+            else:
+                self._plan.append((name, _SCALAR, 1 << index, None))
+                codes.append(kind)
+        self.struct = struct.Struct("!I" + "".join(codes))
+
+    def encode(self, record, out: List[bytes]):
+        null_bitmap = 0
+        values = []
+        strings = []
+        nested = []
+        for name, op, bit, schema in self._plan:
+            value = getattr(record, name)
+            if value is None:
+                null_bitmap |= bit
+                if op != _RECORD:
+                    values.append(0)
+            elif op == _SCALAR:
+                values.append(value)
+            elif op == _STR or op == _DATETIME:
+                encoded = (value if op == _STR else value.isoformat()).encode()
+                values.append(len(encoded))
+                strings.append(encoded)
+            elif op == _LIST:
+                values.append(len(value))
+                nested.append((schema, value))
+            else:
+                nested.append((schema, (value, )))
+
+        out.append(self.struct.pack(null_bitmap, *values))
+        out.extend(strings)
+        for schema, records in nested:
+            for nested_record in records:
+                schema.encode(nested_record, out)
+
+    def decode(self, buffer: bytes, offset: int) -> Tuple[Any, int]:
+        null_bitmap, *values = self.struct.unpack_from(buffer, offset)
+        offset += self.struct.size
+
+        kwargs = {}
+        nested = []
+        value_index = 0
+        for name, op, bit, schema in self._plan:
+            if op == _RECORD:
+                if null_bitmap & bit:
+                    kwargs[name] = None
+                else:
+                    nested.append((name, schema, -1))
+                continue
+
+            value = values[value_index]
+            value_index += 1
+            if null_bitmap & bit:
+                kwargs[name] = None
+            elif op == _SCALAR:
+                kwargs[name] = value
+            elif op == _LIST:
+                nested.append((name, schema, value))
+            else:
+                string = buffer[offset:offset + value].decode()
+                offset += value
+                kwargs[name] = string if op == _STR else datetime.fromisoformat(string)
+
+        for name, schema, count in nested:
+            if count < 0:
+                kwargs[name], offset = schema.decode(buffer, offset)
+            else:
+                items = []
+                for _ in range(count):
+                    item, offset = schema.decode(buffer, offset)
+                    items.append(item)
+                kwargs[name] = items
+
+        # like pickle, the records are restored without calling __init__, all the fields being set here
+        record = self.cls.__new__(self.cls)
+        record.__dict__.update(kwargs)
+        return record, offset
+
+
+class ClosestDispatchPointRecord:
+    """
+    An entry of the closest dispatch points dict, as the codec only encodes the dataclass-like records.
+    """
+
+    def __init__(self, producer: str, dispatch_point: DispatchPointDTO, distance: DistanceDTO):
+        self.producer = producer
+        self.dispatch_point = dispatch_point
+        self.distance = distance
+
+
+DISPATCH_POINT_SCHEMA = RecordSchema(DispatchPointDTO, [('address', STR), ('latitude', FLOAT),
+                                                        ('longitude', FLOAT)])
+USER_LOCATION_SCHEMA = RecordSchema(UserLocationDTO, [('address', STR), ('latitude', FLOAT), ('longitude', FLOAT)])
+DISTANCE_SCHEMA = RecordSchema(DistanceDTO, [('distance_metres', INT64), ('duration_seconds', INT64)])
+PRODUCER_SCHEMA = RecordSchema(ProducerDTO, [('title', STR), ('id', INT64),
+                                             ('dispatch_points', ListOf(DISPATCH_POINT_SCHEMA))])
+USER_DISCOUNT_SCHEMA = RecordSchema(UserDiscountDTO, [
+    ('id', INT64), ('user_id', INT64), ('producer_id', INT64),
+    ('concrete_discount', INT32), ('delivery_discount', INT32),
+    ('concrete_discount_vat', INT32), ('delivery_discount_vat', INT32),
+    ('producer', PRODUCER_SCHEMA),
+])
+USER_SCHEMA = RecordSchema(UserDTO, [
+    ('first_name', STR), ('tg_user_id', INT64), ('tg_chat_id', INT64), ('is_admin', BOOL),
+    ('last_name', STR), ('tg_username', STR), ('id', INT64), ('phone', STR),
+    ('discounts', ListOf(USER_DISCOUNT_SCHEMA)),
+    ('dispatch_point', DISPATCH_POINT_SCHEMA), ('dispatch_point_id', INT64),
+    ('register_time', DATETIME),
+])
+CONCRETE_SCHEMA = RecordSchema(ConcreteDTO, [('title', STR), ('type_', STR), ('price', INT64), ('producer', STR)])
+ORDER_SCHEMA = RecordSchema(OrderDTO, [
+    ('user', USER_SCHEMA), ('payment_type', STR), ('producer', STR),
+    ('dispatch_point', DISPATCH_POINT_SCHEMA), ('user_location', USER_LOCATION_SCHEMA),
+    ('distance', DISTANCE_SCHEMA), ('concrete', CONCRETE_SCHEMA), ('amount', INT64),
+    ('delivery_cost', INT64), ('concrete_cost', INT64), ('delivery_price', INT64),
+])
+CLOSEST_DISPATCH_POINT_SCHEMA = RecordSchema(ClosestDispatchPointRecord, [
+    ('producer', STR), ('dispatch_point', DISPATCH_POINT_SCHEMA), ('distance', DISTANCE_SCHEMA),
+])
+
+# Bump the version and keep the previous schemas here whenever a session DTO changes,
+# the sessions stored by the previous release stay readable.
+SCHEMA_VERSION = 1
+ORDER_SCHEMAS = {1: ORDER_SCHEMA}
+CLOSEST_DISPATCH_POINT_SCHEMAS = {1: CLOSEST_DISPATCH_POINT_SCHEMA}
+
+
+class SessionCodec:
+    """
+    Versioned binary codec of the order sessions, optionally compressing the large payloads with zlib.
+    """
+
+    def __init__(self, compression: bool = False, compression_threshold: int = 512, compression_level: int = 1):
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.compression_level = compression_level
+
+    def _pack(self, schema: RecordSchema, records: Sequence) -> bytes:
+        out = []
+        for record in records:
+            schema.encode(record, out)
+        payload = b"".join(out)
+
+        flags = 0
+        if self.compression and len(payload) >= self.compression_threshold:
+            payload = zlib.compress(payload, self.compression_level)
+            flags |= _COMPRESSED
+        return _HEADER.pack(SCHEMA_VERSION, flags) + payload
+
+    @staticmethod
+    def _unpack(payload: bytes, schemas: Dict[int, RecordSchema]) -> List:
+        version, flags = _HEADER.unpack_from(payload)
+        schema = schemas.get(version)
+        if schema is None:
+            raise ValueError(f"Unknown session schema version {version}")
+        if flags & ~_COMPRESSED:
+            raise ValueError(f"Unknown session flags {flags:#04x}")
+
+        buffer = payload[_HEADER.size:]
+        if flags & _COMPRESSED:
+            buffer = zlib.decompress(buffer)
+
+        records = []
+        offset = 0
+        while offset < len(buffer):
+            record, offset = schema.decode(buffer, offset)
+            records.append(record)
+        return records
+
+    def encode_order(self, order_dto: OrderDTO) -> bytes:
+        return self._pack(ORDER_SCHEMA, (order_dto, ))
+
+    def decode_order(self, payload: bytes) -> OrderDTO:
+        return self._unpack(payload, ORDER_SCHEMAS)[0]
+
+    def encode_closest_dispatch_points(self, closest_dispatch_points: ClosestDispatchPoints) -> bytes:
+        return self._pack(CLOSEST_DISPATCH_POINT_SCHEMA,
+                          [ClosestDispatchPointRecord(producer, dispatch_point, distance)
+                           for producer, (dispatch_point, distance) in closest_dispatch_points.items()])
+
+    def decode_closest_dispatch_points(self, payload: bytes) -> ClosestDispatchPoints:
+        return {record.producer: (record.dispatch_point, record.distance)
+                for record in self._unpack(payload, CLOSEST_DISPATCH_POINT_SCHEMAS)}
@@ -0,0 +1,256 @@
+import struct
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+from .codec import SessionCodec, ClosestDispatchPoints
+from ..cache import LRUCache
+from ...config.models import BotStateStorageConfig, OrderSessionStorageConfig
+from ...db.dto import OrderDTO
+
+
+class OrderSessionStore(ABC):
+    """
+    Keeps the order being calculated and the closest dispatch points of each user between the updates.
+
+    The handlers load the order, change it and save it back, so the session outlives the process
+    and any bot worker can continue the user's calculation.
+    """
+
+    @abstractmethod
+    def get_order(self, user_id: int) -> Optional[OrderDTO]:
+        pass
+
+    @abstractmethod
+    def save_order(self, user_id: int, order_dto: OrderDTO):
+        pass
+
+    @abstractmethod
+    def get_closest_dispatch_points(self, user_id: int) -> Optional[ClosestDispatchPoints]:
+        pass
+
+    @abstractmethod
+    def save_closest_dispatch_points(self, user_id: int, closest_dispatch_points: ClosestDispatchPoints):
+        pass
+
+    @abstractmethod
+    def clear(self, user_id: int):
+        pass
+
+    def has_order(self, user_id: int) -> bool:
+        return self.get_order(user_id) is not None
+
+
+class MemoryOrderSessionStore(OrderSessionStore):
+    """
+    In-process sessions, bounded both in time and in number: the least recently used ones are evicted first.
+    """
+
+    def __init__(self, ttl: Optional[int] = None, max_size: int = 10000):
+        self.orders = LRUCache(max_size=max_size, ttl=ttl)
+        self.closest_dispatch_points = LRUCache(max_size=max_size, ttl=ttl)
+
+    def get_order(self, user_id: int) -> Optional[OrderDTO]:
+        return self.orders.get(user_id)
+
+    def save_order(self, user_id: int, order_dto: OrderDTO):
+        self.orders.set(user_id, order_dto)
+
+    def get_closest_dispatch_points(self, user_id: int) -> Optional[ClosestDispatchPoints]:
+        return self.closest_dispatch_points.get(user_id)
+
+    def save_closest_dispatch_points(self, user_id: int, closest_dispatch_points: ClosestDispatchPoints):
+        self.closest_dispatch_points.set(user_id, closest_dispatch_points)
+
+    def clear(self, user_id: int):
+        self.orders.pop(user_id)
+        self.closest_dispatch_points.pop(user_id)
+
+
+class RedisOrderSessionStore(OrderSessionStore):
+    """
+    Sessions shared by all the bot workers, expiring after the ttl of inactivity.
+
+    The sessions are stored in the versioned binary format of the SessionCodec, the ones that can't be decoded,
+    e.g. stored by a release with an unknown schema, are treated as expired.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0, password: Optional[str] = None,
+                 prefix: str = 'telebot_', ttl: Optional[int] = None, codec: Optional[SessionCodec] = None):
+        try:
+            from redis import Redis
+        except ImportError:
+            raise ImportError("Please install redis using `pip install redis`")
+
+        self.redis = Redis(host=host, port=port, db=db, password=password)
+        self.prefix = f"{prefix}order_session_"
+        self.ttl = ttl
+        self.codec = codec or SessionCodec()
+
+    def _get(self, key: str, decode: Callable[[bytes], object]):
+        payload = self.redis.get(key)
+        if payload is None:
+            return None
+        try:
+            return decode(payload)
+        except (ValueError, TypeError, struct.error, zlib.error):
+            self.redis.delete(key)
+            return None
+
+    def get_order(self, user_id: int) -> Optional[OrderDTO]:
+        return self._get(f"{self.prefix}order_{user_id}", self.codec.decode_order)
+
+    def save_order(self, user_id: int, order_dto: OrderDTO):
+        self.redis.set(f"{self.prefix}order_{user_id}", self.codec.encode_order(order_dto), ex=self.ttl)
+
+    def get_closest_dispatch_points(self, user_id: int) -> Optional[ClosestDispatchPoints]:
+        return self._get(f"{self.prefix}closest_dispatch_points_{user_id}", self.codec.decode_closest_dispatch_points)
+
+    def save_closest_dispatch_points(self, user_id: int, closest_dispatch_points: ClosestDispatchPoints):
+        self.redis.set(f"{self.prefix}closest_dispatch_points_{user_id}",
+                       self.codec.encode_closest_dispatch_points(closest_dispatch_points), ex=self.ttl)
+
+    def clear(self, user_id: int):
+        self.redis.delete(f"{self.prefix}order_{user_id}", f"{self.prefix}closest_dispatch_points_{user_id}")
+
+
+class AsyncOrderSessionStore(ABC):
+    """
+    OrderSessionStore of the async runtime, shared with the blocking handlers running next to the async ones.
+    """
+
+    @abstractmethod
+    async def get_order(self, user_id: int) -> Optional[OrderDTO]:
+        pass
+
+    @abstractmethod
+    async def save_order(self, user_id: int, order_dto: OrderDTO):
+        pass
+
+    @abstractmethod
+    async def get_closest_dispatch_points(self, user_id: int) -> Optional[ClosestDispatchPoints]:
+        pass
+
+    @abstractmethod
+    async def save_closest_dispatch_points(self, user_id: int, closest_dispatch_points: ClosestDispatchPoints):
+        pass
+
+    @abstractmethod
+    async def clear(self, user_id: int):
+        pass
+
+
+class AsyncMemoryOrderSessionStore(AsyncOrderSessionStore):
+    """
+    The in-process sessions of the blocking store, which never wait.
+    """
+
+    def __init__(self, store: MemoryOrderSessionStore):
+        self.store = store
+
+    async def get_order(self, user_id: int) -> Optional[OrderDTO]:
+        return self.store.get_order(user_id)
+
+    async def save_order(self, user_id: int, order_dto: OrderDTO):
+        self.store.save_order(user_id, order_dto)
+
+    async def get_closest_dispatch_points(self, user_id: int) -> Optional[ClosestDispatchPoints]:
+        return self.store.get_closest_dispatch_points(user_id)
+
+    async def save_closest_dispatch_points(self, user_id: int, closest_dispatch_points: ClosestDispatchPoints):
+        self.store.save_closest_dispatch_points(user_id, closest_dispatch_points)
+
+    async def clear(self, user_id: int):
+        self.store.clear(user_id)
+
+
+class AsyncRedisOrderSessionStore(AsyncOrderSessionStore):
+    """
+    The sessions of RedisOrderSessionStore, under the same keys and in the same format, through the asyncio client.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0, password: Optional[str] = None,
+                 prefix: str = 'telebot_', ttl: Optional[int] = None, codec: Optional[SessionCodec] = None):
+        try:
+            from redis.asyncio import Redis
+        except ImportError:
+            raise ImportError("Please install redis using `pip install redis`")
+
+        self.redis = Redis(host=host, port=port, db=db, password=password)
+        self.prefix = f"{prefix}order_session_"
+        self.ttl = ttl
+        self.codec = codec or SessionCodec()
+
+    async def _get(self, key: str, decode: Callable[[bytes], object]):
+        payload = await self.redis.get(key)
+        if payload is None:
+            return None
+        try:
+            return decode(payload)
+        except (ValueError, TypeError, struct.error, zlib.error):
+            await self.redis.delete(key)
+            return None
+
+    async def get_order(self, user_id: int) -> Optional[OrderDTO]:
+        return await self._get(f"{self.prefix}order_{user_id}", self.codec.decode_order)
+
+    async def save_order(self, user_id: int, order_dto: OrderDTO):
+        await self.redis.set(f"{self.prefix}order_{user_id}", self.codec.encode_order(order_dto), ex=self.ttl)
+
+    async def get_closest_dispatch_points(self, user_id: int) -> Optional[ClosestDispatchPoints]:
+        return await self._get(f"{self.prefix}closest_dispatch_points_{user_id}",
+                               self.codec.decode_closest_dispatch_points)
+
+    async def save_closest_dispatch_points(self, user_id: int, closest_dispatch_points: ClosestDispatchPoints):
+        await self.redis.set(f"{self.prefix}closest_dispatch_points_{user_id}",
+                             self.codec.encode_closest_dispatch_points(closest_dispatch_points), ex=self.ttl)
+
+    async def clear(self, user_id: int):
+        await self.redis.delete(f"{self.prefix}order_{user_id}", f"{self.prefix}closest_dispatch_points_{user_id}")
+
+
+def setup_order_session_store(session_config: Optional[OrderSessionStorageConfig],
+                              state_storage_config: Optional[BotStateStorageConfig]) -> OrderSessionStore:
+    if session_config is None:
+        session_config = OrderSessionStorageConfig()
+
+    if session_config.type == 'memory':
+        return MemoryOrderSessionStore(ttl=session_config.ttl, max_size=session_config.max_size)
+
+    # the redis sessions live next to the states, thus the state storage connection settings are reused
+    if state_storage_config is None or state_storage_config.redis is None:
+        raise ValueError('state_storage.redis is required if order_sessions.type is "redis"')
+    redis_config = state_storage_config.redis
+    return RedisOrderSessionStore(
+        host=redis_config.host,
+        port=redis_config.port,
+        db=redis_config.db,
+        password=redis_config.password,
+        prefix=redis_config.prefix,
+        ttl=session_config.ttl,
+        codec=SessionCodec(compression=bool(session_config.compression)),
+    )
+
+
+def setup_async_order_session_store(session_config: Optional[OrderSessionStorageConfig],
+                                    state_storage_config: Optional[BotStateStorageConfig],
+                                    order_sessions: OrderSessionStore) -> AsyncOrderSessionStore:
+    """
+    Sets up the async store of the same sessions as the blocking one, the in-process sessions are the very same.
+    """
+    if session_config is None:
+        session_config = OrderSessionStorageConfig()
+
+    if session_config.type == 'memory':
+        return AsyncMemoryOrderSessionStore(order_sessions)
+
+    redis_config = state_storage_config.redis
+    return AsyncRedisOrderSessionStore(
+        host=redis_config.host,
+        port=redis_config.port,
+        db=redis_config.db,
+        password=redis_config.password,
+        prefix=redis_config.prefix,
+        ttl=session_config.ttl,
+        codec=SessionCodec(compression=bool(session_config.compression)),
+    )
@@ -3,3 +3,13 @@ from telebot.handler_backends import StatesGroup, State
 
 class UnregisteredStates(StatesGroup):
     started = State()
+
+
+class CalculationStates(StatesGroup):
+    location = State()
+    amount = State()
+    price_sheet_location = State()
+
+
+class AdminStates(StatesGroup):
+    discount = State()
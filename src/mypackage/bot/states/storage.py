@@ -1,3 +1,4 @@
+from telebot import asyncio_storage
 from telebot.storage import StateMemoryStorage, StateRedisStorage
 
 from ...config.models import BotStateStorageConfig
@@ -17,3 +18,19 @@ def setup_state_storage(storage_config: BotStateStorageConfig):
         )
 
     return state_storage
+
+
+# The same storages for AsyncTeleBot of the async runtime
+def setup_async_state_storage(storage_config: BotStateStorageConfig):
+    if storage_config.type == 'memory':
+        state_storage = asyncio_storage.StateMemoryStorage()
+    else:
+        state_storage = asyncio_storage.StateRedisStorage(
+            host=storage_config.redis.host,
+            port=storage_config.redis.port,
+            db=storage_config.redis.db,
+            password=storage_config.redis.password,
+            prefix=storage_config.redis.prefix,
+        )
+
+    return state_storage
@@ -0,0 +1,345 @@
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from requests.exceptions import RequestException
+from telebot import TeleBot, apihelper
+from telebot.apihelper import ApiException
+from telebot.types import Update
+
+from .dispatcher import ShardedTeleBot, get_update_json_shard_key
+from ..config.models import BotConfig, BotWebhookConfig
+
+# Seconds between the checks of the worker processes
+MONITOR_INTERVAL = 1.0
+# Seconds to wait before polling again after a failed getUpdates
+POLLING_RETRY_DELAY = 3.0
+# Seconds to wait for the workers to process the queued updates before the chats are moved anyway,
+# e.g. if an update was lost with a crashed worker
+DRAIN_TIMEOUT = 30.0
+
+# Builds the bot of a worker process from the factory arguments, returns it with its logger
+BotFactory = Callable[..., tuple[TeleBot, logging.Logger]]
+
+
+def _hash(key) -> int:
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing ring of the workers, each one placed at the given number of points.
+
+    A key belongs to the worker of the first point after its hash, so adding or removing a worker
+    only moves the keys of its points, about 1 / N of them, the rest stay with their workers.
+    """
+
+    def __init__(self, nodes: Iterable[int] = (), replicas: int = 100):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._nodes: List[int] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: int):
+        for replica in range(self.replicas):
+            point = _hash(f"{node}:{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node: int):
+        points = [(point, other) for point, other in zip(self._points, self._nodes) if other != node]
+        self._points = [point for point, _ in points]
+        self._nodes = [other for _, other in points]
+
+    def get(self, key) -> int:
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._nodes[index]
+
+
+def _run_worker(worker_id: int, updates, taken, processed, ready, bot_factory: BotFactory, factory_args: tuple):
+    bot, logger = bot_factory(*factory_args)
+    if getattr(bot, 'threaded', False):
+        # the update would be counted as processed while its handlers still run on the TeleBot thread pool
+        bot.threaded = False
+        bot.worker_pool.close()
+    logger.info(f"Bot worker {worker_id} is ready")
+    ready.set()
+    while True:
+        update_json = updates.get()
+        if update_json is None:
+            break
+        with taken.get_lock():
+            taken.value += 1
+        try:
+            bot.process_new_updates([Update.de_json(update_json)])
+        except Exception as e:
+            logger.error(f"Exception while processing update {update_json.get('update_id')} "
+                         f"on worker {worker_id}: {e}")
+        with processed.get_lock():
+            processed.value += 1
+
+    if isinstance(bot, ShardedTeleBot):
+        bot.stop_workers()
+    logger.info(f"Bot worker {worker_id} is stopped")
+
+
+class Supervisor:
+    """
+    Runs the bot on worker processes, so the handlers aren't limited by the GIL of a single one.
+
+    The ingress, the polling or the webhook, routes each update to the worker of its chat found on the consistent
+    hashing ring, thus the updates of a chat keep their order and the per process state, e.g. the anti-flood times,
+    stays with the chat. A worker has a bounded queue of its own, which outlives the process: a worker that died
+    is started again on the same queue and a restarted one takes over the updates queued behind the old one.
+    Changing the number of workers waits for the queued updates to be processed before the chats are moved,
+    so a chat is never processed by two workers at once. A worker runs the handlers of an update before it takes
+    the next one and counts it as processed once they have returned, thus the bot must not hand the updates over
+    to threads of its own, e.g. those of ShardedTeleBot.
+    The states have to be kept in Redis to move with the chats.
+    Implements the interface of the webhook UpdateQueue.
+    """
+
+    def __init__(self, bot_factory: BotFactory, factory_args: tuple = (), workers: int = 4, queue_size: int = 1000,
+                 replicas: int = 100, logger: Optional[logging.Logger] = None):
+        self.bot_factory = bot_factory
+        self.factory_args = factory_args
+        self.workers = workers
+        self.queue_size = queue_size
+        self.logger = logger or logging.getLogger(__name__)
+
+        # the workers are spawned, as forking copies the locks held by the threads of the ingress
+        self._context = multiprocessing.get_context('spawn')
+        self._ring = HashRing(range(workers), replicas)
+        self._queues: Dict[int, multiprocessing.Queue] = {}
+        # the updates taken from a queue and processed by its workers
+        self._taken: Dict[int, multiprocessing.Value] = {}
+        self._processed: Dict[int, multiprocessing.Value] = {}
+        self._ready: Dict[int, multiprocessing.Event] = {}
+        self._processes: Dict[int, multiprocessing.Process] = {}
+        self._routing_lock = threading.Lock()  # held while routing an update and while the ring changes
+        # held while a worker is stopped on purpose, so the monitor doesn't restart it
+        self._workers_lock = threading.RLock()
+        self._stopping = threading.Event()
+        self._monitor = threading.Thread(target=self._run_monitor, name="bot_supervisor", daemon=True)
+
+        self.dispatched_count: Dict[int, int] = {}
+        self.rejected_count = 0
+        self.restart_count = 0
+
+    def start(self):
+        with self._workers_lock:
+            for worker_id in range(self.workers):
+                self._start_worker(worker_id)
+        self._monitor.start()
+
+    def _start_worker(self, worker_id: int):
+        if worker_id not in self._queues:
+            self._queues[worker_id] = self._context.Queue(maxsize=self.queue_size)
+            self._taken[worker_id] = self._context.Value('Q', 0)
+            self._processed[worker_id] = self._context.Value('Q', 0)
+            self.dispatched_count[worker_id] = 0
+        self._ready[worker_id] = self._context.Event()
+        process = self._context.Process(
+            target=_run_worker, name=f"bot_worker_{worker_id}", daemon=True,
+            args=(worker_id, self._queues[worker_id], self._taken[worker_id], self._processed[worker_id],
+                  self._ready[worker_id], self.bot_factory, self.factory_args))
+        process.start()
+        self._processes[worker_id] = process
+        self.logger.info(f"Started bot worker {worker_id}, pid {process.pid}")
+
+    def _retire_worker(self, worker_id: int, timeout: Optional[float] = None):
+        """
+        Stops the worker once it has processed the updates queued before, the later ones stay in the queue.
+        """
+        with self._workers_lock:
+            if self._processes[worker_id].is_alive():
+                self._queues[worker_id].put(None)
+            self._processes[worker_id].join(timeout)
+
+    def _run_monitor(self):
+        while not self._stopping.wait(MONITOR_INTERVAL):
+            with self._workers_lock:
+                for worker_id, process in list(self._processes.items()):
+                    if process.is_alive() or self._stopping.is_set():
+                        continue
+                    self.logger.warning(f"Bot worker {worker_id} exited with code {process.exitcode}, restarting")
+                    # the update the worker was processing is lost with it
+                    self._processed[worker_id].value = self._taken[worker_id].value
+                    self.restart_count += 1
+                    self._start_worker(worker_id)
+
+    def put(self, update_json: dict, block: bool = False) -> bool:
+        """
+        Queues the update for the worker of its chat.
+
+        Returns:
+            bool: False if the queue of the worker is full and block isn't set, thus the update has to be refused.
+        """
+        with self._routing_lock:
+            worker_id = self._ring.get(get_update_json_shard_key(update_json))
+            try:
+                self._queues[worker_id].put(update_json, block=block)
+            except queue.Full:
+                self.rejected_count += 1
+                return False
+            self.dispatched_count[worker_id] += 1
+        return True
+
+    def restart(self, ready_timeout: Optional[float] = 60):
+        """
+        Restarts the workers one by one, each after the previous one is ready, e.g. to apply a new config.
+        """
+        for worker_id in sorted(self._processes):
+            with self._workers_lock:
+                self._retire_worker(worker_id)
+                self._start_worker(worker_id)
+            self._ready[worker_id].wait(ready_timeout)
+        self.logger.info("Restarted all the bot workers")
+
+    def resize(self, workers: int):
+        """
+        Changes the number of the workers, moving the chats of the ring points that changed hands.
+        """
+        with self._routing_lock:
+            # no chat has updates left on its old worker once they're moved
+            deadline = time.monotonic() + DRAIN_TIMEOUT
+            while any(self._processed[worker_id].value < dispatched
+                      for worker_id, dispatched in self.dispatched_count.items()):
+                if time.monotonic() > deadline:
+                    self.logger.warning("Bot workers haven't processed all the queued updates, resizing anyway")
+                    break
+                time.sleep(0.05)
+            with self._workers_lock:
+                for worker_id in range(workers, self.workers):
+                    self._ring.remove(worker_id)
+                    self._retire_worker(worker_id)
+                    del self._processes[worker_id], self._queues[worker_id], self._ready[worker_id]
+                    del self._taken[worker_id], self._processed[worker_id], self.dispatched_count[worker_id]
+                for worker_id in range(self.workers, workers):
+                    self._ring.add(worker_id)
+                    self._start_worker(worker_id)
+                self.workers = workers
+        self.logger.info(f"Resized the bot workers to {workers}")
+
+    @property
+    def ready(self) -> bool:
+        return not self._stopping.is_set() and all(process.is_alive() for process in self._processes.values())
+
+    def get_metrics(self) -> Dict[str, object]:
+        """
+        Returns the state, the queue depth and the number of the updates routed of every worker.
+        """
+        workers = {}
+        for worker_id, process in list(self._processes.items()):
+            try:
+                depth = self._queues[worker_id].qsize()
+            except NotImplementedError:
+                # not available on macOS
+                depth = None
+            workers[worker_id] = {
+                'pid': process.pid,
+                'alive': process.is_alive(),
+                'queue_depth': depth,
+                'dispatched': self.dispatched_count.get(worker_id, 0),
+                'processed': self._processed[worker_id].value,
+            }
+        return {'workers': workers, 'rejected': self.rejected_count, 'restarts': self.restart_count}
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Lets the workers process the already queued updates and stops them.
+        """
+        self._stopping.set()
+        for worker_id in list(self._processes):
+            self._queues[worker_id].put(None)
+        for process in self._processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+def _in_background(target: Callable, *args):
+    # the main thread keeps routing the updates meanwhile
+    threading.Thread(target=target, args=args, daemon=True).start()
+
+
+def install_signal_handlers(supervisor: Supervisor):
+    """
+    SIGHUP restarts the workers one by one, SIGTTIN and SIGTTOU add and remove a worker.
+
+    The handlers can only be installed from the main thread, and aren't on the platforms without these signals.
+    """
+    if not hasattr(signal, 'SIGHUP'):
+        return
+    if threading.current_thread() is not threading.main_thread():
+        supervisor.logger.warning("Not on the main thread, the bot workers can't be restarted or resized by signals")
+        return
+    signal.signal(signal.SIGHUP, lambda *_: _in_background(supervisor.restart))
+    signal.signal(signal.SIGTTIN, lambda *_: _in_background(supervisor.resize, supervisor.workers + 1))
+    signal.signal(signal.SIGTTOU, lambda *_: _in_background(supervisor.resize, max(1, supervisor.workers - 1)))
+
+
+def poll_updates(supervisor: Supervisor, token: str, drop_pending: bool,
+                 allowed_updates: Optional[list[str]] = None, logger: Optional[logging.Logger] = None):
+    """
+    Long polling of the ingress, an update is confirmed to Telegram once it is queued for its worker.
+
+    The workers are restarted and resized by the signals of install_signal_handlers,
+    SIGTERM stops the polling like Ctrl+C.
+    """
+    logger = logger or logging.getLogger(__name__)
+    install_signal_handlers(supervisor)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    apihelper.delete_webhook(token, drop_pending_updates=drop_pending)
+    offset = None
+    while True:
+        try:
+            updates = apihelper.get_updates(token, offset, allowed_updates=allowed_updates,
+                                            long_polling_timeout=20)
+        except (ApiException, RequestException) as e:
+            logger.error(f"Failed to get the updates: {e}")
+            time.sleep(POLLING_RETRY_DELAY)
+            continue
+        for update_json in updates:
+            supervisor.put(update_json, block=True)
+            offset = update_json['update_id'] + 1
+
+
+def set_webhook(token: str, drop_pending: bool, allowed_updates: Optional[list[str]],
+                webhook_config: BotWebhookConfig):
+    """
+    Sets the webhook of the ingress, which has no bot of its own, as launch_bot sets the one of the bot.
+    """
+    apihelper.delete_webhook(token)
+    time.sleep(1)
+    apihelper.set_webhook(
+        token,
+        url=f"{webhook_config.base_url}/{webhook_config.path}",
+        certificate=webhook_config.cert_path,
+        max_connections=webhook_config.max_connections,
+        allowed_updates=allowed_updates,
+        ip_address=webhook_config.ip_address,
+        drop_pending_updates=drop_pending,
+        secret_token=webhook_config.secret_token
+    )
+
+
+def setup_supervisor(bot_config: BotConfig, bot_factory: BotFactory, factory_args: tuple,
+                     logger: logging.Logger) -> Supervisor:
+    return Supervisor(
+        bot_factory,
+        factory_args,
+        workers=bot_config.processes.workers,
+        queue_size=bot_config.processes.queue_size,
+        replicas=bot_config.processes.replicas,
+        logger=logger,
+    )
@@ -0,0 +1,221 @@
+import math
+from string import Formatter
+from typing import Any, Dict, Iterable, List
+
+from . import texts
+from .utils import MAX_TRACK_AMOUNT, MIN_MIXER_AMOUNT, MAX_DELIVERY_DISTANCE
+from ..db.dto import OrderDTO, UserDTO, QuoteDTO, ConcretePriceDTO
+from ..money import apply_discount, divide, format_uah
+
+TRUCK_CONCRETE_TYPES = ("P1", "P2")
+
+
+class MessageTemplate:
+    """
+    Message layout compiled once on import.
+
+    The layout is parsed once and compiled into a function evaluating a single f-string over a flat
+    precomputed record, so rendering neither re-parses the layout nor concatenates the message piece by piece.
+    """
+
+    def __init__(self, layout: str):
+        self.layout = layout
+
+        parts = []
+        fields = {}
+        for literal, field, format_spec, conversion in Formatter().parse(layout):
+            if literal:
+                parts.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field is not None:
+                # the field names are passed as globals, so the compiled f-string doesn't need any quotes
+                key = fields.setdefault(field, f"_field_{len(fields)}")
+                parts.append(f"{{record[{key}]"
+                             f"{'!' + conversion if conversion else ''}"
+                             f"{':' + format_spec if format_spec else ''}}}")
+
+        self.fields = frozenset(fields)
+        source = f"lambda record: f{''.join(parts)!r}"
+        self.render = eval(compile(source, "<message template>", "eval"), {key: field for field, key in fields.items()})
+
+    def render_many(self, records: Iterable[Dict[str, Any]]) -> str:
+        render = self.render
+        return "".join([render(record) for record in records])
+
+
+USER_INFO_USERNAME = MessageTemplate("<i><b>Від:</b></i> @{tg_username}\n\n")
+USER_INFO_LINK = MessageTemplate("<i><b>Від:</b></i> <a href=\"tg://user?id={tg_user_id}\">{first_name}</a>\n\n")
+
+PRICE = MessageTemplate("<b>{price} UAH</b>")
+PRICE_WITH_DISCOUNT = MessageTemplate("<s>{price} UAH</s> <b>{discounted_price} UAH</b>")
+
+DELIVERY_TRUCK = MessageTemplate(
+    "Ціна достави*: <i>{deliveries_count} × {delivery_price} ({distance_km_int} km)</i> = {delivery_cost_msg}\n"
+)
+DELIVERY_MIXER = MessageTemplate(
+    "Ціна достави: <i>{amount_label} m³ × {delivery_price} ({distance_km_int} km)</i> = {delivery_cost_msg}\n"
+)
+
+ORDER_SUMMARY = MessageTemplate(
+    "Ціна бетону: <i>{amount} m³ × {concrete_price}</i> = {concrete_cost_msg}\n"
+    "{delivery_msg}"
+    "\n<b>Сума:</b> {concrete_cost} + {delivery_cost} = <b>{total_cost} UAH</b> <i>({cost_per_m3} UAH/м³)</i>\n"
+    "\n<b>Спосіб оплати:</b> {payment_type}\n"
+    "{footnote}"
+)
+
+ORDER = MessageTemplate(
+    "<b>Нове замовлення!</b>\n\n"
+    "{user_info}"
+    "<i><b>Спосіб оплати:</b></i> {payment_type}\n\n"
+    "<i><b>Адреса доставки:</b></i> {address}\n"
+    "<i><b>Точка відправлення:</b></i> {dispatch_point}\n"
+    "<i><b>Відстань:</b></i> {distance_km} км\n\n"
+    "<i><b>Виробник:</b></i> {producer}\n\n"
+    "<i><b>Вид бетону:</b></i> {concrete_title} ({concrete_price} UAH/м3)\n"
+    "<i><b>Кількість:</b></i> {amount} м3\n"
+    "<i><b>Вартість бетону{concrete_discount_label}:</b></i> {concrete_cost_msg}\n"
+    "<i><b>Вартість достави{delivery_discount_label}:</b></i> {delivery_cost_msg}\n\n"
+    "- - - - - - - - - - - - - - - - - - - - -\n\n"
+    "<b>Сума:</b> {total_cost} UAH ({cost_per_m3} UAH/м3)\n"
+)
+
+CONCRETE_TYPE_HEADER = MessageTemplate(
+    "{payment_emoji} Категорія <b>{concrete_type_title}</b>.\nЦіна вказана з врахуванням доставки:\n\n"
+)
+CONCRETE_TYPE_LINE = MessageTemplate("{title} - <b>{price}</b> UAH за м³\n")
+
+PRICE_SHEET_HEADER = MessageTemplate(
+    "{payment_emoji} <b>{title}</b>\n"
+    "<i><b>Адреса доставки:</b></i> {address}\n"
+    "<i><b>Спосіб оплати:</b></i> {payment_type}\n"
+)
+PRICE_SHEET_PRODUCER = MessageTemplate(
+    "\n<b>{producer}</b>{best_option}\n<i>{dispatch_point} ({distance_km_int} км)</i>\n"
+)
+PRICE_SHEET_CONCRETE_TYPE = MessageTemplate("\n<u>{type_}</u>\n")
+PRICE_SHEET_LINE = MessageTemplate("{title} - <b>{price}</b> UAH\n")
+
+TRUCK_FOOTNOTE = f"\n<em>*{texts.more_than_one_truck}</em>"
+MIXER_FOOTNOTE = f"\n<em>*{texts.less_than_7_m3}</em>"
+
+
+def price_msg(price: int, discount: int) -> str:
+    if discount:
+        return PRICE_WITH_DISCOUNT.render({"price": format_uah(price),
+                                           "discounted_price": format_uah(apply_discount(price, discount))})
+    return PRICE.render({"price": format_uah(price)})
+
+
+def payment_emoji(payment_type: str) -> str:
+    return texts.cash_emoji if payment_type == texts.cash_payment else texts.cashless_emoji
+
+
+def user_info(user: UserDTO) -> str:
+    if user.tg_username:
+        return USER_INFO_USERNAME.render({"tg_username": user.tg_username})
+    return USER_INFO_LINK.render({"tg_user_id": user.tg_user_id, "first_name": user.first_name})
+
+
+def order_record(order_dto: OrderDTO) -> Dict[str, Any]:
+    """
+    Precomputes the flat record all the order messages are rendered from.
+
+    The discounts are looked up and the costs in kopiykas are computed once here,
+    so every message shows the same numbers and the amounts are only formatted as UAH.
+    """
+    concrete_discount, delivery_discount = order_dto.concrete_discount, order_dto.delivery_discount
+    is_truck = order_dto.concrete.type_ in TRUCK_CONCRETE_TYPES
+
+    concrete_cost = order_dto.concrete_cost_with_discount
+    delivery_cost = order_dto.delivery_cost_with_discount
+    total_cost = concrete_cost + delivery_cost
+
+    record = {
+        "payment_type": order_dto.payment_type,
+        "payment_emoji": payment_emoji(order_dto.payment_type),
+        "address": order_dto.user_location.address,
+        "dispatch_point": order_dto.dispatch_point.address,
+        "distance_km": round(order_dto.distance.distance_metres / 1000, 2),
+        "distance_km_int": int(order_dto.distance.distance_metres / 1000),
+        "producer": order_dto.producer,
+        "concrete_title": order_dto.concrete.title,
+        "concrete_price": format_uah(order_dto.concrete.price),
+        "amount": order_dto.amount,
+        "amount_label": order_dto.amount if order_dto.amount >= MIN_MIXER_AMOUNT else f"{MIN_MIXER_AMOUNT}*",
+        "deliveries_count": int(math.ceil(order_dto.amount / MAX_TRACK_AMOUNT)) if is_truck else 1,
+        "delivery_price": format_uah(order_dto.delivery_price),
+        "concrete_discount_label": f" (-{concrete_discount}%)" if concrete_discount else "",
+        "delivery_discount_label": f" (-{delivery_discount}%)" if delivery_discount else "",
+        "concrete_cost_msg": price_msg(order_dto.concrete_cost, concrete_discount),
+        "delivery_cost_msg": price_msg(order_dto.delivery_cost, delivery_discount),
+        "concrete_cost": format_uah(concrete_cost),
+        "delivery_cost": format_uah(delivery_cost),
+        "total_cost": format_uah(total_cost),
+        "cost_per_m3": format_uah(divide(total_cost, order_dto.amount)),
+    }
+
+    if is_truck:
+        record["footnote"] = TRUCK_FOOTNOTE
+    elif order_dto.amount < MIN_MIXER_AMOUNT:
+        record["footnote"] = MIXER_FOOTNOTE
+    else:
+        record["footnote"] = ""
+
+    record["delivery_msg"] = (DELIVERY_TRUCK if is_truck else DELIVERY_MIXER).render(record)
+    return record
+
+
+def render_order(order_dto: OrderDTO) -> str:
+    record = order_record(order_dto)
+    record["user_info"] = user_info(order_dto.user)
+    return ORDER.render(record)
+
+
+def render_order_summary(order_dto: OrderDTO) -> str:
+    return ORDER_SUMMARY.render(order_record(order_dto))
+
+
+def render_concrete_type_prices(payment_type: str, concrete_type_title: str, prices: List[ConcretePriceDTO]) -> str:
+    """
+    Renders the prices per m³ (delivery included) of all the concretes of the type.
+    """
+    header = CONCRETE_TYPE_HEADER.render({
+        "payment_emoji": payment_emoji(payment_type),
+        "concrete_type_title": concrete_type_title,
+    })
+    return header + CONCRETE_TYPE_LINE.render_many(
+        {"title": concrete_price.concrete.title, "price": format_uah(concrete_price.price)} for concrete_price in prices
+    )
+
+
+def render_price_sheet(quote: QuoteDTO) -> str:
+    """
+    Renders the full price table of every producer in range and every concrete for a location.
+    """
+    parts = [PRICE_SHEET_HEADER.render({
+        "payment_emoji": payment_emoji(quote.payment_type),
+        "title": texts.price_sheet_title,
+        "address": quote.user_location.address,
+        "payment_type": quote.payment_type,
+    })]
+
+    for producer_quote in quote.producers:
+        if producer_quote.distance.distance_metres > MAX_DELIVERY_DISTANCE:
+            continue
+
+        parts.append(PRICE_SHEET_PRODUCER.render({
+            "producer": producer_quote.producer,
+            "best_option": f" {texts.best_option_emoji}" if producer_quote.producer == quote.best_producer else "",
+            "dispatch_point": producer_quote.dispatch_point.address,
+            "distance_km_int": int(producer_quote.distance.distance_metres / 1000),
+        }))
+
+        concrete_type = None
+        for concrete_price in producer_quote.prices:
+            if concrete_price.concrete.type_ != concrete_type:
+                concrete_type = concrete_price.concrete.type_
+                parts.append(PRICE_SHEET_CONCRETE_TYPE.render({"type_": concrete_type}))
+            parts.append(PRICE_SHEET_LINE.render({"title": concrete_price.concrete.title,
+                                                  "price": format_uah(concrete_price.price)}))
+
+    return "".join(parts)
@@ -31,6 +31,8 @@ user_location_too_far = "Відстань поїздки більше 150 км.
 
 best_option_emoji = "🥇"
 
+price_sheet_title = "Ціни з доставкою за 1 м³"
+
 
 unknown_error = "Ой! Схоже щось сталося..."
 geopos_not_found = "Не знайдено адресу. Перевірте правильність або уточніть її."
@@ -1,6 +1,7 @@
 welcome_message = "Вітаю!"
 
 make_calculation_button = "Зробити розрахунок"
+price_sheet_button = "Усі ціни за адресою"
 admin_button = "Адмінка"
 
 cancel_button = "❌Скасувати"
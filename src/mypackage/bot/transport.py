@@ -0,0 +1,169 @@
+import logging
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import TeleBot, apihelper
+
+from .local_api import LOCAL_CONNECT_TIMEOUT
+from ..config.models import BotConfig
+
+# The Bot API method whose read timeout is set by the long polling timeout, thus never overridden
+LONG_POLLING_METHOD = 'getUpdates'
+
+
+class _HttpxResponse:
+    """
+    The parts of requests.Response apihelper reads from the result of a request sender.
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status_code
+        self.reason = response.reason_phrase
+        self.content = response.content
+
+    @property
+    def text(self) -> str:
+        return self.response.text
+
+    def json(self):
+        return self.response.json()
+
+
+class BotApiTransport:
+    """
+    Request sender of apihelper keeping a single pool of connections to the Bot API for all the threads.
+
+    By default apihelper opens a session per thread, each with a pool of 10 connections, so the workers,
+    the outbound scheduler and the callback answerer pay for the connection setup and the TLS handshake
+    whenever they burst. Here the connections are kept alive and shared, the pool being sized for the number
+    of the sending threads. The read timeout is set per Bot API method, the ones passed explicitly by the caller
+    and the long polling one are kept. HTTP/2 goes through httpx, which multiplexes the requests over a single
+    connection, apihelper.proxy isn't applied to it.
+    """
+
+    def __init__(self, pool_size: int = 32, pool_block: bool = False, connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0, method_timeouts: Optional[Dict[str, float]] = None,
+                 http2: bool = False, logger: Optional[logging.Logger] = None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.method_timeouts = method_timeouts or {}
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self.requests_count = 0
+        self.failed_count = 0
+        self.connections_opened = 0  # httpx only, the requests pools count their connections themselves
+
+        if http2:
+            try:
+                import httpx
+            except ImportError:
+                raise ImportError("Please install httpx using `pip install httpx[http2]`")
+
+            self.session = None
+            self._httpx_timeout = httpx.Timeout
+            self.client = httpx.Client(http2=True, limits=httpx.Limits(max_connections=pool_size,
+                                                                       max_keepalive_connections=pool_size))
+        else:
+            self.client = None
+            self.session = requests.Session()
+            self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=pool_block)
+            self.session.mount('https://', self.adapter)
+            self.session.mount('http://', self.adapter)
+
+    def install(self, bot: TeleBot):
+        """
+        Makes apihelper send all the requests of the bot, the file downloads included, through the transport.
+        """
+        apihelper.CUSTOM_REQUEST_SENDER = self
+        if self.session is not None:
+            apihelper.session = self.session
+        elif apihelper.proxy:
+            self.logger.warning("apihelper.proxy is ignored by the HTTP/2 transport")
+        # kept on the bot, so the metrics are reachable wherever the bot is
+        bot.api_transport = self
+
+    def _timeout(self, method_name: str, timeout: Optional[tuple]) -> tuple:
+        if timeout is not None and (method_name == LONG_POLLING_METHOD
+                                    or timeout != (apihelper.CONNECT_TIMEOUT, apihelper.READ_TIMEOUT)):
+            # set by the long polling timeout or passed by the caller
+            return timeout
+        return self.connect_timeout, self.method_timeouts.get(method_name, self.read_timeout)
+
+    # argument naming is kept from apihelper, which passes them as kwargs
+    def __call__(self, method: str, url: str, params: Optional[dict] = None, files: Optional[dict] = None,
+                 timeout: Optional[tuple] = None, proxies: Optional[dict] = None):
+        connect_timeout, read_timeout = self._timeout(url.rsplit('/', 1)[-1], timeout)
+        with self._lock:
+            self.requests_count += 1
+        try:
+            if self.client is None:
+                return self.session.request(method, url, params=params, files=files,
+                                            timeout=(connect_timeout, read_timeout), proxies=proxies)
+
+            response = self.client.request(
+                method, url, params=params, files=files,
+                timeout=self._httpx_timeout(read_timeout, connect=connect_timeout),
+                extensions={'trace': self._trace})
+            return _HttpxResponse(response)
+        except Exception:
+            with self._lock:
+                self.failed_count += 1
+            raise
+
+    def _trace(self, event_name: str, info: dict):
+        if event_name == 'connection.connect_tcp.complete':
+            with self._lock:
+                self.connections_opened += 1
+
+    def _pooled_connections(self) -> int:
+        pools = self.adapter.poolmanager.pools
+        opened = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+        return opened
+
+    def get_metrics(self) -> Dict[str, object]:
+        """
+        Returns the number of the requests sent, the failed ones and the connections opened for them.
+        """
+        opened = self.connections_opened if self.client is not None else self._pooled_connections()
+        return {
+            'requests': self.requests_count,
+            'failed': self.failed_count,
+            'connections_opened': opened,
+            'connection_reuse': 1 - opened / self.requests_count if self.requests_count else 0.0,
+        }
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        else:
+            self.session.close()
+
+
+def setup_bot_api_transport(bot: TeleBot, bot_config: BotConfig, logger: logging.Logger) -> BotApiTransport:
+    transport_config = bot_config.transport
+    if transport_config is None and bot_config.telegram_api_url:
+        # a Local Bot API Server is a hop away, a connection it doesn't accept at once won't be accepted
+        transport = BotApiTransport(connect_timeout=LOCAL_CONNECT_TIMEOUT, logger=logger)
+    elif transport_config is None:
+        transport = BotApiTransport(logger=logger)
+    else:
+        transport = BotApiTransport(
+            pool_size=transport_config.pool_size,
+            pool_block=transport_config.pool_block,
+            connect_timeout=transport_config.connect_timeout,
+            read_timeout=transport_config.read_timeout,
+            method_timeouts=transport_config.method_timeouts,
+            http2=transport_config.http2,
+            logger=logger,
+        )
+    transport.install(bot)
+    return transport
@@ -13,3 +13,75 @@ def define_arg_parser():
         help='path to the config env mapping file'
     )
     return parser
+
+
+def define_benchmark_arg_parser():
+    parser = argparse.ArgumentParser(description='Measure the Bot API call latency against a fake Bot API.')
+    parser.add_argument(
+        'latencies',
+        metavar='Round trip',
+        type=float,
+        nargs='*',
+        default=[0.0, 50.0],
+        help='round trips of the fake Bot API in milliseconds, e.g. 0 for a local server and 50 for the cloud one'
+    )
+    parser.add_argument('-n', dest='calls', metavar='<calls>', type=int, default=1000, help='number of calls')
+    parser.add_argument(
+        '-c',
+        dest='concurrency',
+        metavar='<threads>',
+        type=int,
+        default=8,
+        help='number of threads sending at once'
+    )
+    return parser
+
+
+def define_callback_benchmark_arg_parser():
+    parser = argparse.ArgumentParser(description='Measure the callback query routing against the prefix filters.')
+    parser.add_argument(
+        'prefixes',
+        metavar='Prefixes',
+        type=int,
+        nargs='*',
+        default=[10, 100, 500],
+        help='numbers of the registered callback prefixes, half of them nested in the other half, e.g. user_back'
+    )
+    parser.add_argument('-n', dest='calls', metavar='<callbacks>', type=int, default=10000,
+                        help='number of callbacks')
+    return parser
+
+
+def define_template_benchmark_arg_parser():
+    parser = argparse.ArgumentParser(description='Measure the order message rendering against str.format.')
+    parser.add_argument('-n', dest='calls', metavar='<renders>', type=int, default=20000,
+                        help='number of renders of each message')
+    parser.add_argument('-r', dest='repeat', metavar='<runs>', type=int, default=5,
+                        help='number of runs, the fastest one is reported')
+    return parser
+
+
+def define_antiflood_benchmark_arg_parser():
+    parser = argparse.ArgumentParser(description='Measure the anti-flood overhead per update.')
+    parser.add_argument('-u', dest='users', metavar='<users>', type=int, default=100000,
+                        help='number of distinct users sending the updates')
+    parser.add_argument('-n', dest='updates', metavar='<updates>', type=int, default=1000000,
+                        help='number of updates')
+    return parser
+
+
+def define_codec_benchmark_arg_parser():
+    parser = argparse.ArgumentParser(description='Measure the order session codec against pickle and JSON.')
+    parser.add_argument(
+        'discounts',
+        metavar='Discounts',
+        type=int,
+        nargs='*',
+        default=[2, 20],
+        help='numbers of the producer discounts of the user in the order session'
+    )
+    parser.add_argument('-n', dest='calls', metavar='<sessions>', type=int, default=10000,
+                        help='number of sessions encoded and decoded')
+    parser.add_argument('-r', dest='repeat', metavar='<runs>', type=int, default=5,
+                        help='number of runs, the fastest one is reported')
+    return parser
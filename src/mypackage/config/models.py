@@ -26,6 +26,87 @@ class BotStateStorageConfig:
     redis: Optional[RedisConfig] = None  # Redis config if any
 
 
+@dataclass
+class OrderSessionStorageConfig:
+    type: Literal['redis', 'memory'] = 'memory'  # Redis reuses the state storage connection settings
+    ttl: Optional[int] = 86400  # Seconds of inactivity after which the order session expires
+    max_size: Optional[int] = 10000  # Maximum number of order sessions kept in memory
+    compression: Optional[bool] = False  # Compress the large order sessions stored in Redis
+
+
+@dataclass
+class BotDispatcherConfig:
+    workers: Optional[int] = 8  # Number of worker threads, the updates of a chat are always handled by the same one
+    queue_size: Optional[int] = 100  # Maximum number of updates waiting for each worker
+
+
+@dataclass
+class BotAntiFloodConfig:
+    type: Literal['redis', 'memory'] = 'memory'  # Redis token buckets are shared by all the bot workers
+    max_size: Optional[int] = 100000  # Maximum number of users whose last action time is kept by each middleware
+    user_rate: Optional[float] = 1.0  # Redis only, user's updates per second of each type on average
+    user_burst: Optional[int] = 5  # Redis only, maximum number of user's updates of each type in a row
+    global_rate: Optional[float] = 100.0  # Redis only, updates per second handled by all the workers on average
+    global_burst: Optional[int] = 200  # Redis only, maximum number of updates handled by all the workers in a row
+
+
+@dataclass
+class BotDeduplicationConfig:
+    type: Literal['redis', 'memory'] = 'memory'  # Redis update ids are shared by all the bot processes
+    window: Optional[int] = 100000  # Number of the latest update ids told apart, the older ones are dropped
+    ttl: Optional[int] = 86400  # Redis only, seconds an update id is kept, Telegram keeps the updates for a day
+
+
+@dataclass
+class BotCallbackAnswersConfig:
+    hold_time: Optional[float] = 0.5  # Seconds the default answer waits for the handler to answer the query itself
+    workers: Optional[int] = 2  # Number of threads sending the answers
+
+
+@dataclass
+class BotOutboundConfig:
+    global_rate: Optional[float] = 30.0  # Requests per second to all the chats on average
+    global_burst: Optional[int] = 30  # Maximum number of requests to all the chats in a row
+    chat_rate: Optional[float] = 1.0  # Requests per second to a private chat on average
+    chat_burst: Optional[int] = 3  # Maximum number of requests to a chat in a row
+    group_rate: Optional[float] = 0.33  # Requests per second to a group or a channel on average
+    max_retries: Optional[int] = 3  # Maximum number of retries of a request after Telegram's 429
+
+
+@dataclass
+class BotKeyboardsConfig:
+    max_size: Optional[int] = 1024  # Maximum number of the built keyboards kept serialized
+
+
+@dataclass
+class BotTransportConfig:
+    pool_size: Optional[int] = 32  # Maximum number of kept-alive connections to the Bot API shared by all the threads
+    pool_block: Optional[bool] = False  # Wait for a free connection instead of opening a one-off one if all are busy
+    connect_timeout: Optional[float] = 5.0  # Seconds to wait for a connection to the Bot API
+    read_timeout: Optional[float] = 30.0  # Seconds to wait for a response of a method not in method_timeouts
+    method_timeouts: Optional[dict[str, float]] = None  # Seconds to wait for a response by method, e.g. sendMessage
+    http2: Optional[bool] = False  # Use HTTP/2, requires httpx[http2]
+
+
+@dataclass
+class BotProcessesConfig:
+    workers: Optional[int] = 4  # Number of worker processes, the updates of a chat are always handled by the same one
+    queue_size: Optional[int] = 1000  # Maximum number of updates waiting for each worker process
+    replicas: Optional[int] = 100  # Points of each worker on the hash ring, the more the evener the chats are spread
+
+
+@dataclass
+class BotAsyncRuntimeConfig:
+    workers: Optional[int] = 16  # Number of worker threads running the commands and the admin menu handlers
+
+
+@dataclass
+class BotNotificationsConfig:
+    chat_ids: list  # Chats the new orders are sent to
+    max_retries: Optional[int] = 5  # Maximum number of retries of a failed notification
+    retry_delay: Optional[float] = 1.0  # Delay before the first retry in seconds, doubled after each retry
+
+
 @dataclass
 class BotWebhookConfig:
     base_url: str  # Webhook base url, e.g. https://example.com or https://127.0.0.1:8080
@@ -34,6 +115,10 @@ class BotWebhookConfig:
     cert_path: Optional[str] = None  # Path to the public key SSL certificate if self-signed
     ip_address: Optional[str] = None  # IP address to use instead of one resolved via DNS
     max_connections: Optional[int] = None  # Maximum allowed number of simultaneous HTTPS connections to the webhook
+    quote_path: Optional[str] = 'quote'  # Quoting API path without the leading slash
+    quote_token: Optional[str] = None  # Token to verify the quoting API requests, the API is off if not set
+    queue_size: Optional[int] = 1000  # Maximum number of updates waiting for the workers, split evenly between them
+    workers: Optional[int] = 4  # Number of threads passing the queued updates to the bot, one per chat at a time
 
 
 @dataclass
@@ -49,8 +134,20 @@ class BotConfig:
     logger: LoggerConfig  # Logger config for the bot
     allowed_updates: Optional[Union[list[str], Literal['ALL']]] = None  # by default all except chat_member
     state_storage: Optional[BotStateStorageConfig] = None  # Bot state storage config if any
+    order_sessions: Optional[OrderSessionStorageConfig] = None  # Order sessions storage config, memory by default
+    dispatcher: Optional[BotDispatcherConfig] = None  # Shard the updates by chat id onto worker queues if set
+    processes: Optional[BotProcessesConfig] = None  # Run the bot on worker processes behind a routing ingress if set
+    async_runtime: Optional[BotAsyncRuntimeConfig] = None  # Run on AsyncTeleBot if set, the dispatcher is ignored
+    antiflood: Optional[BotAntiFloodConfig] = None  # Anti-flood config, 100000 users per middleware by default
+    deduplication: Optional[BotDeduplicationConfig] = None  # Duplicate updates config, the memory window by default
+    callback_answers: Optional[BotCallbackAnswersConfig] = None  # Callback query answers config if any
+    outbound: Optional[BotOutboundConfig] = None  # Outbound requests rate limits, Telegram's ones by default
+    keyboards: Optional[BotKeyboardsConfig] = None  # Keyboards cache config, 1024 keyboards by default
+    transport: Optional[BotTransportConfig] = None  # Bot API connections config, only the pool size applies to the async runtime
+    notifications: Optional[BotNotificationsConfig] = None  # Order notifications config, the owner only by default
     webhook: Optional[BotWebhookConfig] = None  # Webhook config if any
     telegram_api_url: Optional[str] = None  # Custom Telegram API url for Local Bot API Server if any
+    telegram_api_local: Optional[bool] = False  # Local Bot API Server runs with --local, its files are on a shared disk
 
 
 @dataclass
@@ -61,6 +158,10 @@ class DBConfig:
     password: str  # DBMS user password
     database: str  # Database title
     logger: LoggerConfig  # Logger config for database
+    order_batch_size: Optional[int] = 100  # Maximum number of confirmed orders written in a single insert
+    order_flush_interval_ms: Optional[int] = 500  # Maximum delay before the confirmed orders are written
+    order_max_pending: Optional[int] = 10000  # Maximum number of orders buffered while the database is down
+    order_max_retry_interval_ms: Optional[int] = 60000  # Maximum delay between the retries of a failed write
 
 
 @dataclass
@@ -1,3 +1,4 @@
+import atexit
 import os
 from logging import Logger
 
@@ -7,8 +8,9 @@ from sqlalchemy.orm import sessionmaker
 
 from ..config.models import DBConfig
 
-from .adapter import DBAdapter
+from .adapter import DBAdapter, AsyncDBAdapter
 from .exceptions import DBError
+from .writer import OrderWriter
 
 
 load_dotenv()
@@ -21,3 +23,31 @@ def setup_session_maker():
     db_session_maker = sessionmaker(bind=db_engine)
 
     return db_session_maker
+
+
+def setup_async_session_maker():
+    try:
+        import aiosqlite
+        import greenlet
+    except ImportError:
+        raise ImportError("Please install aiosqlite and greenlet using `pip install aiosqlite greenlet`")
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    # the same database as the blocking session maker, through the async driver
+    sqlite_filepath = os.environ.get('DB_URL')
+    db_url = f"sqlite+aiosqlite:///{sqlite_filepath}"
+    db_engine = create_async_engine(db_url, echo=True)
+    db_session_maker = async_sessionmaker(bind=db_engine)
+
+    return db_session_maker
+
+
+def setup_order_writer(db_config: DBConfig, db_session_maker: sessionmaker, db_logger: Logger) -> OrderWriter:
+    order_writer = OrderWriter(db_session_maker, db_logger,
+                               batch_size=db_config.order_batch_size,
+                               flush_interval_ms=db_config.order_flush_interval_ms,
+                               max_pending=db_config.order_max_pending,
+                               max_retry_interval_ms=db_config.order_max_retry_interval_ms)
+    # the buffered orders are written on any normal interpreter exit, including Ctrl+C
+    atexit.register(order_writer.stop)
+    return order_writer
@@ -1,13 +1,17 @@
 import logging
-from typing import Optional, Callable, Iterable
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Callable, Iterable
 
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from .dto import NewUserDTO, DispatchPointDTO
+from .dto import NewUserDTO, DispatchPointDTO, UserDTO, ProducerDTO
 from .exceptions import DBError
 from .models import User, Producer
-from .operations import user, dispatch_points, database, producer
+from .operations import user, dispatch_points, database, producer, order
+
+if TYPE_CHECKING:
+    # requires greenlet, which is only required by the async runtime
+    from sqlalchemy.ext.asyncio import AsyncSession
 
 
 class DBAdapter:
@@ -97,3 +101,51 @@ class DBAdapter:
 
     def sync_producers(self, titles: Iterable[str]):
         return self._session_wrapper(producer.sync_producers, titles)
+
+    def add_orders(self, rows: List[Dict[str, Any]]):
+        return self._session_wrapper(order.add_all, rows)
+
+
+def _to_dto(result: Any) -> Any:
+    if result is None:
+        return None
+    if isinstance(result, list):
+        # the rows of a select of a model
+        return [row[0].to_dto() for row in result]
+    return result.to_dto()
+
+
+class AsyncDBAdapter:
+    """
+    DBAdapter of the async runtime, for the queries of the calculation flow.
+
+    The same operations run on the connection of the AsyncSession, so they wait for the database on the loop.
+    The models are returned as DTOs converted within the operation, as their lazy relationships can't be loaded
+    outside of it.
+    """
+
+    def __init__(self, session: 'AsyncSession', logger: logging.Logger):
+        self.logger = logger
+        self.session = session
+
+    async def _session_wrapper(self, method: Callable, *args, **kwargs):
+        try:
+            return await self.session.run_sync(lambda session: _to_dto(method(session, *args, **kwargs)))
+        except IntegrityError as e:
+            self.logger.debug(e)
+            return False
+        except SQLAlchemyError as e:
+            self.logger.exception(e)
+            raise DBError(f"Error occurred while {method.__name__}: {e}")
+
+    async def get_user(self, tg_user_id: int) -> Optional[UserDTO]:
+        return await self._session_wrapper(user.get, tg_user_id)
+
+    async def get_user_with_discounts(self, tg_user_id: int) -> Optional[UserDTO]:
+        return await self._session_wrapper(user.get_with_discounts, tg_user_id)
+
+    async def get_producer_by_id(self, _id: int) -> Optional[ProducerDTO]:
+        return await self._session_wrapper(producer.get_by_id, _id)
+
+    async def get_all_producers(self) -> List[ProducerDTO]:
+        return await self._session_wrapper(producer.get_all)
@@ -1,11 +1,12 @@
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict, Set
 
 from sqlalchemy import UniqueConstraint
 from telebot.types import Message
 
 from src.mypackage.bot import texts
+from ..money import apply_discount
 
 
 @dataclass
@@ -60,7 +61,7 @@ class UserDiscountDTO:
         return 0
 
     def get_delivery_discount(self, payment_type: str):
-        if payment_type == texts.cashless_payment:
+        if payment_type == texts.cash_payment:
             return self.delivery_discount
         elif payment_type == texts.cashless_payment:
             return self.delivery_discount_vat
@@ -150,7 +151,7 @@ class DistanceDTO:
 class ConcreteDTO:
     title: str
     type_: str
-    price: float
+    price: int  # kopiykas per m³
     producer: str | None = None
 
 
@@ -176,6 +177,13 @@ class ConcreteDataDTO:
     def concrete_type_titles(self):
         return [concrete_type.title for concrete_type in self.concrete_types]
 
+    @property
+    def concretes_by_type(self) -> Dict[str, List[ConcreteDTO]]:
+        concretes_by_type = {}
+        for concrete in self.concretes:
+            concretes_by_type.setdefault(concrete.type_, []).append(concrete)
+        return concretes_by_type
+
     def get_type(self, concrete_type_title):
         for concrete_type in self.concrete_types:
             if concrete_type.title == concrete_type_title:
@@ -187,6 +195,16 @@ class ConcreteDataDTO:
                 return concrete
 
 
+@dataclass
+class CatalogDiffDTO:
+    producers: Set[str] = field(default_factory=set)  # producers whose dispatch points changed
+    concrete_types: Set[str] = field(default_factory=set)  # concrete types (P1, P2, ...) whose concretes changed
+    delivery_types: Set[str] = field(default_factory=set)  # tariff columns whose prices changed
+
+    def __bool__(self):
+        return bool(self.producers or self.concrete_types or self.delivery_types)
+
+
 @dataclass
 class OrderDTO:
     user: UserDTO
@@ -197,26 +215,64 @@ class OrderDTO:
     distance: DistanceDTO | None = None
     concrete: ConcreteDTO | None = None
     amount: int | None = None
-    delivery_cost: float | None = None
-    concrete_cost: float | None = None
-    delivery_price: float | None = None
+    delivery_cost: int | None = None  # kopiykas
+    concrete_cost: int | None = None  # kopiykas
+    delivery_price: int | None = None  # kopiykas per m³
 
     @property
-    def delivery_cost_with_discount(self):
-        return self.delivery_cost - self.get_delivery_discount()
+    def concrete_discount(self) -> int:
+        return self.user.get_producer_discounts(self.producer).get_concrete_discount(self.payment_type) or 0
 
     @property
-    def concrete_cost_with_discount(self):
-        return self.concrete_cost - self.get_concrete_discount()
+    def delivery_discount(self) -> int:
+        return self.user.get_producer_discounts(self.producer).get_delivery_discount(self.payment_type) or 0
 
-    def get_concrete_discount(self):
-        for discount in self.user.discounts:
-            if discount.producer.title == self.producer:
-                return self.concrete_cost * discount.concrete_discount / 100
-        return 0
+    @property
+    def delivery_cost_with_discount(self) -> int:
+        return apply_discount(self.delivery_cost, self.delivery_discount)
 
-    def get_delivery_discount(self):
-        for discount in self.user.discounts:
-            if discount.producer.title == self.producer:
-                return self.delivery_cost * discount.delivery_discount / 100
-        return 0
+    @property
+    def concrete_cost_with_discount(self) -> int:
+        return apply_discount(self.concrete_cost, self.concrete_discount)
+
+    @property
+    def total_cost(self) -> int:
+        return self.concrete_cost_with_discount + self.delivery_cost_with_discount
+
+
+@dataclass
+class ConcretePriceDTO:
+    concrete: ConcreteDTO
+    concrete_price: int  # kopiykas per m³ with discount
+    delivery_price: int  # kopiykas per m³ with discount
+    price: int  # kopiykas per m³ with discount and delivery
+
+
+@dataclass
+class ProducerQuoteDTO:
+    producer: str
+    dispatch_point: DispatchPointDTO
+    distance: DistanceDTO
+    prices: List[ConcretePriceDTO] = field(default_factory=list)
+
+    def get_price(self, concrete_title: str) -> ConcretePriceDTO | None:
+        for concrete_price in self.prices:
+            if concrete_price.concrete.title == concrete_title:
+                return concrete_price
+
+
+@dataclass
+class QuoteDTO:
+    user_location: UserLocationDTO
+    payment_type: str
+    producers: List[ProducerQuoteDTO] = field(default_factory=list)
+    best_producer: str | None = None
+
+    @property
+    def too_far(self):
+        return self.best_producer is None
+
+    def get_producer(self, producer_title: str) -> ProducerQuoteDTO | None:
+        for producer_quote in self.producers:
+            if producer_quote.producer == producer_title:
+                return producer_quote
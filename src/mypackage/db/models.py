@@ -131,6 +131,7 @@ class User(Base):
     dispatch_point = relationship("DispatchPoint", backref="user")
 
     discounts = relationship("UserDiscount", back_populates="user")
+    orders = relationship("Order", back_populates="user")
     register_time: Mapped[datetime] = mapped_column(default=datetime.now(timezone.utc))
 
     def __repr__(self):
@@ -164,14 +165,35 @@ class User(Base):
             register_time=self.register_time
         )
 
-# Uncomment and define the Order model if necessary
-# class Order(Base):
-#     __tablename__ = "orders"
-#
-#     id: Mapped[int] = mapped_column(primary_key=True)
-#     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
-#     user = relationship("User", back_populates="orders")
-#     articles: Mapped[List[Article]] = relationship("Article", secondary=order_article_table, back_populates="orders")
-#
-#     def __repr__(self):
-#         return f"<Order(id={self.id}, user_id={self.user_id})>"
+class Order(Base):
+    __tablename__ = "orders"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
+    user = relationship("User", back_populates="orders")
+
+    payment_type: Mapped[str] = mapped_column(String, nullable=False)
+    producer: Mapped[str] = mapped_column(String, nullable=False)
+    dispatch_point: Mapped[str] = mapped_column(String, nullable=False)
+    address: Mapped[str] = mapped_column(String, nullable=False)
+    latitude: Mapped[float] = mapped_column(nullable=False)
+    longitude: Mapped[float] = mapped_column(nullable=False)
+    distance_metres: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    concrete: Mapped[str] = mapped_column(String, nullable=False)
+    concrete_type: Mapped[str] = mapped_column(String, nullable=False)
+    amount: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    # all the prices and costs are in kopiykas, the costs are with the discounts applied
+    concrete_price: Mapped[int] = mapped_column(Integer, nullable=False)
+    delivery_price: Mapped[int] = mapped_column(Integer, nullable=False)
+    concrete_discount: Mapped[int] = mapped_column(Integer, nullable=False)
+    delivery_discount: Mapped[int] = mapped_column(Integer, nullable=False)
+    concrete_cost: Mapped[int] = mapped_column(Integer, nullable=False)
+    delivery_cost: Mapped[int] = mapped_column(Integer, nullable=False)
+    total_cost: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    created_at: Mapped[datetime] = mapped_column(nullable=False)
+
+    def __repr__(self):
+        return f"<Order(id={self.id}, user_id={self.user_id}, concrete='{self.concrete}', amount={self.amount})>"
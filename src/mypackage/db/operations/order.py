@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from ..dto import OrderDTO
+from ..models import Order
+
+
+def to_row(order_dto: OrderDTO, created_at: datetime | None = None) -> Dict[str, Any]:
+    return {
+        "user_id": order_dto.user.id,
+        "payment_type": order_dto.payment_type,
+        "producer": order_dto.producer,
+        "dispatch_point": order_dto.dispatch_point.address,
+        "address": order_dto.user_location.address,
+        "latitude": order_dto.user_location.latitude,
+        "longitude": order_dto.user_location.longitude,
+        "distance_metres": order_dto.distance.distance_metres,
+        "concrete": order_dto.concrete.title,
+        "concrete_type": order_dto.concrete.type_,
+        "amount": order_dto.amount,
+        "concrete_price": order_dto.concrete.price,
+        "delivery_price": order_dto.delivery_price,
+        "concrete_discount": order_dto.concrete_discount,
+        "delivery_discount": order_dto.delivery_discount,
+        "concrete_cost": order_dto.concrete_cost_with_discount,
+        "delivery_cost": order_dto.delivery_cost_with_discount,
+        "total_cost": order_dto.total_cost,
+        "created_at": created_at or datetime.now(timezone.utc),
+    }
+
+
+def add_all(session: Session, rows: List[Dict[str, Any]]) -> bool:
+    session.execute(
+        insert(Order),
+        rows
+    )
+    session.commit()
+    return True
@@ -0,0 +1,119 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import sessionmaker
+
+from .adapter import DBAdapter
+from .dto import OrderDTO
+from .exceptions import DBError
+from .operations import order
+
+
+class OrderWriter:
+    """
+    Write-behind buffer of the confirmed orders.
+
+    Adding an order only snapshots it into a row and puts it into a queue, the rows are inserted
+    by a background thread in batches, once the batch is full or the flush interval passes.
+    The rows of a failed insert are kept and retried, the retries backing off exponentially up to the maximum
+    interval, and the buffer is flushed on stop. While the database is down the buffer keeps up to max_pending rows,
+    the later ones are dropped and logged in full, so they can be restored from the log.
+    """
+
+    def __init__(self, db_session_maker: sessionmaker, logger: logging.Logger,
+                 batch_size: int = 100, flush_interval_ms: int = 500,
+                 max_pending: int = 10000, max_retry_interval_ms: int = 60000):
+        self.db_session_maker = db_session_maker
+        self.logger = logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.max_retry_interval = max_retry_interval_ms / 1000
+
+        self._rows: queue.Queue = queue.Queue()
+        self._pending: List[Dict[str, Any]] = []
+        self._retry_interval = 0.0
+        self._retry_at = 0.0
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="order_writer", daemon=True)
+        self._worker.start()
+
+    def add(self, order_dto: OrderDTO):
+        # the row is built right away, so later changes of the order session don't affect it
+        self._rows.put(order.to_row(order_dto))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._pending.append(self._rows.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            else:
+                self._collect()
+            self._bound()
+            if self._pending and time.monotonic() >= self._retry_at:
+                if self._flush():
+                    self._retry_interval = 0.0
+                else:
+                    self._retry_interval = min(max(self._retry_interval * 2, self.flush_interval),
+                                               self.max_retry_interval)
+                    self._retry_at = time.monotonic() + self._retry_interval
+                    self.logger.warning(f"Retrying to write the orders in {self._retry_interval:.1f} s")
+
+    def _collect(self):
+        # waits for the rest of the batch no longer than the flush interval since its first row
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._pending) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return
+            try:
+                self._pending.append(self._rows.get(timeout=timeout))
+            except queue.Empty:
+                return
+
+    def _bound(self):
+        if len(self._pending) <= self.max_pending:
+            return
+        # the oldest orders keep their place in the buffer, the memory isn't exhausted by a long outage
+        dropped = self._pending[self.max_pending:]
+        del self._pending[self.max_pending:]
+        self.logger.critical(f"Order buffer is full, dropped {len(dropped)} orders: {dropped}")
+
+    def _drain(self):
+        while True:
+            try:
+                self._pending.append(self._rows.get_nowait())
+            except queue.Empty:
+                return
+
+    def _flush(self) -> bool:
+        db_adapter = DBAdapter(self.db_session_maker(), self.logger)
+        try:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                if db_adapter.add_orders(batch) is not True:
+                    # an integrity error can't be fixed by a retry, thus the batch is dropped
+                    self.logger.error(f"Dropped {len(batch)} orders violating the constraints: {batch}")
+                del self._pending[:len(batch)]
+            return True
+        except DBError as e:
+            self.logger.error(f"Failed to write {len(self._pending)} orders: {e}")
+            return False
+        finally:
+            db_adapter.session.close()
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Stops the worker and writes all the buffered orders.
+        """
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._worker.join(timeout)
+        self._drain()
+        if self._pending and not self._flush():
+            self.logger.critical(f"Lost {len(self._pending)} orders on shutdown: {self._pending}")
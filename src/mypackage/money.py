@@ -0,0 +1,58 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+# All the prices and costs are kept as integer kopiykas, so they are exact, compact and cheap to cache,
+# and the only roundings are the discounts and the divisions below, always half up to the kopiyka.
+KOPIYKAS_PER_UAH = 100
+
+
+def _divide_half_up(dividend: int, divisor: int) -> int:
+    sign = -1 if (dividend < 0) != (divisor < 0) else 1
+    return sign * ((2 * abs(dividend) + abs(divisor)) // (2 * abs(divisor)))
+
+
+def to_kopiykas(value: int | float | str) -> int:
+    """
+    Converts UAH, e.g. a price from the Google Sheets document, to kopiykas.
+
+    Args:
+        value: The amount in UAH, strings may use a comma as the decimal separator.
+
+    Returns:
+        int: The amount in kopiykas, rounded half up.
+    """
+    if isinstance(value, str):
+        value = value.strip().replace(",", ".")
+    return int((Decimal(str(value)) * KOPIYKAS_PER_UAH).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def multiply(kopiykas: int, factor: int | float) -> int:
+    """
+    Multiplies the amount in kopiykas, e.g. by the volume in m³, rounding half up if the factor is fractional.
+    """
+    if isinstance(factor, int):
+        return kopiykas * factor
+    return int((Decimal(kopiykas) * Decimal(str(factor))).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def divide(kopiykas: int, divisor: int) -> int:
+    """
+    Divides the amount in kopiykas, e.g. the total cost by the volume in m³, rounding half up.
+    """
+    return _divide_half_up(kopiykas, divisor)
+
+
+def apply_discount(kopiykas: int, discount: int | None) -> int:
+    """
+    Applies the discount percentage to the amount in kopiykas, rounding half up.
+    """
+    if not discount:
+        return kopiykas
+    return _divide_half_up(kopiykas * (100 - discount), 100)
+
+
+def format_uah(kopiykas: int) -> str:
+    """
+    Formats the amount in kopiykas as UAH with exactly two decimal places, e.g. 123450 -> "1234.50".
+    """
+    uah, kopiykas_rest = divmod(abs(kopiykas), KOPIYKAS_PER_UAH)
+    return f"{'-' if kopiykas < 0 else ''}{uah}.{kopiykas_rest:02d}"
@@ -1,12 +1,43 @@
+import asyncio
+from typing import Optional
+
 from .app import Application
-from .endpoint import tg_update_handler
+from .endpoint import tg_update_handler, quote_handler, health_handler, readiness_handler, metrics_handler
+from .updates import UpdateQueue
+from ..bot.aio import SyncBotBridge
+
+HEALTH_PATH = 'healthz'
+READINESS_PATH = 'readyz'
+METRICS_PATH = 'metrics'
+
+
+async def start_update_queue(app: Application):
+    if isinstance(app.ctx.bot, SyncBotBridge):
+        # the async bot runs on the loop of the server
+        app.ctx.bot.loop = asyncio.get_running_loop()
+    app.ctx.update_queue.start()
+
+
+async def stop_update_queue(app: Application):
+    # the workers wait for the bridged bot on the loop, thus they are stopped off it
+    await asyncio.get_running_loop().run_in_executor(None, app.ctx.update_queue.stop)
+    if isinstance(app.ctx.bot, SyncBotBridge):
+        await app.ctx.bot.close()
 
 
-def setup_app(webhook_path: str) -> Application:
+def setup_app(webhook_path: str, quote_path: Optional[str] = None) -> Application:
+    """
+    Sets up the webhook app, the quoting API is served only if its path is given.
+    """
     app_ = Application()
 
-    # TODO: setup routes, middlewares, etc.
     app_.router.add_post(webhook_path, tg_update_handler)
+    if quote_path:
+        app_.router.add_post(quote_path, quote_handler)
+    app_.router.add_get(HEALTH_PATH, health_handler)
+    app_.router.add_get(READINESS_PATH, readiness_handler)
+    app_.router.add_get(METRICS_PATH, metrics_handler)
 
-    # TODO: setup on startup, on shutdown, etc. handlers
+    app_.on_startup.append(start_update_queue)
+    app_.on_shutdown.append(stop_update_queue)
     return app_
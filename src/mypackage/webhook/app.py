@@ -1,21 +1,166 @@
+import asyncio
+import inspect
+import json
 from logging import Logger
-from typing import Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 
 from telebot import TeleBot
 
+from .updates import UpdateQueue
+from ..bot.pricing import QuoteEngine
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# The largest request body accepted, the updates are a few kilobytes at most
+MAX_BODY_SIZE = 1024 * 1024
+
+TEXT_CONTENT_TYPE = 'text/plain; charset=utf-8'
+JSON_CONTENT_TYPE = 'application/json'
+
 
 class Context:
     def __init__(self,
                  bot: Optional[TeleBot] = None,
                  secret_token: Optional[str] = None,
-                 logger: Optional[Logger] = None):
+                 logger: Optional[Logger] = None,
+                 quote_engine: Optional[QuoteEngine] = None,
+                 quote_token: Optional[str] = None,
+                 update_queue: Optional[UpdateQueue] = None):
         self.bot = bot
         self.secret_token = secret_token
         self.logger = logger
+        self.quote_engine = quote_engine
+        self.quote_token = quote_token
+        self.update_queue = update_queue
+
+
+class Headers(dict):
+    """
+    Request headers by their lowercase names, looked up regardless of the case.
+    """
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        return super().get(key.lower(), default)
+
+
+class Request:
+    def __init__(self, app: 'Application', scope: dict, body: bytes):
+        self.app = app
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = Headers((name.decode('latin-1').lower(), value.decode('latin-1'))
+                               for name, value in scope.get('headers', ()))
+        self.remote = scope['client'][0] if scope.get('client') else None
+        self.body = body
+
+    def json(self):
+        return json_loads(self.body)
+
+
+# The handlers return the body and the status, and the content type if it isn't plain text
+Response = Tuple[str | bytes, int] | Tuple[str | bytes, int, str]
+Handler = Callable[[Request], Response | Awaitable[Response]]
+
+
+class Router:
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str], Handler] = {}
+
+    def add_route(self, method: str, path: str, handler: Handler):
+        self.routes[method, '/' + path.lstrip('/')] = handler
+
+    def add_get(self, path: str, handler: Handler):
+        self.add_route('GET', path, handler)
+
+    def add_post(self, path: str, handler: Handler):
+        self.add_route('POST', path, handler)
+
+    def resolve(self, method: str, path: str) -> Optional[Handler]:
+        return self.routes.get((method, path))
 
 
-# TODO: Derive this class from your web framework's Application class
 class Application:
-    def __init__(self, *args, ctx: Optional[Context] = None, **kwargs):
-        super().__init__(*args, **kwargs)
+    """
+    ASGI application, served by any ASGI server, e.g. uvicorn.
+
+    The coroutine handlers run on the event loop and must not block, the plain functions run on the default
+    executor of the loop. The startup and the shutdown callbacks are run on the lifespan events of the server.
+    """
+
+    def __init__(self, ctx: Optional[Context] = None):
         self.ctx = ctx or Context()
+        self.router = Router()
+        self.on_startup: List[Callable[['Application'], Awaitable[None]]] = []
+        self.on_shutdown: List[Callable[['Application'], Awaitable[None]]] = []
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                callbacks, event = self.on_startup, 'lifespan.startup'
+            elif message['type'] == 'lifespan.shutdown':
+                callbacks, event = self.on_shutdown, 'lifespan.shutdown'
+            else:
+                continue
+
+            try:
+                for callback in callbacks:
+                    await callback(self)
+            except Exception as e:
+                await send({'type': f'{event}.failed', 'message': str(e)})
+                return
+            await send({'type': f'{event}.complete'})
+            if event == 'lifespan.shutdown':
+                return
+
+    async def _http(self, scope: dict, receive: Callable, send: Callable):
+        handler = self.router.resolve(scope['method'], scope['path'])
+        if handler is None:
+            await self._respond(send, 'Not Found', 404)
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if len(body) > MAX_BODY_SIZE:
+                await self._respond(send, 'Payload Too Large', 413)
+                return
+            if not message.get('more_body'):
+                break
+
+        request = Request(self, scope, bytes(body))
+        try:
+            if inspect.iscoroutinefunction(handler):
+                response = await handler(request)
+            else:
+                response = await asyncio.get_running_loop().run_in_executor(None, handler, request)
+        except Exception as e:
+            if self.ctx.logger is not None:
+                self.ctx.logger.error(f"Exception while handling {scope['method']} {scope['path']}: {e}")
+            response = 'Internal Server Error', 500
+        await self._respond(send, *response)
+
+    @staticmethod
+    async def _respond(send: Callable, body: str | bytes, status: int, content_type: str = TEXT_CONTENT_TYPE):
+        if isinstance(body, str):
+            body = body.encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
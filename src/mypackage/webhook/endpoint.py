@@ -1,14 +1,121 @@
-from telebot.types import Update
+import hmac
+import json
+from dataclasses import asdict
 
+from .app import JSON_CONTENT_TYPE
+from ..bot import texts
+from ..bot.supervisor import Supervisor
 
-def tg_update_handler(request):
-    secret_token = request.app.ctx.secret_token  # TODO: get secret token from somewhere, e.g. from the app context
-    if secret_token != request.headers.get_by_title('X-Telegram-Bot-Api-Secret-Token', ):
-        request.app.ctx.logger.debug(f"Invalid secret-token request from {request.remote}")  # TODO: Adjust if necessary
+PAYMENT_TYPES = {
+    'cash': texts.cash_payment,
+    'cashless': texts.cashless_payment,
+}
+
+
+async def tg_update_handler(request):
+    secret_token = request.app.ctx.secret_token
+    received_token = request.headers.get('X-Telegram-Bot-Api-Secret-Token') or ''
+    # compared in constant time, so the token can't be guessed by the response time
+    if not secret_token or not hmac.compare_digest(secret_token.encode(), received_token.encode()):
+        request.app.ctx.logger.debug(f"Invalid secret-token request from {request.remote}")
         return 'Forbidden', 403
-    body_json = request.json()
-    bot = request.app.ctx.bot  # TODO: get bot from somewhere, e.g. from the app context
-    update = Update.de_json(body_json)
-    bot.process_new_updates([update])
-    request.app.ctx.logger.debug(f"Processed update {update.update_id}")  # TODO: Adjust if necessary
+
+    try:
+        body_json = request.json()
+    except ValueError:
+        return 'Bad Request', 400
+    if not isinstance(body_json, dict) or not isinstance(body_json.get('update_id'), int):
+        return 'Bad Request', 400
+
+    # with the worker processes there's no bot in this process, each worker drops the updates it has processed
+    update_deduplicator = None if isinstance(request.app.ctx.update_queue, Supervisor) else \
+        getattr(request.app.ctx.bot, 'update_deduplicator', None)
+    if update_deduplicator is not None and update_deduplicator.was_processed(body_json['update_id']):
+        # answered, so Telegram stops delivering it, the updates still queued are dropped by the bot
+        return 'OK', 200
+
+    if not request.app.ctx.update_queue.put(body_json):
+        # Telegram delivers the update again later
+        request.app.ctx.logger.warning(f"Update queue is full, refused update {body_json['update_id']}")
+        return 'Service Unavailable', 503
+    return 'OK', 200
+
+
+async def health_handler(request):
+    """
+    Liveness probe, the app is serving the requests.
+    """
+    return 'OK', 200
+
+
+async def readiness_handler(request):
+    """
+    Readiness probe, the update workers are running and the update queue isn't about to fill up.
+    """
+    if not request.app.ctx.update_queue.ready:
+        return 'Service Unavailable', 503
     return 'OK', 200
+
+
+async def metrics_handler(request):
+    """
+    The update queue metrics, along with the metrics of the bot components which have them.
+
+    With the worker processes, only the supervisor ones, the bot components live in the workers.
+    """
+    bot = request.app.ctx.bot
+    metrics = {'updates': request.app.ctx.update_queue.get_metrics()}
+    if isinstance(request.app.ctx.update_queue, Supervisor):
+        return json.dumps(metrics), 200, JSON_CONTENT_TYPE
+    for name, component in (('dispatcher', bot), ('outbound', getattr(bot, 'outbound_scheduler', None)),
+                            ('transport', getattr(bot, 'api_transport', None)),
+                            ('deduplication', getattr(bot, 'update_deduplicator', None)),
+                            ('callbacks', getattr(bot, 'callback_router', None))):
+        get_metrics = getattr(component, 'get_metrics', None)
+        if get_metrics is not None:
+            metrics[name] = get_metrics()
+    return json.dumps(metrics), 200, JSON_CONTENT_TYPE
+
+
+def quote_handler(request):
+    """
+    Quotes the prices for a location without Telegram.
+
+    Expects a JSON body with either an "address" or "latitude" and "longitude",
+    and an optional "payment_type" ("cash" or "cashless", "cash" by default).
+    All the prices in the response are integer kopiykas.
+    """
+    quote_token = request.app.ctx.quote_token
+    received_token = request.headers.get('X-Quote-Api-Token') or ''
+    # the quotes spend the Google Maps quota, thus the API is closed unless a token is set
+    if not quote_token or not hmac.compare_digest(quote_token.encode(), received_token.encode()):
+        request.app.ctx.logger.debug(f"Invalid quote-token request from {request.remote}")
+        return 'Forbidden', 403
+
+    try:
+        body_json = request.json()
+    except ValueError:
+        return 'Bad Request', 400
+    if not isinstance(body_json, dict):
+        return 'Bad Request', 400
+
+    payment_type = PAYMENT_TYPES.get(body_json.get('payment_type', 'cash'))
+    if payment_type is None:
+        return 'Bad Request', 400
+
+    try:
+        coords = (float(body_json['latitude']), float(body_json['longitude'])) if 'latitude' in body_json else None
+    except (KeyError, TypeError, ValueError):
+        return 'Bad Request', 400
+    address = body_json.get('address')
+    if coords is None and not address:
+        return 'Bad Request', 400
+
+    quote_engine = request.app.ctx.quote_engine
+    user_location = quote_engine.locate(address=address, coords=coords)
+    if user_location is None:
+        return json.dumps({'error': texts.geopos_not_found}, ensure_ascii=False), 404, JSON_CONTENT_TYPE
+
+    quote = quote_engine.quote(user_location, payment_type=payment_type)
+    request.app.ctx.logger.debug(f"Quoted {user_location.address} for {request.remote}")
+    return json.dumps(asdict(quote), ensure_ascii=False), 200, JSON_CONTENT_TYPE
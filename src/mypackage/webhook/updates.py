@@ -0,0 +1,134 @@
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from telebot import TeleBot
+from telebot.types import Update
+
+from ..bot.dispatcher import get_update_json_shard_key
+
+# The share of the queue filled from which the app isn't ready to take more updates
+READY_QUEUE_LOAD = 0.9
+
+
+class UpdateQueue:
+    """
+    Bounded queue of the webhook updates, processed by the worker threads after the request is answered.
+
+    The webhook only decodes the update and puts it here, so Telegram gets its 200 at once however slow
+    the handlers are, and doesn't deliver the update again. Once the queue is full the updates are refused,
+    Telegram keeps them and retries later, which holds the load back instead of piling it up in memory.
+    The queue is split into a shard per worker by chat id, as ShardedTeleBot does, so the updates of a chat
+    are parsed and processed one by one, in the order they came, while the chats are processed in parallel.
+    The handlers run on the worker of the shard, an update is counted as processed once they have returned.
+    """
+
+    def __init__(self, bot: TeleBot, maxsize: int = 1000, workers: int = 4, logger: Optional[logging.Logger] = None):
+        if getattr(bot, 'threaded', False):
+            # the handlers run on the shard workers, the TeleBot thread pool would lose the order of the updates
+            # and drain the shards into its unbounded queue
+            bot.threaded = False
+            bot.worker_pool.close()
+        self.bot = bot
+        self.logger = logger or logging.getLogger(__name__)
+        self.maxsize = maxsize
+        # the room is split evenly, so a chat flooding its shard doesn't take the room of the others
+        shard_size = max(1, -(-maxsize // workers))
+        self._shards: List[queue.Queue] = [queue.Queue(maxsize=shard_size) for _ in range(workers)]
+        self._workers: List[threading.Thread] = [
+            threading.Thread(target=self._run, args=(shard,), name=f"webhook_updates_{i}", daemon=True)
+            for i, shard in enumerate(self._shards)]
+
+        self.accepted_count = 0
+        self.rejected_count = 0
+        self.processed_count = 0
+        self.failed_count = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def start(self):
+        for worker in self._workers:
+            worker.start()
+
+    def put(self, update_json: dict) -> bool:
+        """
+        Queues the decoded update on the shard of its chat without waiting.
+
+        Returns:
+            bool: False if the shard is full, thus the update has to be refused.
+        """
+        shard = self._shards[get_update_json_shard_key(update_json) % len(self._shards)]
+        try:
+            shard.put_nowait((time.monotonic(), update_json))
+        except queue.Full:
+            with self._lock:
+                self.rejected_count += 1
+            return False
+        with self._lock:
+            self.accepted_count += 1
+            self.max_depth = max(self.max_depth, self.depth)
+        return True
+
+    def _run(self, shard: queue.Queue):
+        while True:
+            item = shard.get()
+            if item is None:
+                break
+            enqueued_at, update_json = item
+            wait = time.monotonic() - enqueued_at
+            update_id = update_json.get('update_id') if isinstance(update_json, dict) else None
+            try:
+                self.bot.process_new_updates([Update.de_json(update_json)])
+            except Exception as e:
+                self.logger.error(f"Exception while processing update {update_id}: {e}")
+                with self._lock:
+                    self.failed_count += 1
+            with self._lock:
+                self.processed_count += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+    @property
+    def depth(self) -> int:
+        return sum(shard.qsize() for shard in self._shards)
+
+    @property
+    def alive(self) -> bool:
+        return all(worker.is_alive() for worker in self._workers)
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether the workers are running and the queue has room for the updates to come.
+        """
+        return self.alive and all(shard.qsize() < shard.maxsize * READY_QUEUE_LOAD for shard in self._shards)
+
+    def get_metrics(self) -> Dict[str, object]:
+        """
+        Returns the depth of the queue, the update counters and the time the updates waited in the queue.
+        """
+        return {
+            'queue_depth': self.depth,
+            'max_queue_depth': self.max_depth,
+            'queue_size': self.maxsize,
+            'shard_depths': [shard.qsize() for shard in self._shards],
+            'accepted': self.accepted_count,
+            'rejected': self.rejected_count,
+            'processed': self.processed_count,
+            'failed': self.failed_count,
+            'average_wait': self.total_wait / self.processed_count if self.processed_count else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        Lets the workers process the already queued updates and stops them.
+        """
+        for shard in self._shards:
+            shard.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
@@ -0,0 +1,17 @@
+import pytest
+
+
+@pytest.fixture
+def fake_redis():
+    """
+    In-process Redis stand-in running the Lua scripts, requires fakeredis[lua].
+    """
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+
+    server = fakeredis.FakeServer()
+    redis = fakeredis.FakeRedis(server=server)
+    redis.server = server
+    yield redis
+    server.connected = True
+    redis.flushall()
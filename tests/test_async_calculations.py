@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from telebot.types import Update
+
+from src.mypackage.bot import texts
+from src.mypackage.bot.aio.bridge import SyncBotBridge
+from src.mypackage.bot.callback_router import CallbackRouter
+from src.mypackage.bot.filters import add_custom_filters
+from src.mypackage.bot.handlers import async_calculations
+from src.mypackage.bot.middlewares.extra_arguments import AsyncExtraArgumentsMiddleware
+from src.mypackage.bot.middlewares.response import AsyncResponseMiddleware
+from src.mypackage.bot.pricing import QuoteEngine, AsyncQuoteEngine
+from src.mypackage.bot.sessions import MemoryOrderSessionStore, AsyncMemoryOrderSessionStore
+from src.mypackage.bot.texts import main_menu
+from src.mypackage.config.models import ButtonsConfig
+from src.mypackage.db.dto import (NewUserDTO, ProducerDTO, DispatchPointDTO, DistanceDTO, UserLocationDTO,
+                                  ConcreteDTO, ConcreteTypeDTO, ConcreteDataDTO)
+from src.mypackage.db.models import Base
+from src.mypackage.db.operations import user, producer
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+
+logger = logging.getLogger(__name__)
+
+USER = {"id": 1, "is_bot": False, "first_name": "Андрій"}
+CHAT = {"id": 1, "type": "private"}
+DISPATCH_POINT = DispatchPointDTO("Бориспіль", 50.35, 30.95)
+
+
+class FakeGoogleSheetAPI:
+    def __init__(self):
+        self.producers = [ProducerDTO("Виробник 1", 1, [DISPATCH_POINT])]
+        self.concrete_data = ConcreteDataDTO([ConcreteTypeDTO("P3 Бетон", [ConcreteDTO("C20/25", "P3", 300000)])])
+
+    def subscribe(self, listener):
+        pass
+
+    def get_delivery_price_list(self, concrete_type):
+        return ["100"] * 52
+
+
+class FakeGoogleMapsAPI:
+    async def from_address(self, address, debug=False):
+        return UserLocationDTO("вулиця Хрещатик, 1, Київ", 50.45, 30.52)
+
+    async def get_closest_point(self, dp_list, coords, is_cancelled=None):
+        return DISPATCH_POINT, DistanceDTO(distance_metres=30000, duration_seconds=1800)
+
+
+class RecordingOrderNotifier:
+    def __init__(self):
+        self.notifications = []
+
+    def notify(self, text, parse_mode="HTML"):
+        self.notifications.append(text)
+
+
+class RecordingOrderWriter:
+    def __init__(self):
+        self.orders = []
+
+    def add(self, order_dto):
+        self.orders.append(order_dto)
+
+
+def message_update(update_id: int, text: str) -> Update:
+    return Update.de_json({"update_id": update_id,
+                           "message": {"message_id": update_id, "date": 1, "chat": CHAT, "from": USER, "text": text}})
+
+
+def callback_update(update_id: int, data: str, text: str = "") -> Update:
+    return Update.de_json({"update_id": update_id,
+                           "callback_query": {"id": str(update_id), "from": USER, "chat_instance": "1", "data": data,
+                                              "message": {"message_id": update_id, "date": 1, "chat": CHAT,
+                                                          "text": text}}})
+
+
+async def run_flow(updates, order_notifier, order_writer):
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from telebot.async_telebot import AsyncTeleBot
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    session_maker = async_sessionmaker(bind=engine)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    async with session_maker() as session:
+        await session.run_sync(producer.add, "Виробник 1")
+        await session.run_sync(user.add, NewUserDTO("Андрій", tg_user_id=1, tg_chat_id=1, is_admin=False))
+
+    bot = AsyncTeleBot("1:TEST")
+    sent = []
+
+    async def record(method, *args, **kwargs):
+        sent.append((method, kwargs.get('text')))
+
+    for method in ('send_message', 'edit_message_text', 'edit_message_reply_markup'):
+        setattr(bot, method, lambda *args, method=method, **kwargs: record(method, *args, **kwargs))
+
+    bridge = SyncBotBridge(bot, ThreadPoolExecutor(max_workers=1))
+    add_custom_filters(bridge, owner_tg_id=0, admins=[])
+    callback_router = CallbackRouter()
+    async_calculations.register_handlers(bot, callback_router)
+    callback_router.install_async(bot)
+
+    google_sheet_api = FakeGoogleSheetAPI()
+    quote_engine = QuoteEngine(google_sheet_api, None)
+    bot.setup_middleware(AsyncExtraArgumentsMiddleware(
+        session_maker, logger, order_writer, google_sheet_api, FakeGoogleMapsAPI(),
+        AsyncQuoteEngine(quote_engine, FakeGoogleMapsAPI()),
+        AsyncMemoryOrderSessionStore(MemoryOrderSessionStore()), order_notifier, None,
+        ButtonsConfig(help="Допомога"), logger, 10))
+    bot.setup_middleware(AsyncResponseMiddleware(bot, logger))
+    try:
+        for update in updates:
+            # one by one, as the user answers each step after the previous reply
+            await bot.process_new_updates([update])
+    finally:
+        quote_engine.shutdown()
+        bridge.executor.shutdown()
+        await engine.dispose()
+    return sent
+
+
+def test_order_is_placed_through_the_async_handlers():
+    order_notifier, order_writer = RecordingOrderNotifier(), RecordingOrderWriter()
+    updates = [
+        message_update(1, main_menu.make_calculation_button),
+        message_update(2, "Хрещатик 1"),
+        callback_update(3, "geo_Так", text=texts.is_user_location),
+        callback_update(4, "producer_1"),
+        callback_update(5, "type_P3 Бетон"),
+        callback_update(6, "concrete_C20/25"),
+        message_update(7, "5"),
+        callback_update(8, "order_Замовити"),
+        callback_update(9, "order_Підтвердити"),
+    ]
+    sent = asyncio.run(run_flow(updates, order_notifier, order_writer))
+
+    assert len(order_writer.orders) == 1
+    order_dto = order_writer.orders[0]
+    assert (order_dto.producer, order_dto.concrete.title, order_dto.amount) == ("Виробник 1", "C20/25", 5)
+    assert order_dto.user_location.address == "вулиця Хрещатик, 1, Київ (Хрещатик 1)"
+    assert order_dto.concrete_cost == 1500000
+    assert len(order_notifier.notifications) == 1
+    assert sent[-1] == ('send_message', texts.order_confirmed)
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+import pytest
+
+from src.mypackage.db import AsyncDBAdapter
+from src.mypackage.db.dto import NewUserDTO
+from src.mypackage.db.models import Base
+from src.mypackage.db.operations import user, producer
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("greenlet")
+
+logger = logging.getLogger(__name__)
+
+
+async def run_with_adapter(check):
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    session_maker = async_sessionmaker(bind=engine)
+    try:
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        async with session_maker() as session:
+            await session.run_sync(producer.add, "Виробник 1")
+            await session.run_sync(producer.add, "Виробник 2")
+            await session.run_sync(user.add, NewUserDTO("Андрій", tg_user_id=1, tg_chat_id=1, is_admin=True))
+        async with session_maker() as session:
+            return await check(AsyncDBAdapter(session, logger))
+    finally:
+        await engine.dispose()
+
+
+def test_returns_dtos():
+    async def check(db_adapter: AsyncDBAdapter):
+        return (await db_adapter.get_user_with_discounts(1), await db_adapter.get_all_producers(),
+                await db_adapter.get_producer_by_id(2))
+
+    user_dto, producer_dtos, producer_dto = asyncio.run(run_with_adapter(check))
+
+    # the relationships are loaded within the operation, so the DTOs are complete outside of the session
+    assert user_dto.first_name == "Андрій" and user_dto.is_admin
+    assert user_dto.discounts == []
+    assert [dto.title for dto in producer_dtos] == ["Виробник 1", "Виробник 2"]
+    assert producer_dto.title == "Виробник 2"
+
+
+def test_missing_rows_are_none():
+    async def check(db_adapter: AsyncDBAdapter):
+        return await db_adapter.get_user(2), await db_adapter.get_producer_by_id(3)
+
+    assert asyncio.run(run_with_adapter(check)) == (None, None)
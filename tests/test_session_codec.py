@@ -0,0 +1,142 @@
+import struct
+from datetime import datetime
+
+import pytest
+
+from src.mypackage.bot import texts
+from src.mypackage.bot.sessions.codec import SessionCodec, USER_SCHEMA, SCHEMA_VERSION
+from src.mypackage.db.dto import (OrderDTO, UserDTO, UserDiscountDTO, ProducerDTO, DispatchPointDTO,
+                                  UserLocationDTO, DistanceDTO, ConcreteDTO)
+
+
+def make_user(discounts: int = 2) -> UserDTO:
+    return UserDTO(
+        first_name="Андрій",
+        tg_user_id=123456789,
+        tg_chat_id=123456789,
+        is_admin=True,
+        last_name="Гермак",
+        tg_username="andrii",
+        id=42,
+        phone="+380501234567",
+        discounts=[
+            UserDiscountDTO(
+                id=i, user_id=42, producer_id=i,
+                concrete_discount=5 + i, delivery_discount=10,
+                concrete_discount_vat=3, delivery_discount_vat=None,
+                producer=ProducerDTO(f"Виробник {i}", id=i, dispatch_points=[
+                    DispatchPointDTO(f"вул. Бетонна, {i}", 50.45 + i / 100, 30.52),
+                ]),
+            )
+            for i in range(discounts)
+        ],
+        dispatch_point=DispatchPointDTO("вул. Хрещатик, 1", 50.4470, 30.5220),
+        dispatch_point_id=7,
+        register_time=datetime(2024, 5, 17, 12, 30, 15),
+    )
+
+
+def make_order(user: UserDTO) -> OrderDTO:
+    return OrderDTO(
+        user=user,
+        payment_type=texts.cashless_payment,
+        producer="Виробник 1",
+        dispatch_point=DispatchPointDTO("вул. Бетонна, 1", 50.46, 30.52),
+        user_location=UserLocationDTO("вул. Хрещатик, 22", 50.4501, 30.5234),
+        distance=DistanceDTO(12345, 1260),
+        concrete=ConcreteDTO("C20/25 П3", "P3", 265050, "Виробник 1"),
+        amount=12,
+        delivery_cost=360000,
+        concrete_cost=3180600,
+        delivery_price=30000,
+    )
+
+
+@pytest.mark.parametrize("compression", [False, True])
+def test_order_round_trip(compression):
+    codec = SessionCodec(compression=compression)
+    order = make_order(make_user())
+
+    decoded = codec.decode_order(codec.encode_order(order))
+
+    assert decoded == order
+    assert decoded.user.discounts[1].producer.dispatch_points == order.user.discounts[1].producer.dispatch_points
+    assert decoded.concrete_discount == order.concrete_discount
+    assert decoded.delivery_discount == order.delivery_discount
+    assert decoded.total_cost == order.total_cost
+
+
+@pytest.mark.parametrize("compression", [False, True])
+def test_order_round_trip_with_none_fields(compression):
+    codec = SessionCodec(compression=compression)
+    # an order right after the calculation started, the user has neither the discounts nor the optional fields
+    order = OrderDTO(user=UserDTO(first_name="Andrii", tg_user_id=1, tg_chat_id=1))
+
+    decoded = codec.decode_order(codec.encode_order(order))
+
+    assert decoded == order
+    assert decoded.user.discounts is None
+    assert decoded.user.register_time is None
+    assert decoded.dispatch_point is None and decoded.amount is None
+
+
+def test_user_discounts_round_trip():
+    user = make_user(discounts=3)
+    user.discounts[2].producer = None
+    user.discounts[1].producer.dispatch_points = []
+    out = []
+    USER_SCHEMA.encode(user, out)
+    payload = b"".join(out)
+
+    decoded, offset = USER_SCHEMA.decode(payload, 0)
+
+    assert offset == len(payload)
+    assert decoded == user
+    assert decoded.discounts[2].producer is None
+    assert decoded.discounts[1].producer.dispatch_points == []
+    assert decoded.discounts[2].delivery_discount_vat is None
+    assert decoded.get_producer_discounts("Виробник 1").get_concrete_discount(texts.cash_payment) == 6
+
+
+def test_closest_dispatch_points_round_trip():
+    codec = SessionCodec()
+    closest_dispatch_points = {
+        "Виробник 0": (DispatchPointDTO("вул. Бетонна, 0", 50.45, 30.52), DistanceDTO(1000, 60)),
+        "Виробник 1": (DispatchPointDTO("вул. Бетонна, 1", 50.46, 30.52), DistanceDTO(2000, 120)),
+    }
+
+    payload = codec.encode_closest_dispatch_points(closest_dispatch_points)
+
+    assert codec.decode_closest_dispatch_points(payload) == closest_dispatch_points
+
+
+def test_compression_applies_above_threshold_only():
+    order = make_order(make_user(discounts=20))
+    plain = SessionCodec().encode_order(order)
+    compressed = SessionCodec(compression=True).encode_order(order)
+    small = SessionCodec(compression=True, compression_threshold=len(plain)).encode_order(
+        make_order(make_user(discounts=0)))
+
+    assert plain[1] == 0
+    assert compressed[1] == 1
+    assert len(compressed) < len(plain)
+    assert small[1] == 0
+    # the flags tell how to read the payload, whatever the codec reading it is configured with
+    assert SessionCodec().decode_order(compressed) == order
+    assert SessionCodec(compression=True).decode_order(plain) == order
+
+
+def test_unknown_version_is_rejected():
+    payload = SessionCodec().encode_order(make_order(make_user()))
+    newer = struct.pack("!B", SCHEMA_VERSION + 1) + payload[1:]
+
+    with pytest.raises(ValueError, match="version"):
+        SessionCodec().decode_order(newer)
+
+
+def test_unknown_flags_are_rejected():
+    payload = SessionCodec().encode_order(make_order(make_user()))
+    flagged = payload[:1] + struct.pack("!B", 0b10) + payload[2:]
+
+    with pytest.raises(ValueError, match="flags"):
+        SessionCodec().decode_order(flagged)
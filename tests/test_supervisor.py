@@ -0,0 +1,42 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+from telebot import TeleBot
+
+from src.mypackage.bot.supervisor import _run_worker
+
+
+def test_worker_counts_an_update_once_handled():
+    processed = multiprocessing.Value('Q', 0)
+    handled = []
+
+    def bot_factory():
+        # a real threaded TeleBot, as the default bot is
+        bot = TeleBot("1:TEST", threaded=True)
+
+        def handler(message):
+            if message.text == 'first':
+                # long enough for the second update to overtake the first one if it is handled in parallel
+                time.sleep(0.3)
+            handled.append((message.text, processed.value))
+
+        bot.register_message_handler(handler)
+        return bot, logging.getLogger(__name__)
+
+    updates = queue.Queue()
+    for update_id, text in enumerate(('first', 'second'), 1):
+        updates.put({'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': text,
+                                                         'chat': {'id': 1, 'type': 'private'}}})
+    updates.put(None)
+    worker = threading.Thread(target=_run_worker, args=(0, updates, multiprocessing.Value('Q', 0), processed,
+                                                        threading.Event(), bot_factory, ()))
+    worker.start()
+    worker.join(5)
+
+    # the updates of the chat are handled in order, each one counted once its handler has returned
+    assert handled == [('first', 0), ('second', 1)]
+    assert processed.value == 2
+
@@ -0,0 +1,63 @@
+import time
+
+from src.mypackage.bot.middlewares.token_bucket import RedisTokenBucket, ALLOWED, USER_LIMITED, GLOBAL_LIMITED
+
+# slow enough for no token to come back while a test runs
+NO_REFILL = 0.001
+
+
+def test_user_burst_then_limited(fake_redis):
+    bucket = RedisTokenBucket(fake_redis, user_rate=NO_REFILL, user_burst=3, global_rate=NO_REFILL, global_burst=100)
+
+    results = [bucket.acquire('message', 1) for _ in range(4)]
+
+    assert results == [ALLOWED, ALLOWED, ALLOWED, USER_LIMITED]
+    # the buckets are per user and per scope
+    assert bucket.acquire('message', 2) == ALLOWED
+    assert bucket.acquire('callback_query', 1) == ALLOWED
+
+
+def test_global_limit_across_users(fake_redis):
+    bucket = RedisTokenBucket(fake_redis, user_rate=NO_REFILL, user_burst=10, global_rate=NO_REFILL, global_burst=3)
+
+    results = [bucket.acquire('message', user_id) for user_id in range(5)]
+
+    assert results == [ALLOWED, ALLOWED, ALLOWED, GLOBAL_LIMITED, GLOBAL_LIMITED]
+    # a rejection takes no token from the user bucket either
+    assert fake_redis.exists(f"{bucket.prefix}message_3") == 0
+
+
+def test_user_rejection_keeps_global_tokens(fake_redis):
+    bucket = RedisTokenBucket(fake_redis, user_rate=NO_REFILL, user_burst=1, global_rate=NO_REFILL, global_burst=2)
+
+    assert bucket.acquire('message', 1) == ALLOWED
+    assert bucket.acquire('message', 1) == USER_LIMITED
+    assert bucket.acquire('message', 1) == USER_LIMITED
+    assert bucket.acquire('message', 2) == ALLOWED
+    assert bucket.acquire('message', 3) == GLOBAL_LIMITED
+
+
+def test_tokens_refill_with_time(fake_redis):
+    bucket = RedisTokenBucket(fake_redis, user_rate=20.0, user_burst=1, global_rate=1000.0, global_burst=100)
+
+    assert bucket.acquire('message', 1) == ALLOWED
+    assert bucket.acquire('message', 1) == USER_LIMITED
+    time.sleep(0.1)
+    assert bucket.acquire('message', 1) == ALLOWED
+
+
+def test_buckets_expire_once_full_again(fake_redis):
+    bucket = RedisTokenBucket(fake_redis, user_rate=2.0, user_burst=5, global_rate=100.0, global_burst=200)
+
+    bucket.acquire('message', 1)
+
+    # one token taken comes back in half a second, then the bucket is full and isn't kept
+    assert 0 < fake_redis.pttl(f"{bucket.prefix}message_1") <= 500
+    assert 0 < fake_redis.pttl(bucket.global_key) <= 10
+
+
+def test_unavailable_redis_falls_back(fake_redis):
+    bucket = RedisTokenBucket(fake_redis)
+    fake_redis.server.connected = False
+
+    assert bucket.acquire('message', 1) is None
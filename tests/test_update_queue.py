@@ -0,0 +1,55 @@
+import threading
+import time
+
+from telebot import TeleBot
+
+from src.mypackage.webhook.updates import UpdateQueue
+
+
+def make_bot(handled: list) -> TeleBot:
+    # a real threaded TeleBot, as the default bot is, so the test fails if its thread pool runs the handlers
+    bot = TeleBot("1:TEST", threaded=True)
+    lock = threading.Lock()
+
+    def handler(message):
+        if message.text == 'first':
+            # long enough for the second update to overtake the first one if it is handled in parallel
+            time.sleep(0.3)
+        with lock:
+            handled.append((message.chat.id, message.text))
+
+    bot.register_message_handler(handler)
+    return bot
+
+
+def make_update(update_id: int, chat_id: int, text: str = '.') -> dict:
+    return {'update_id': update_id,
+            'message': {'message_id': update_id, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, 'text': text}}
+
+
+def test_updates_of_a_chat_keep_their_order():
+    handled = []
+    update_queue = UpdateQueue(make_bot(handled), maxsize=400, workers=4)
+    update_queue.start()
+
+    assert update_queue.put(make_update(1, 0, 'first'))
+    assert update_queue.put(make_update(2, 0, 'second'))
+    for update_id in range(3, 23):
+        assert update_queue.put(make_update(update_id, update_id % 5 + 1))
+    update_queue.stop()
+
+    assert [text for chat_id, text in handled if chat_id == 0] == ['first', 'second']
+    assert len(handled) == 22
+    # counted once the handlers have returned, not once passed to the bot
+    assert update_queue.get_metrics()['processed'] == 22
+
+
+def test_full_shard_refuses_only_its_chats():
+    update_queue = UpdateQueue(make_bot([]), maxsize=4, workers=2)
+
+    # not started, so the shard of the chat 0 fills up
+    assert update_queue.put(make_update(1, 0))
+    assert update_queue.put(make_update(2, 0))
+    assert not update_queue.put(make_update(3, 0))
+    assert update_queue.put(make_update(4, 1))
+    assert update_queue.get_metrics()['rejected'] == 1